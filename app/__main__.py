@@ -5,23 +5,230 @@ Entry point for running ISweep backend.
 Usage:
     python -m app
     python -m app --host 0.0.0.0 --port 8001 --reload
+    python -m app export-preferences -o prefs.ndjson
+    python -m app import-preferences prefs.ndjson [--skip N | --checkpoint FILE]
+    python -m app tune-asr corpus/ [--sizes tiny,base,small --threads 2,4 ...]
+    python -m app transcribe media/ -o transcripts/ [--processes N]
 """
 
 import argparse
+import os
+import sys
+import time
+
 import uvicorn
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv=None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Run the ISweep backend.")
     parser.add_argument("--host", default="127.0.0.1", help="Host to bind (default: 127.0.0.1)")
     parser.add_argument("--port", type=int, default=8001, help="Port to bind (default: 8001)")
     parser.add_argument("--reload", action="store_true", help="Enable auto-reload on code changes")
-    return parser.parse_args()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("ISWEEP_WORKERS", "1")),
+        help="Worker processes (default: ISWEEP_WORKERS or 1)",
+    )
+    commands = parser.add_subparsers(dest="command")
 
+    export = commands.add_parser("export-preferences", help="Write all stored preferences as NDJSON")
+    export.add_argument("-o", "--output", default="-", help="Output file (default: stdout)")
+    export.add_argument("--batch-size", type=int, default=1000, help="Rows per database page (default: 1000)")
 
-if __name__ == "__main__":
-    args = parse_args()
+    imp = commands.add_parser("import-preferences", help="Upsert preferences from an NDJSON file")
+    imp.add_argument("input", help="NDJSON file, or - for stdin")
+    imp.add_argument("--batch-size", type=int, default=1000, help="Rows per transaction (default: 1000)")
+    imp.add_argument("--skip", type=int, default=0, help="Skip this many input lines (resume)")
+    imp.add_argument(
+        "--checkpoint",
+        help="File that records committed lines after each batch; an existing one resumes from it",
+    )
+
+    tune = commands.add_parser("tune-asr", help="Benchmark ASR settings on an audio corpus and write a recommended config")
+    tune.add_argument("corpus", help="Directory of audio/media files")
+    tune.add_argument("--sizes", default="tiny,base,small", help="Model sizes (default: tiny,base,small)")
+    tune.add_argument("--compute-types", default="int8", help="Compute types (default: int8)")
+    tune.add_argument("--threads", default="1,2,4", help="CPU threads per process (default: 1,2,4)")
+    tune.add_argument("--beams", default="1,5", help="Beam sizes (default: 1,5)")
+    tune.add_argument("--processes", default="1,2", help="Process counts (default: 1,2)")
+    tune.add_argument("--chunk-seconds", type=float, default=5.0, help="Chunk length, as sent to /asr/stream (default: 5)")
+    tune.add_argument("--max-p95", type=float, help="Latency budget per chunk in seconds (default: chunk length)")
+    tune.add_argument("--max-audio", type=float, default=300.0, help="Seconds of corpus audio to use (default: 300)")
+    tune.add_argument("-o", "--output", default=None, help="Config file to write (default: ISWEEP_ASR_CONFIG or asr_tuned.json)")
+
+    batch = commands.add_parser("transcribe", help="Transcribe a media directory to WebVTT and the transcript store")
+    batch.add_argument("media_dir", help="Directory of audio/media files")
+    batch.add_argument("-o", "--output", default="transcripts", help="WebVTT and manifest directory (default: transcripts)")
+    batch.add_argument(
+        "--processes",
+        type=int,
+        default=int(os.getenv("ISWEEP_WORKERS", "1")),
+        help="Worker processes, one model each (default: ISWEEP_WORKERS or 1)",
+    )
+    batch.add_argument("--beam-size", type=int, default=5, help="Beam size (default: 5)")
+    batch.add_argument("--language", help="Force the language instead of detecting it per file")
+    return parser.parse_args(argv)
+
+
+def _csv(value: str, cast=str) -> list:
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def _progress_printer(verb: str):
+    last = [0.0]
+
+    def report(progress) -> None:
+        now = time.monotonic()
+        if now - last[0] < 1.0:
+            return
+        last[0] = now
+        print(f"{verb} {progress.rows} rows ({progress.rows_per_second:,.0f} rows/s)", file=sys.stderr)
 
+    return report
+
+
+def export_preferences(args: argparse.Namespace) -> None:
+    from app import pref_transfer
+    from app.database import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    progress = pref_transfer.TransferProgress()
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for line in pref_transfer.export_preferences(
+            db, batch_size=args.batch_size, progress=progress, on_batch=_progress_printer("exported")
+        ):
+            out.write(line)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+        db.close()
+    print(f"exported {progress.rows} rows in {progress.elapsed:.1f}s ({progress.rows_per_second:,.0f} rows/s)", file=sys.stderr)
+
+
+def import_preferences(args: argparse.Namespace) -> None:
+    from app import pref_transfer
+    from app.database import SessionLocal, init_db
+
+    skip = args.skip
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        with open(args.checkpoint) as f:
+            skip = int(f.read().strip() or 0)
+        print(f"resuming after line {skip}", file=sys.stderr)
+
+    printer = _progress_printer("imported")
+
+    def on_batch(progress) -> None:
+        if args.checkpoint:
+            tmp = f"{args.checkpoint}.tmp"
+            with open(tmp, "w") as f:
+                f.write(str(progress.committed_lines))
+            os.replace(tmp, args.checkpoint)
+        printer(progress)
+
+    init_db()
+    db = SessionLocal()
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    try:
+        importer = pref_transfer.PreferenceImporter(db, batch_size=args.batch_size, skip=skip, on_batch=on_batch)
+        progress = importer.feed_all(source)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        db.close()
+    print(
+        f"imported {progress.rows} rows for {progress.users} users in {progress.elapsed:.1f}s "
+        f"({progress.rows_per_second:,.0f} rows/s); {progress.errors} invalid lines; "
+        f"committed through line {progress.committed_lines}",
+        file=sys.stderr,
+    )
+    for error in progress.error_lines:
+        print(f"  line {error['line']}: {error['error']}", file=sys.stderr)
+    if progress.errors:
+        sys.exit(1)
+
+
+def tune_asr(args: argparse.Namespace) -> None:
+    from app import asr_tuning
+    from app.asr_service import WHISPER_DEVICE
+
+    files = asr_tuning.corpus_files(args.corpus)
+    if not files:
+        sys.exit(f"No audio files found in {args.corpus}")
+    try:
+        chunks = asr_tuning.load_chunks(files, args.chunk_seconds, args.max_audio)
+    except ImportError:
+        sys.exit("tune-asr needs faster-whisper: pip install faster-whisper")
+    if not chunks:
+        sys.exit("Corpus has no usable audio")
+
+    grid = asr_tuning.build_grid(
+        _csv(args.sizes), _csv(args.compute_types), _csv(args.threads, int), _csv(args.beams, int),
+        _csv(args.processes, int),
+    )
+    max_p95 = args.max_p95 if args.max_p95 is not None else args.chunk_seconds
+    audio = sum(len(c) for c in chunks) / asr_tuning.SAMPLE_RATE
+    print(f"{len(chunks)} chunks, {audio:.0f}s of audio; {len(grid)} settings", file=sys.stderr)
+
+    def report(result) -> None:
+        s = result.setting
+        print(
+            f"{s.tier:<18} threads={s.cpu_threads:<2} procs={s.processes:<2} "
+            f"rtf={result.rtf:.3f} throughput={result.throughput:.1f}x p95={result.p95:.2f}s",
+            file=sys.stderr,
+        )
+
+    results = asr_tuning.run(grid, chunks, WHISPER_DEVICE, on_result=report)
+    best = asr_tuning.recommend(results, max_p95)
+    if best is None:
+        sys.exit("Every setting failed; see the log")
+    path = args.output or os.getenv("ISWEEP_ASR_CONFIG", asr_tuning.DEFAULT_CONFIG_PATH)
+    config = asr_tuning.write_config(path, results, best, max_p95)
+    if best.p95 > max_p95:
+        print(f"warning: no setting keeps p95 under {max_p95}s; recommending the fastest", file=sys.stderr)
+    print(f"wrote {path}:", file=sys.stderr)
+    for name, value in config["env"].items():
+        print(f"  {name}={value}", file=sys.stderr)
+
+
+def transcribe(args: argparse.Namespace) -> None:
+    from app import audio_stream, batch_transcribe
+    from app.database import SessionLocal, init_db
+
+    if not audio_stream.available():
+        sys.exit("transcribe needs numpy and PyAV (installed with faster-whisper)")
+
+    def report(progress, result) -> None:
+        status = f"failed: {result['error']}" if "error" in result else f"{result['audio_seconds'] / 60:.1f} min"
+        done = progress.files + progress.failed + progress.skipped
+        print(
+            f"[{done}/{progress.total}] {result['media_id']} ({status}); "
+            f"{progress.audio_hours_per_hour:.1f} audio-h/h",
+            file=sys.stderr,
+        )
+
+    init_db()
+    db = SessionLocal()
+    try:
+        progress = batch_transcribe.transcribe_directory(
+            args.media_dir, args.output, db, processes=args.processes, beam_size=args.beam_size,
+            language=args.language, on_file=report,
+        )
+    finally:
+        db.close()
+    print(
+        f"transcribed {progress.files} files ({progress.audio_seconds / 3600:.2f} audio-hours) in "
+        f"{progress.elapsed / 60:.1f} min: {progress.audio_hours_per_hour:.1f} audio-hours per wall-hour; "
+        f"{progress.skipped} already done, {progress.failed} failed",
+        file=sys.stderr,
+    )
+    if progress.failed:
+        sys.exit(1)
+
+
+def serve(args: argparse.Namespace) -> None:
     try:
         import app.main  # noqa: F401
     except Exception as exc:
@@ -41,4 +248,22 @@ if __name__ == "__main__":
         host=args.host,
         port=args.port,
         reload=args.reload,
+        workers=None if args.reload else args.workers,
     )
+
+
+COMMANDS = {
+    "export-preferences": export_preferences,
+    "import-preferences": import_preferences,
+    "tune-asr": tune_asr,
+    "transcribe": transcribe,
+}
+
+
+if __name__ == "__main__":
+    # A tuned config (python -m app tune-asr) supplies defaults such as ISWEEP_WORKERS.
+    from app.asr_tuning import load_tuned_config
+
+    load_tuned_config()
+    args = parse_args()
+    COMMANDS.get(args.command, serve)(args)
@@ -6,105 +6,82 @@ INSTALLATION NOTES:
   faster-whisper is recommended for production:
   $ pip install faster-whisper
 
-  Alternative (lighter weight but lower quality):
+  Alternative (lighter weight but lower quality, streaming on CPU):
   $ pip install vosk
+  and set ISWEEP_ASR_ENGINE=vosk (or send "engine": "vosk" per chunk)
 
 This module handles:
   1. Audio chunk buffering per (user_id, tab_id)
-  2. Whisper-based transcription
+  2. Transcription through the selected engine (see app/asr_engines.py)
   3. Timed segment extraction and confidence scoring
 """
 
 import base64
 import io
-import threading
-from collections import defaultdict
-from typing import List, Optional, Tuple
-from datetime import datetime
+import logging
+import time
+from typing import TYPE_CHECKING, List, Optional, Union
 
+from . import asr_service
+from . import audio_stream
+from . import memory
+from .asr_engines import ASREngine, get_engine
+from .asr_sessions import SessionState, clear_session, get_session
+from .logging_config import SampledLogger
 from .models import TranscriptSegment
+from .session_store import AudioBuffer, InProcessSessionStore, SessionStore, create_session_store
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+chunk_log = SampledLogger(logger)
 
 
 # =========================================================
-# GLOBAL STATE: Rolling buffer per (user_id, tab_id)
+# GLOBAL STATE: Buffered chunks per (user_id, tab_id)
 # =========================================================
-class AudioBuffer:
-    """In-memory rolling buffer for audio chunks."""
-    
-    def __init__(self, max_chunks: int = 10):
-        """
-        Args:
-            max_chunks: Maximum chunks to keep in memory per session.
-                       Chunks are processed in batches of N chunks (e.g., 3-4),
-                       so keeping 10 allows ~3 ASR runs before oldest is pruned.
-        """
-        self.max_chunks = max_chunks
-        self.chunks: List[Tuple[int, bytes]] = []  # (seq, audio_bytes)
-        self.lock = threading.Lock()
-    
-    def add_chunk(self, seq: int, audio_bytes: bytes) -> None:
-        """Add a chunk to the buffer."""
-        with self.lock:
-            self.chunks.append((seq, audio_bytes))
-            # Prune if over limit
-            if len(self.chunks) > self.max_chunks:
-                self.chunks = self.chunks[-self.max_chunks:]
-    
-    def get_all_bytes(self) -> Optional[bytes]:
-        """Concatenate all chunks into single audio bytes (for Whisper)."""
-        with self.lock:
-            if not self.chunks:
-                return None
-            # Simple concatenation (works for most audio formats)
-            return b''.join(audio_bytes for _, audio_bytes in self.chunks)
-    
-    def get_and_clear(self) -> Optional[bytes]:
-        """Get all bytes and clear buffer."""
-        with self.lock:
-            if not self.chunks:
-                return None
-            audio_bytes = b''.join(audio_bytes for _, audio_bytes in self.chunks)
-            self.chunks = []
-            return audio_bytes
-    
-    def clear(self) -> None:
-        """Clear the buffer."""
-        with self.lock:
-            self.chunks = []
+# Backend chosen by ISWEEP_SESSION_STORE (see app/session_store.py). The
+# in-process default keeps its AudioBuffers in `_audio_buffers`.
+_store: SessionStore = create_session_store()
+_audio_buffers = _store.buffers if isinstance(_store, InProcessSessionStore) else {}
 
 
-# Global buffer store: {(user_id, tab_id): AudioBuffer}
-_audio_buffers = defaultdict(lambda: AudioBuffer(max_chunks=10))
-_buffer_lock = threading.Lock()
+def get_session_store() -> SessionStore:
+    """The session store used for buffered ASR."""
+    return _store
 
 
 def get_buffer(user_id: str, tab_id: int) -> AudioBuffer:
-    """Get or create buffer for (user_id, tab_id)."""
-    with _buffer_lock:
-        key = (user_id, tab_id)
-        if key not in _audio_buffers:
-            _audio_buffers[key] = AudioBuffer(max_chunks=10)
-        return _audio_buffers[key]
+    """Get or create the in-process buffer for (user_id, tab_id)."""
+    if not isinstance(_store, InProcessSessionStore):
+        raise RuntimeError("get_buffer() is only available with the in-process session store")
+    return _store.get_buffer((user_id, tab_id))
 
 
 def clear_session_buffer(user_id: str, tab_id: int) -> None:
-    """Clear buffer for a session (e.g., when tab closes)."""
-    with _buffer_lock:
-        key = (user_id, tab_id)
-        if key in _audio_buffers:
-            _audio_buffers[key].clear()
+    """Clear buffer and decoding state for a session (e.g., when tab closes)."""
+    _store.clear((user_id, tab_id))
+    clear_session(user_id, tab_id)
+    asr_service.dedup.forget((user_id, tab_id))  # a reopened stream restarts its seqs
+
+
+def _audio_buffers_memory() -> dict:
+    return _store.memory_report()
+
+
+memory.register_reporter("asr.audio_buffers", _audio_buffers_memory)
 
 
 # =========================================================
 # ASR ENGINE: FASTER-WHISPER
 # =========================================================
-_whisper_model = None
-_whisper_lock = threading.Lock()
-
-
 def load_whisper_model():
     """
-    Lazy-load faster-whisper model on first use.
+    Model for the current ASR quality tier (see app/asr_tiers.py).
+
+    Models are shared with asr_service, so the buffered and per-chunk paths
+    never hold two copies of the same model.
     
     INSTALLATION:
       pip install faster-whisper
@@ -116,75 +93,98 @@ def load_whisper_model():
       - medium (769M)
       - large (3.1B) - best quality but slowest
     """
-    global _whisper_model
-    
-    with _whisper_lock:
-        if _whisper_model is not None:
-            return _whisper_model
-        
-        try:
-            from faster_whisper import WhisperModel
-            
-            print("[ASR] Loading Whisper 'base' model (first load may take ~30s)...")
-            _whisper_model = WhisperModel("base", device="cpu", compute_type="int8")
-            print("[ASR] Whisper model loaded successfully")
-            return _whisper_model
-        except ImportError:
-            print("[ASR] ERROR: faster-whisper not installed. Install with:")
-            print("       pip install faster-whisper")
-            raise
-        except Exception as e:
-            print(f"[ASR] ERROR loading Whisper model: {e}")
-            raise
-
-
-def transcribe_audio_bytes(audio_bytes: bytes) -> Optional[List[TranscriptSegment]]:
+    tier = asr_service.tier_controller.current()
+    try:
+        return asr_service.get_model(tier.model_size, tier.compute_type)
+    except ImportError:
+        logger.error("faster-whisper not installed. Install with: pip install faster-whisper")
+        raise
+    except Exception:
+        logger.exception("Failed to load Whisper model")
+        raise
+
+
+def transcribe_audio_bytes(
+    audio_bytes: Union[bytes, "np.ndarray"],
+    session: Optional[SessionState] = None,
+    language: Optional[str] = None,
+    user_id: Optional[str] = None,
+    engine: Optional[str] = None,
+) -> Optional[List[TranscriptSegment]]:
     """
-    Transcribe audio bytes using faster-whisper.
+    Transcribe audio: encoded bytes (any container ffmpeg reads; Whisper
+    only) or 16 kHz mono float32 samples from an AudioStream.
+
+    With a session, its pinned language and transcript tail are used and
+    updated (see app/asr_sessions.py); `language` overrides the pin.
+    `user_id` places the work in that user's fair share of inference slots.
+    `engine` picks the ASR engine (default ISWEEP_ASR_ENGINE, see
+    app/asr_engines.py).
     
     Returns:
         List of TranscriptSegment or None if transcription fails.
     """
     try:
-        model = load_whisper_model()
+        recognizer_engine = get_engine(engine)
+        encoded = isinstance(audio_bytes, (bytes, bytearray))
+        if encoded and not recognizer_engine.decodes_files:
+            raise ValueError(f"the {recognizer_engine.name} engine needs decoded samples")
+        # Wrap bytes in BytesIO for Whisper (expects file-like object or samples)
+        audio_file = io.BytesIO(audio_bytes) if encoded else audio_bytes
         
-        # Wrap bytes in BytesIO for Whisper (expects file-like object)
-        audio_file = io.BytesIO(audio_bytes)
-        
-        print(f"[ASR] Transcribing {len(audio_bytes)} bytes...")
-        
-        # Transcribe with default language (auto-detect)
-        segments, info = model.transcribe(
-            audio_file,
-            language=None,  # Auto-detect
-            task="transcribe",
-            temperature=0.0,  # More deterministic
-            beam_size=5,
-            vad_filter=True,  # Voice Activity Detection (skip silence)
-        )
+        chunk_log.debug("Transcribing audio", extra={"size": len(audio_bytes), "engine": recognizer_engine.name})
+        session = session or SessionState()
+        options = session.options(language)
         
-        # Convert to TranscriptSegment objects
-        transcript_segments = []
-        for segment in segments:
-            ts = TranscriptSegment(
-                text=segment.text.strip(),
-                start_seconds=segment.start,
-                end_seconds=segment.end,
-                confidence=segment.confidence if hasattr(segment, 'confidence') else 0.9,
+        # No playback deadline here: runs after deadline-bound chunks (see app/asr_scheduler.py).
+        with asr_service.scheduler.slot(None, user_id) as ticket:
+            tier = asr_service.tier_controller.current() if recognizer_engine.tiered else None
+            recognizer = recognizer_engine.recognizer(
+                options,
+                tier,
+                task="transcribe",
+                temperature=0.0,  # More deterministic
             )
-            transcript_segments.append(ts)
-            print(f"[ASR]   [{ts.start_seconds:.2f}-{ts.end_seconds:.2f}] {ts.text}")
+            
+            # Pinned/overridden language, or auto-detect until one is pinned
+            started = time.perf_counter()
+            recognizer.feed_audio(audio_file)
+            result = recognizer.get_final()
+            inference = time.perf_counter() - started
         
+        transcript_segments = _to_segments(result.segments)
         if not transcript_segments:
-            print("[ASR] No speech detected in audio")
+            chunk_log.debug("No speech detected in audio")
+
+        if tier is not None:
+            asr_service.tier_controller.observe(tier, ticket.wait, inference, result.duration)
+        session.update(
+            options,
+            result.language,
+            result.language_probability,
+            " ".join(ts.text for ts in transcript_segments),
+        )
         
         return transcript_segments
     
-    except Exception as e:
-        print(f"[ASR] ERROR during transcription: {e}")
+    except Exception:
+        logger.exception("Transcription failed")
         return None
 
 
+def _to_segments(segments: List[dict]) -> List[TranscriptSegment]:
+    """TranscriptSegments from engine segment dicts (see app/asr_engines.py)."""
+    transcript_segments = []
+    for segment in segments:
+        ts = TranscriptSegment(**segment)
+        transcript_segments.append(ts)
+        chunk_log.debug(
+            "Segment transcribed",
+            extra={"start": round(ts.start_seconds, 2), "end": round(ts.end_seconds, 2), "text": ts.text},
+        )
+    return transcript_segments
+
+
 # =========================================================
 # MAIN HANDLER: Process audio chunk
 # =========================================================
@@ -196,7 +196,9 @@ def process_audio_chunk(
     tab_id: int,
     seq: int,
     audio_b64: str,
-    mime_type: str = "audio/webm;codecs=opus"
+    mime_type: str = "audio/webm;codecs=opus",
+    language: Optional[str] = None,
+    engine: Optional[str] = None,
 ) -> Optional[List[TranscriptSegment]]:
     """
     Process incoming audio chunk:
@@ -211,6 +213,8 @@ def process_audio_chunk(
         seq: Sequence number of chunk
         audio_b64: Base64-encoded audio data
         mime_type: Audio MIME type
+        language: Optional language override (see app/asr_sessions.py)
+        engine: Optional ASR engine (see app/asr_engines.py)
     
     Returns:
         List of TranscriptSegment if ASR was run, else None.
@@ -218,41 +222,127 @@ def process_audio_chunk(
     try:
         # Decode base64 to bytes
         audio_bytes = base64.b64decode(audio_b64)
-        print(f"[ASR] Chunk {seq}: decoded {len(audio_bytes)} bytes from base64")
+        chunk_log.debug("Chunk decoded", extra={"seq": seq, "bytes": len(audio_bytes)})
         
-        # Add to buffer
-        buffer = get_buffer(user_id, tab_id)
-        buffer.add_chunk(seq, audio_bytes)
+        if _streaming_supported(mime_type):
+            # One chunk at a time per session, from feeding the stream to consuming what was transcribed.
+            with get_session(user_id, tab_id).decode_lock:
+                return _process_streamed_chunk(user_id, tab_id, seq, audio_bytes, mime_type, language, engine)
         
-        # Check if we should run ASR (every N chunks)
-        with buffer.lock:
-            chunk_count = len(buffer.chunks)
+        # Add to the session store; the count is taken atomically with the add,
+        # so only one worker sees the batch boundary.
+        key = (user_id, tab_id)
+        chunk_count = _store.add_chunk(key, seq, audio_bytes)
         
+        # Check if we should run ASR (every N chunks)
         if chunk_count % PROCESS_EVERY_N_CHUNKS != 0:
-            print(f"[ASR] Buffered {chunk_count} chunks (waiting for {PROCESS_EVERY_N_CHUNKS})")
+            chunk_log.debug("Chunk buffered", extra={"chunks": chunk_count, "batch": PROCESS_EVERY_N_CHUNKS})
             return None
         
-        print(f"[ASR] Running ASR on {chunk_count} accumulated chunks...")
+        chunk_log.debug("Running ASR on buffered chunks", extra={"chunks": chunk_count})
         
-        # Get all audio bytes from buffer (WITHOUT clearing)
-        audio_all = buffer.get_all_bytes()
+        # Get buffered chunks, ordered by seq (WITHOUT clearing)
+        chunks = _store.snapshot(key)
+        audio_all = b''.join(data for _, data in chunks)
         if not audio_all:
-            print("[ASR] ERROR: No audio data in buffer")
+            logger.error("No audio data in buffer", extra={"user_id": user_id, "tab_id": tab_id})
             return None
         
         # Run transcription
-        segments = transcribe_audio_bytes(audio_all)
+        segments = transcribe_audio_bytes(audio_all, get_session(user_id, tab_id), language, user_id, engine)
         
-        # Only clear buffer if ASR succeeded
+        # Only drop the consumed chunks if ASR succeeded
         if segments is not None:
-            buffer.clear()
-            print(f"[ASR] ASR complete: {len(segments)} segments, buffer cleared")
+            _store.discard(key, [s for s, _ in chunks])
+            chunk_log.debug("ASR complete, buffer cleared", extra={"segments": len(segments)})
             return segments
         else:
             # ASR failed; keep buffer for retry
-            print("[ASR] ASR failed; keeping buffer for retry")
+            logger.warning("ASR failed; keeping buffer for retry", extra={"user_id": user_id, "tab_id": tab_id})
             return None
     
-    except Exception as e:
-        print(f"[ASR] ERROR in process_audio_chunk: {e}")
+    except Exception:
+        logger.exception("process_audio_chunk failed", extra={"user_id": user_id, "tab_id": tab_id, "seq": seq})
         return None
+
+
+def _streaming_supported(mime_type: str) -> bool:
+    # Decoder state lives in this process, so it only replaces the chunk store
+    # when the store is in-process too.
+    return (
+        isinstance(_store, InProcessSessionStore)
+        and audio_stream.available()
+        and audio_stream.supports(mime_type)
+    )
+
+
+def _process_streamed_chunk(
+    user_id: str,
+    tab_id: int,
+    seq: int,
+    audio_bytes: bytes,
+    mime_type: str,
+    language: Optional[str],
+    engine: Optional[str] = None,
+) -> Optional[List[TranscriptSegment]]:
+    """Decode into the session's AudioStream in seq order; transcribe new audio every N chunks."""
+    recognizer_engine = get_engine(engine)
+    session = get_session(user_id, tab_id)
+    stream = session.audio_stream(mime_type)
+    jitter = session.jitter_buffer()
+    if jitter is None:
+        stream.feed(audio_bytes)
+    else:
+        released = jitter.push(seq, (audio_bytes, None))
+        if not released:
+            chunk_log.debug("Chunk held for reordering", extra={"seq": seq, "late": released is None})
+            return None
+        asr_service.feed_released(stream, released)
+    if recognizer_engine.streaming:
+        return _feed_streaming_recognizer(session, stream, recognizer_engine, language, user_id)
+    if stream.chunks_pending < PROCESS_EVERY_N_CHUNKS:
+        chunk_log.debug("Chunk decoded into stream", extra={"chunks": stream.chunks_pending, "batch": PROCESS_EVERY_N_CHUNKS})
+        return None
+    
+    samples, _, end = stream.peek_new()
+    if not len(samples):
+        return None
+    segments = transcribe_audio_bytes(samples, session, language, user_id, recognizer_engine.name)
+    if segments is None:
+        # ASR failed; the audio stays unconsumed for the next batch
+        logger.warning("ASR failed; keeping audio for retry", extra={"user_id": user_id, "tab_id": tab_id})
+        return None
+    stream.consume(end)
+    return segments
+
+
+def _feed_streaming_recognizer(
+    session: SessionState,
+    stream: "audio_stream.AudioStream",
+    engine: "ASREngine",
+    language: Optional[str],
+    user_id: str,
+) -> Optional[List[TranscriptSegment]]:
+    """Feed new audio to the session's streaming recognizer as it arrives; finalize every N chunks."""
+    samples, start, end = stream.peek_new()
+    start_index = int(round(start * audio_stream.SAMPLE_RATE))
+    if session.recognizer is None or session.recognizer[0] != engine.name:
+        session.recognizer = (engine.name, engine.recognizer(session.options(language)))
+        session.recognizer_fed = start_index
+    recognizer = session.recognizer[1]
+    with asr_service.scheduler.slot(None, user_id):
+        recognizer.feed_audio(samples[max(0, session.recognizer_fed - start_index):])
+        session.recognizer_fed = end
+        if stream.chunks_pending < PROCESS_EVERY_N_CHUNKS:
+            chunk_log.debug("Chunk fed to streaming recognizer", extra={"partial": recognizer.get_partial()})
+            return None
+        result = recognizer.get_final()
+    stream.consume(end)
+    segments = _to_segments(result.segments)
+    session.update(
+        session.options(language),
+        result.language,
+        result.language_probability,
+        " ".join(ts.text for ts in segments),
+    )
+    return segments
@@ -0,0 +1,126 @@
+"""
+Per-user and per-tab admission control for ASR chunks.
+
+Each chunk takes one token from its tab's bucket and one from its user's
+bucket before it may queue for inference (see app/asr_scheduler.py for the
+fair queue behind this). A client sending chunks faster than real time, or a
+user with many tabs, runs out of tokens instead of crowding out others.
+
+An over-quota chunk is not transcribed on its own:
+  - coalesced: with streaming decode its audio is still fed to the
+    session's AudioStream, so the next admitted chunk transcribes it along
+    with its own audio (nothing is lost, it is just batched)
+  - throttled: otherwise it is rejected
+Both are reported as ASRStreamResponse.status.
+
+Environment:
+  ISWEEP_ASR_USER_RATE   chunks per second per user (default 4, 0 disables)
+  ISWEEP_ASR_USER_BURST  bucket size per user (default 12)
+  ISWEEP_ASR_TAB_RATE    chunks per second per tab (default 2, 0 disables)
+  ISWEEP_ASR_TAB_BURST   bucket size per tab (default 6)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Hashable, Optional
+
+from .logging_config import SampledLogger
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+throttle_log = SampledLogger(logger)
+
+# Buckets idle (and refilled) this long are forgotten.
+BUCKET_IDLE_SECONDS = 300.0
+
+THROTTLED = REGISTRY.counter(
+    "isweep_asr_throttled_chunks_total",
+    "ASR chunks over quota, by the bucket that ran out (user, tab) and outcome (coalesced, throttled)",
+    ("scope", "outcome"),
+)
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`; starts full."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def refill(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+
+class AdmissionController:
+    """Token buckets per user and per (user, tab); a rate of 0 disables that level."""
+
+    def __init__(self, user_rate: float, user_burst: float, tab_rate: float, tab_burst: float):
+        self.user_rate = user_rate
+        self.user_burst = max(1.0, user_burst)
+        self.tab_rate = tab_rate
+        self.tab_burst = max(1.0, tab_burst)
+        self._buckets: dict[tuple[str, Hashable], TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def _bucket(self, key: tuple[str, Hashable], rate: float, burst: float, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+        bucket.refill(now)
+        return bucket
+
+    def admit(self, user_id: str, tab_id: Optional[int] = None, now: Optional[float] = None) -> Optional[str]:
+        """Take a token for a chunk. Returns None if admitted, else the scope that ran out ("tab" or "user")."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._prune(now)
+            buckets = []
+            if self.tab_rate > 0 and tab_id is not None:
+                buckets.append(("tab", self._bucket(("tab", (user_id, tab_id)), self.tab_rate, self.tab_burst, now)))
+            if self.user_rate > 0:
+                buckets.append(("user", self._bucket(("user", user_id), self.user_rate, self.user_burst, now)))
+            # All-or-nothing: a chunk the tab rejects does not spend the user's token.
+            for scope, bucket in buckets:
+                if bucket.tokens < 1.0:
+                    return scope
+            for _, bucket in buckets:
+                bucket.tokens -= 1.0
+        return None
+
+    def _prune(self, now: float) -> None:
+        if now - self._last_prune < BUCKET_IDLE_SECONDS:
+            return
+        self._last_prune = now
+        for key, bucket in list(self._buckets.items()):
+            if now - bucket.updated > BUCKET_IDLE_SECONDS:
+                del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def record_throttled(user_id: str, scope: str, outcome: str) -> None:
+    """Count an over-quota chunk; the user only goes to the (sampled) log, not a metric label."""
+    THROTTLED.inc(scope=scope, outcome=outcome)
+    throttle_log.info("ASR chunk over quota", extra={"user_id": user_id, "scope": scope, "outcome": outcome})
+
+
+def create_admission() -> AdmissionController:
+    """Build the controller from the environment (see module docstring)."""
+    return AdmissionController(
+        user_rate=float(os.getenv("ISWEEP_ASR_USER_RATE", "4")),
+        user_burst=float(os.getenv("ISWEEP_ASR_USER_BURST", "12")),
+        tab_rate=float(os.getenv("ISWEEP_ASR_TAB_RATE", "2")),
+        tab_burst=float(os.getenv("ISWEEP_ASR_TAB_BURST", "6")),
+    )
@@ -0,0 +1,160 @@
+"""
+Idempotent ASR chunks: duplicate (user_id, tab_id, seq) submissions.
+
+The extension resends an AudioChunk when a request times out, usually while
+the backend is already overloaded. Transcribing the retry again only adds
+load, and with streaming decode (app/audio_stream.py) it would also feed the
+same audio into the session's decoder twice. Within a window, a chunk key
+is therefore transcribed once:
+
+  - inflight: a duplicate arriving while the first submission is still being
+    transcribed waits for it and gets the same result (single-flight)
+  - cached: a duplicate arriving after it finished gets the stored result
+
+Results are stored only when `keep(result)` says the first submission
+changed session state (its audio was fed to the session's stream): a rerun
+would then not be the same computation, so errors and dropped chunks are
+answered from the store too. A result that left no state behind (a
+throttled chunk, a failed standalone decode) is forgotten once its waiters
+have it, so the client's retry is transcribed afresh.
+
+Environment:
+  ISWEEP_ASR_DEDUP_WINDOW  seconds a finished chunk's result is kept (default 30, 0 disables)
+  ISWEEP_ASR_DEDUP_SIZE    max results kept per worker (default 4096)
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from .metrics import REGISTRY
+
+DEDUPLICATED = REGISTRY.counter(
+    "isweep_asr_deduplicated_chunks_total",
+    "Duplicate ASR chunks answered without transcribing, by outcome (cached, inflight)",
+    ("outcome",),
+)
+
+
+class _Flight:
+    __slots__ = ("done", "result", "failed", "finished_at")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.failed = False
+        self.finished_at: Optional[float] = None
+
+
+class ChunkDeduplicator:
+    """Single-flight computation per key, with results kept for `window_seconds`."""
+
+    def __init__(self, window_seconds: float, max_entries: int = 4096):
+        self.window_seconds = window_seconds
+        self.max_entries = max(1, max_entries)
+        self._flights: "OrderedDict[Hashable, _Flight]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    def run(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        keep: Optional[Callable[[Any], bool]] = None,
+    ) -> tuple[Any, str]:
+        """`compute()` for the first submission of `key`; returns (result, outcome).
+
+        outcome is "computed", "inflight" or "cached". If the computation
+        raises, the exception propagates to its caller and waiting duplicates
+        compute again themselves. If `keep(result)` is false, duplicates
+        already waiting get the result but later ones compute again.
+        """
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                self._prune(now)
+                flight = self._flights.get(key)
+                if flight is not None and flight.finished_at is not None and now - flight.finished_at > self.window_seconds:
+                    flight = None
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self._flights.move_to_end(key)
+                else:
+                    outcome = "cached" if flight.done.is_set() else "inflight"
+
+            if leader:
+                return self._compute(key, flight, compute, keep), "computed"
+            flight.done.wait()
+            if not flight.failed:
+                DEDUPLICATED.inc(outcome=outcome)
+                return flight.result, outcome
+
+    def _compute(
+        self,
+        key: Hashable,
+        flight: _Flight,
+        compute: Callable[[], Any],
+        keep: Optional[Callable[[Any], bool]],
+    ) -> Any:
+        try:
+            flight.result = compute()
+            if keep is not None and not keep(flight.result):
+                self._discard(key, flight)
+        except BaseException:
+            flight.failed = True
+            self._discard(key, flight)
+            raise
+        finally:
+            flight.finished_at = time.monotonic()
+            flight.done.set()
+        return flight.result
+
+    def _discard(self, key: Hashable, flight: _Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _prune(self, now: float) -> None:
+        if len(self._flights) <= self.max_entries and now - self._last_prune < self.window_seconds:
+            return
+        self._last_prune = now
+        finished = [(key, flight) for key, flight in self._flights.items() if flight.finished_at is not None]
+        excess = len(self._flights) - self.max_entries
+        # Oldest first; in-flight keys are never evicted, their waiters need them.
+        for key, flight in finished:
+            if excess > 0 or now - flight.finished_at > self.window_seconds:
+                del self._flights[key]
+                excess -= 1
+
+    def forget(self, prefix: tuple) -> None:
+        """Drop finished results whose key starts with `prefix` (e.g. a closed tab's chunks)."""
+        n = len(prefix)
+        with self._lock:
+            for key, flight in list(self._flights.items()):
+                if key[:n] == prefix and flight.finished_at is not None:
+                    del self._flights[key]
+
+    def results(self) -> list[Any]:
+        """Stored results of finished computations."""
+        with self._lock:
+            return [f.result for f in self._flights.values() if f.finished_at is not None and not f.failed]
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+
+def create_deduplicator() -> ChunkDeduplicator:
+    """Build the deduplicator from the environment (see module docstring)."""
+    return ChunkDeduplicator(
+        window_seconds=float(os.getenv("ISWEEP_ASR_DEDUP_WINDOW", "30")),
+        max_entries=int(os.getenv("ISWEEP_ASR_DEDUP_SIZE", "4096")),
+    )
@@ -0,0 +1,283 @@
+"""
+Pluggable ASR engines.
+
+An engine makes a Recognizer per piece of work, and a Recognizer is driven
+the same way whatever the engine does underneath:
+
+  feed_audio(audio)  add 16 kHz mono float32 samples
+  get_partial()      current hypothesis for audio fed since the last final
+  get_final()        finish that audio; an EngineResult whose segment times
+                     are relative to its start
+
+Engines:
+  whisper  faster-whisper (app/asr_service.py registers it). Batch decoding:
+           audio is buffered by feed_audio and transcribed by get_final, so
+           there are no partials. Best accuracy; the model, beam size and
+           compute type follow the load-adaptive tiers (app/asr_tiers.py).
+           Also accepts an encoded file path or file object instead of
+           samples.
+  vosk     Vosk/Kaldi streaming recognizer. Audio is decoded incrementally as
+           it is fed, so get_final only flushes the last few frames and
+           partials are available: much lower latency and CPU than Whisper,
+           at lower accuracy. Needs `pip install vosk` and a model
+           (VOSK_MODEL_PATH, or one downloaded for VOSK_LANG).
+
+The engine is chosen per deployment (ISWEEP_ASR_ENGINE) or per request
+(AudioChunk.engine). Every engine yields the same segment dicts (text,
+start_seconds, end_seconds, confidence), so callers build TranscriptSegments
+the same way.
+
+Environment:
+  ISWEEP_ASR_ENGINE  default engine (default whisper)
+  VOSK_MODEL_PATH    Vosk model directory (default: download the model for VOSK_LANG)
+  VOSK_LANG          Vosk model language when no path is given (default en-us)
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, NamedTuple, Optional
+
+from . import memory
+from .asr_sessions import DecodeOptions
+from .asr_tiers import Tier
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENGINE = os.getenv("ISWEEP_ASR_ENGINE", "whisper").lower()
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "")
+VOSK_LANG = os.getenv("VOSK_LANG", "en-us")
+SAMPLE_RATE = 16000
+
+
+class EngineResult(NamedTuple):
+    """Segments for the audio fed since the previous get_final()."""
+
+    segments: list[dict]
+    language: Optional[str] = None
+    language_probability: Optional[float] = None
+    duration: float = 0.0
+
+
+class Recognizer(ABC):
+    """One stream of audio for one engine."""
+
+    # Quality tier used (Whisper only).
+    tier: Optional[Tier] = None
+
+    @abstractmethod
+    def feed_audio(self, audio: Any) -> None:
+        """Add 16 kHz mono float32 samples."""
+
+    def get_partial(self) -> str:
+        """Hypothesis for audio not yet finalized ("" if the engine has none)."""
+        return ""
+
+    @abstractmethod
+    def get_final(self) -> EngineResult:
+        """Finish the audio fed so far; the recognizer can then be fed again."""
+
+
+class ASREngine(ABC):
+    name: str = ""
+    # Decodes while audio is fed, so a recognizer can be kept across chunks.
+    streaming = False
+    # feed_audio also takes encoded files (used when streaming decode is unavailable).
+    decodes_files = False
+    # Recognizers need a quality tier from the tier controller (app/asr_tiers.py).
+    tiered = False
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def recognizer(self, options: DecodeOptions, tier: Optional[Tier] = None, **kwargs: Any) -> Recognizer:
+        """A recognizer decoding with `options` (language, prompt); `tier` is for tiered engines."""
+
+
+# =========================================================
+# FASTER-WHISPER
+# =========================================================
+class WhisperRecognizer(Recognizer):
+    def __init__(self, model, options: DecodeOptions, tier: Tier, transcribe_kwargs: dict[str, Any]):
+        self.model = model
+        self.options = options
+        self.tier = tier
+        self.transcribe_kwargs = transcribe_kwargs
+        self._audio: list = []
+
+    def feed_audio(self, audio: Any) -> None:
+        self._audio.append(audio)
+
+    def _input(self) -> Any:
+        if len(self._audio) == 1:
+            return self._audio[0]  # samples, a path or a file object, as given
+        import numpy as np
+
+        return np.concatenate(self._audio)
+
+    def get_final(self) -> EngineResult:
+        if not self._audio:
+            return EngineResult([])
+        audio, self._audio = self._input(), []
+        # transcribe() returns a lazy generator; decoding happens while iterating.
+        segments, info = self.model.transcribe(
+            audio,
+            beam_size=self.tier.beam_size,
+            language=self.options.language,              # None = detect
+            initial_prompt=self.options.initial_prompt,  # previous transcript tail
+            **self.transcribe_kwargs,
+        )
+        out = []
+        for seg in segments:
+            text = (seg.text or "").strip()
+            if not text:
+                continue
+            out.append({
+                "text": text,
+                "start_seconds": max(0.0, float(seg.start)),
+                "end_seconds": max(0.0, float(seg.end)),
+                "confidence": 0.9,  # Whisper does not return confidence per segment
+            })
+        return EngineResult(
+            out,
+            getattr(info, "language", None),
+            getattr(info, "language_probability", None),
+            float(getattr(info, "duration", 0.0) or 0.0),
+        )
+
+
+class WhisperEngine(ASREngine):
+    name = "whisper"
+    decodes_files = True
+    tiered = True
+
+    def __init__(self, get_model: Callable[[Optional[str], Optional[str]], Any]):
+        self.get_model = get_model
+
+    def recognizer(self, options: DecodeOptions, tier: Optional[Tier] = None, **kwargs: Any) -> Recognizer:
+        if tier is None:
+            raise ValueError("the whisper engine needs a quality tier")
+        kwargs.setdefault("word_timestamps", False)  # cheaper; turn on only if you need it
+        kwargs.setdefault("vad_filter", True)        # often helps for speech chunks
+        return WhisperRecognizer(self.get_model(tier.model_size, tier.compute_type), options, tier, kwargs)
+
+
+# =========================================================
+# VOSK (streaming, CPU)
+# =========================================================
+class VoskRecognizer(Recognizer):
+    def __init__(self, model):
+        from vosk import KaldiRecognizer
+
+        self._rec = KaldiRecognizer(model, SAMPLE_RATE)
+        self._rec.SetWords(True)
+        self._utterances: list[dict] = []
+        self._fed = 0
+        self._round_start = 0.0
+
+    def feed_audio(self, audio: Any) -> None:
+        import numpy as np
+
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        self._fed += len(audio)
+        # True at an endpoint (silence after speech): the utterance is final.
+        if self._rec.AcceptWaveform(pcm):
+            self._utterances.append(json.loads(self._rec.Result()))
+
+    def get_partial(self) -> str:
+        return json.loads(self._rec.PartialResult()).get("partial", "")
+
+    def get_final(self) -> EngineResult:
+        utterances, self._utterances = self._utterances + [json.loads(self._rec.FinalResult())], []
+        round_start, self._round_start = self._round_start, self._fed / SAMPLE_RATE
+        out = []
+        for utterance in utterances:
+            words = utterance.get("result") or []
+            text = (utterance.get("text") or "").strip()
+            if not text or not words:
+                continue
+            # Word times count from the recognizer's first sample.
+            out.append({
+                "text": text,
+                "start_seconds": max(0.0, float(words[0]["start"]) - round_start),
+                "end_seconds": max(0.0, float(words[-1]["end"]) - round_start),
+                "confidence": round(sum(float(w.get("conf", 1.0)) for w in words) / len(words), 4),
+            })
+        return EngineResult(out, duration=self._round_start - round_start)
+
+
+class VoskEngine(ASREngine):
+    name = "vosk"
+    streaming = True
+
+    def __init__(self, model_path: str = VOSK_MODEL_PATH, lang: str = VOSK_LANG):
+        self.model_path = model_path
+        self.lang = lang
+        self._model = None
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        try:
+            import vosk  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def model(self):
+        """Load the Vosk model on first use."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from vosk import Model
+
+                    logger.info("Loading Vosk model", extra={"path": self.model_path, "lang": self.lang})
+                    self._model = Model(self.model_path) if self.model_path else Model(lang=self.lang)
+        return self._model
+
+    def recognizer(self, options: DecodeOptions, tier: Optional[Tier] = None, **kwargs: Any) -> Recognizer:
+        # One model per language: the language and prompt options do not apply.
+        return VoskRecognizer(self.model())
+
+    def nbytes(self) -> int:
+        if self._model is None or not self.model_path:
+            return 0
+        total = 0
+        for root, _, files in os.walk(self.model_path):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
+
+
+# =========================================================
+# REGISTRY
+# =========================================================
+ENGINES: dict[str, ASREngine] = {}
+
+
+def register_engine(engine: ASREngine) -> None:
+    ENGINES[engine.name] = engine
+
+
+def get_engine(name: Optional[str] = None) -> ASREngine:
+    """The engine called `name` (the deployment default if None); ValueError if unknown."""
+    key = (name or DEFAULT_ENGINE).lower()
+    engine = ENGINES.get(key)
+    if engine is None:
+        raise ValueError(f"Unknown ASR engine: {key!r} (expected one of {sorted(ENGINES)})")
+    return engine
+
+
+register_engine(VoskEngine())
+
+
+def _vosk_memory() -> dict:
+    engine = ENGINES.get("vosk")
+    loaded = isinstance(engine, VoskEngine) and engine._model is not None
+    return {"bytes": engine.nbytes() if loaded else 0, "entries": int(loaded)}
+
+
+memory.register_reporter("asr_engines.vosk_model", _vosk_memory)
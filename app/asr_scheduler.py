@@ -0,0 +1,234 @@
+"""
+Deadline-aware (earliest-deadline-first) scheduling of ASR inference.
+
+A chunk's result is only useful if it arrives before the chunk plays. When
+the client reports its playback position, the chunk's deadline is
+
+    received_at + (chunk_start_seconds - playback_position_seconds) + slack
+
+on this process's monotonic clock. Chunks wait for one of a fixed number of
+inference slots; free slots go to the waiting chunk with the earliest
+deadline. Chunks without a deadline are served after all chunks with one,
+in arrival order.
+
+A waiting chunk that can no longer finish in time (now + estimated service
+time > deadline) is either dropped (ChunkDropped) or, with the
+"deprioritize" policy, moved behind every chunk that can still make it.
+Completed chunks are counted as on time or late against their deadline.
+
+Across users, slots are shared by weighted fair queueing (start-time fair
+queueing): each user's waiting chunks form their own EDF queue, and a free
+slot goes to the user with the smallest virtual start tag, so a user with
+many tabs gets no more than their weighted share while others are waiting.
+With a single user this is plain EDF. Per-user and per-tab rate limits in
+front of the queue live in app/asr_admission.py.
+
+Environment:
+  ISWEEP_ASR_CONCURRENCY        inference slots per worker (default 1)
+  ISWEEP_ASR_LATE_POLICY        drop | deprioritize (default drop)
+  ISWEEP_ASR_DEADLINE_SLACK_MS  added to every deadline (default 0)
+  ISWEEP_ASR_USER_WEIGHTS       fair-share weights, "user_a=2,user_b=0.5" (default 1 each)
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from .metrics import REGISTRY
+
+DEADLINE_SLACK_SECONDS = int(os.getenv("ISWEEP_ASR_DEADLINE_SLACK_MS", "0")) / 1000.0
+
+# Smoothing for the service-time estimate used to detect hopeless chunks.
+EWMA_ALPHA = 0.2
+
+CHUNK_OUTCOMES = REGISTRY.counter(
+    "isweep_asr_deadline_chunks_total",
+    "ASR chunks by deadline outcome (on_time, late, dropped, deprioritized, no_deadline)",
+    ("outcome",),
+)
+
+# Priority classes: chunks that can make their deadline, then hopeless ones
+# (deprioritize policy), then chunks without a deadline.
+_CLASS_TIMELY = 0
+_CLASS_LATE = 1
+_CLASS_UNTIMED = 2
+
+
+class ChunkDropped(Exception):
+    """The chunk could not be transcribed before its deadline and was dropped."""
+
+
+def chunk_deadline(
+    received_at: float,
+    chunk_start_seconds: Optional[float],
+    playback_position_seconds: Optional[float],
+    slack_seconds: float = 0.0,
+) -> Optional[float]:
+    """Monotonic time by which the chunk's result is needed, or None if unknown."""
+    if chunk_start_seconds is None or playback_position_seconds is None:
+        return None
+    return received_at + (chunk_start_seconds - playback_position_seconds) + slack_seconds
+
+
+def parse_weights(spec: str) -> dict[str, float]:
+    """Parse "user_a=2,user_b=0.5" into {user_id: weight}."""
+    weights: dict[str, float] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        user_id, _, weight = item.rpartition("=")
+        if not user_id or float(weight) <= 0:
+            raise ValueError(f"Invalid fair-share weight: {item!r} (expected user=weight, weight > 0)")
+        weights[user_id] = float(weight)
+    return weights
+
+
+class Ticket:
+    """A chunk's place in the queue; `wait` is set once it gets a slot."""
+
+    __slots__ = ("deadline", "priority", "wait", "cancelled", "user_id")
+
+    def __init__(self, deadline: Optional[float], priority: tuple, user_id: Optional[str] = None):
+        self.deadline = deadline
+        self.priority = priority
+        self.wait = 0.0
+        self.cancelled = False
+        self.user_id = user_id
+
+
+class DeadlineScheduler:
+    """Hands out `slots` inference slots, fair across users and earliest-deadline-first within one."""
+
+    def __init__(self, slots: int = 1, policy: str = "drop", weights: Optional[dict[str, float]] = None):
+        if policy not in ("drop", "deprioritize"):
+            raise ValueError(f"Unknown late policy: {policy!r} (expected 'drop' or 'deprioritize')")
+        self.slots = slots
+        self.policy = policy
+        self.weights = dict(weights or {})
+        self._free = slots
+        self._queues: dict[Optional[str], list[tuple[tuple, Ticket]]] = {}
+        self._finish: dict[Optional[str], float] = {}  # virtual finish tag of each user's last grant
+        self._vtime = 0.0
+        self._cond = threading.Condition()
+        self._order = itertools.count()
+        self._service_estimate = 0.0
+
+    @property
+    def service_estimate(self) -> float:
+        """Smoothed seconds a chunk holds a slot."""
+        return self._service_estimate
+
+    def queued(self, user_id: Optional[str] = None) -> int:
+        """Waiting chunks, for one user or (by default) all of them."""
+        with self._cond:
+            queues = [self._queues.get(user_id, [])] if user_id is not None else self._queues.values()
+            return sum(1 for queue in queues for _, ticket in queue if not ticket.cancelled)
+
+    def _hopeless(self, ticket: Ticket, now: float) -> bool:
+        return ticket.deadline is not None and now + self._service_estimate > ticket.deadline
+
+    def _push(self, ticket: Ticket, cls: int) -> None:
+        key = ticket.deadline if cls != _CLASS_UNTIMED else 0.0
+        ticket.priority = (cls, key, next(self._order))
+        heapq.heappush(self._queues.setdefault(ticket.user_id, []), (ticket.priority, ticket))
+
+    def _start_tag(self, user_id: Optional[str]) -> float:
+        return max(self._vtime, self._finish.get(user_id, 0.0))
+
+    def _head(self) -> Optional[Ticket]:
+        """The chunk that gets the next free slot."""
+        best_key, best = None, None
+        for user_id, queue in list(self._queues.items()):
+            while queue and queue[0][1].cancelled:
+                heapq.heappop(queue)
+            if not queue:
+                del self._queues[user_id]
+                continue
+            priority, ticket = queue[0]
+            # Priority class first, then the user's fair share, then EDF within the user.
+            key = (priority[0], self._start_tag(user_id), priority)
+            if best_key is None or key < best_key:
+                best_key, best = key, ticket
+        return best
+
+    def _grant(self, ticket: Ticket) -> None:
+        heapq.heappop(self._queues[ticket.user_id])
+        start = self._start_tag(ticket.user_id)
+        self._finish[ticket.user_id] = start + 1.0 / self.weights.get(ticket.user_id, 1.0)
+        self._vtime = start
+        # Idle users whose tag fell behind virtual time no longer affect anything.
+        for user_id in [u for u, tag in self._finish.items() if tag <= self._vtime and u not in self._queues]:
+            del self._finish[user_id]
+
+    def acquire(self, deadline: Optional[float], user_id: Optional[str] = None) -> Ticket:
+        """Block until this chunk gets a slot; raises ChunkDropped if it cannot make its deadline."""
+        queued_at = time.monotonic()
+        ticket = Ticket(deadline, (), user_id)
+        with self._cond:
+            self._push(ticket, _CLASS_UNTIMED if deadline is None else _CLASS_TIMELY)
+            while True:
+                now = time.monotonic()
+                if ticket.priority[0] == _CLASS_TIMELY and self._hopeless(ticket, now):
+                    ticket.cancelled = True
+                    if self.policy == "drop":
+                        CHUNK_OUTCOMES.inc(outcome="dropped")
+                        self._cond.notify_all()
+                        raise ChunkDropped()
+                    CHUNK_OUTCOMES.inc(outcome="deprioritized")
+                    ticket = Ticket(deadline, (), user_id)
+                    self._push(ticket, _CLASS_LATE)
+                    self._cond.notify_all()
+                if self._free > 0 and self._head() is ticket:
+                    self._grant(ticket)
+                    self._free -= 1
+                    ticket.wait = now - queued_at
+                    # Another slot may be free for the next chunk in line.
+                    self._cond.notify_all()
+                    return ticket
+                timeout = None
+                if ticket.priority[0] == _CLASS_TIMELY:
+                    # Wake up when the chunk would become hopeless.
+                    timeout = max(0.001, ticket.deadline - self._service_estimate - now)
+                self._cond.wait(timeout)
+
+    def release(self, ticket: Ticket, service_seconds: float) -> None:
+        """Return the slot and record whether the chunk finished by its deadline."""
+        finished = time.monotonic()
+        with self._cond:
+            self._free += 1
+            self._service_estimate = (
+                service_seconds
+                if self._service_estimate == 0.0
+                else EWMA_ALPHA * service_seconds + (1 - EWMA_ALPHA) * self._service_estimate
+            )
+            self._cond.notify_all()
+        if ticket.deadline is None:
+            CHUNK_OUTCOMES.inc(outcome="no_deadline")
+        else:
+            CHUNK_OUTCOMES.inc(outcome="on_time" if finished <= ticket.deadline else "late")
+
+    @contextmanager
+    def slot(self, deadline: Optional[float] = None, user_id: Optional[str] = None) -> Iterator[Ticket]:
+        """`with scheduler.slot(deadline, user_id) as ticket:` around inference."""
+        ticket = self.acquire(deadline, user_id)
+        started = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            self.release(ticket, time.monotonic() - started)
+
+
+def create_scheduler() -> DeadlineScheduler:
+    """Build the scheduler from the environment (see module docstring)."""
+    return DeadlineScheduler(
+        slots=int(os.getenv("ISWEEP_ASR_CONCURRENCY", "1")),
+        policy=os.getenv("ISWEEP_ASR_LATE_POLICY", "drop").lower(),
+        weights=parse_weights(os.getenv("ISWEEP_ASR_USER_WEIGHTS", "")),
+    )
@@ -1,17 +1,180 @@
-"""Chunk transcription service for ISweep ASR (faster-whisper based)."""
+"""Chunk transcription service for ISweep ASR (faster-whisper by default; see app/asr_engines.py)."""
 
 import base64
+import logging
 import os
 import tempfile
-from typing import List, Dict, Optional
+import threading
+import time
+from typing import List, Dict, NamedTuple, Optional
 
-from faster_whisper import WhisperModel
+from . import audio_stream
+from . import memory
+from .asr_admission import create_admission, record_throttled
+from .asr_dedup import create_deduplicator
+from .asr_engines import ASREngine, Recognizer, WhisperEngine, get_engine, register_engine
+from .asr_scheduler import ChunkDropped, create_scheduler
+from .asr_sessions import DecodeOptions, SessionState, get_session
+from .asr_tiers import Tier, create_controller
+from .asr_tuning import load_tuned_config
+from .jitter_buffer import Gap
+from .session_store import STORE_KIND
+from .metrics import REGISTRY
+from .timing import span
+
+logger = logging.getLogger(__name__)
+
+# Defaults recommended by `python -m app tune-asr`; explicit env vars win.
+load_tuned_config()
 
 WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "base")
 WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")          # "cpu" or "cuda"
 WHISPER_COMPUTE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")  # e.g. "int8", "float16"
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))  # 0 = CTranslate2 default
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "1"))
+
+# Loaded models keyed by (size, compute_type); tiers sharing a model share the instance.
+_models: Dict[tuple, object] = {}
+_model_lock = threading.Lock()
+# Inference slots, handed out earliest-deadline-first (see app/asr_scheduler.py).
+# Queue wait feeds the tier controller.
+scheduler = create_scheduler()
+# Per-user/per-tab token buckets in front of the queue (see app/asr_admission.py).
+admission = create_admission()
+# Retried (user_id, tab_id, seq) chunks share one transcription (see app/asr_dedup.py).
+dedup = create_deduplicator()
+
+tier_controller = create_controller(WHISPER_MODEL_SIZE, WHISPER_COMPUTE)
+
+# A session's AudioStream and jitter buffer live in this worker, so streaming
+# decode needs all of a tab's chunks to reach it. With the shared file store
+# (ISWEEP_SESSION_STORE=file, i.e. several workers) chunks are decoded
+# standalone instead, like asr._streaming_supported.
+STREAM_DECODE = STORE_KIND == "memory"
+
+# A streaming engine (app/asr_engines.py) keeps one recognizer per session,
+# fed every chunk and finalized every this many chunks; chunks in between
+# return its partial hypothesis.
+STREAMING_FINAL_CHUNKS = 3
+
+QUEUE_WAIT = REGISTRY.histogram("isweep_asr_queue_wait_seconds", "Time chunks waited for an ASR slot")
+INFERENCE = REGISTRY.histogram("isweep_asr_inference_seconds", "ASR inference time per chunk", ("tier",))
+
+
+def _tier_gauge():
+    yield (), tier_controller.index
+
+
+REGISTRY.gauge("isweep_asr_tier_index", "Current ASR tier (0 = best quality)", callback=_tier_gauge)
+
+
+def get_model(model_size: Optional[str] = None, compute_type: Optional[str] = None):
+    """Load a WhisperModel on first use (the first request per model pays the load time)."""
+    key = (model_size or WHISPER_MODEL_SIZE, compute_type or WHISPER_COMPUTE)
+    model = _models.get(key)
+    if model is None:
+        with _model_lock:
+            model = _models.get(key)
+            if model is None:
+                from faster_whisper import WhisperModel
+
+                logger.info(
+                    "Loading Whisper model",
+                    extra={"size": key[0], "device": WHISPER_DEVICE, "compute_type": key[1], "cpu_threads": WHISPER_CPU_THREADS},
+                )
+                model = _models[key] = WhisperModel(
+                    key[0],
+                    device=WHISPER_DEVICE,
+                    compute_type=key[1],
+                    cpu_threads=WHISPER_CPU_THREADS,
+                    num_workers=WHISPER_NUM_WORKERS,
+                )
+    return model
+
+
+# Looked up on each call, so the loader can be swapped (tests, tooling).
+register_engine(WhisperEngine(lambda *key: get_model(*key)))
 
-model = WhisperModel(WHISPER_MODEL_SIZE, device=WHISPER_DEVICE, compute_type=WHISPER_COMPUTE)
+
+def _model_memory() -> dict:
+    with _model_lock:
+        loaded = list(_models)
+    return {
+        "bytes": sum(memory.estimate_whisper_model_bytes(size, compute) for size, compute in loaded),
+        "entries": len(loaded),
+        "models": [{"size": size, "device": WHISPER_DEVICE, "compute_type": compute} for size, compute in loaded],
+    }
+
+
+memory.register_reporter("asr_service.whisper_model", _model_memory)
+
+
+def _dedup_memory() -> dict:
+    results = dedup.results()
+    return {
+        "bytes": sum(200 + sum(100 + len(seg["text"]) for seg in r.segments) for r in results),
+        "entries": len(dedup),
+    }
+
+
+memory.register_reporter("asr_service.chunk_results", _dedup_memory)
+
+
+def feed_released(stream: "audio_stream.AudioStream", released: list) -> tuple[int, Optional[float]]:
+    """Feed chunks released by a jitter buffer, in order.
+
+    Items are (seq, (audio_bytes, chunk_start_seconds)) or Gap markers.
+    Returns the number of new samples and the start time of the first chunk.
+    """
+    new_samples = 0
+    first_start = None
+    fed = False
+    for entry in released:
+        if isinstance(entry, Gap):
+            stream.discontinuity()
+            continue
+        _, (audio_bytes, chunk_start) = entry
+        if not fed:
+            first_start, fed = chunk_start, True
+        new_samples += stream.feed(audio_bytes)
+    return new_samples, first_start
+
+
+def _session_recognizer(
+    session: SessionState, engine: ASREngine, options: DecodeOptions, stream_start: float
+) -> Recognizer:
+    """The session's recognizer for a streaming engine, created on first use or engine change."""
+    if session.recognizer is None or session.recognizer[0] != engine.name:
+        session.recognizer = (engine.name, engine.recognizer(options))
+        session.recognizer_fed = int(round(stream_start * audio_stream.SAMPLE_RATE))
+    return session.recognizer[1]
+
+
+class ChunkTranscription(NamedTuple):
+    """Segments for one chunk plus the quality tier that produced them.
+
+    status is "ok", "dropped" (missed its deadline before inference),
+    "buffered" (held for a missing earlier chunk), "late" (arrived after its
+    seq was skipped) or "error". language is the language the chunk was
+    decoded as; engine is the ASR engine that ran (see app/asr_engines.py).
+    partial is a streaming engine's hypothesis for audio not finalized yet.
+    streamed is True once the chunk's audio went into the session's
+    AudioStream or jitter buffer, so resubmitting it would not be a clean
+    retry.
+    """
+
+    segments: List[Dict]
+    tier: Optional[Tier]
+    status: str = "ok"
+    language: Optional[str] = None
+    engine: Optional[str] = None
+    streamed: bool = False
+    partial: Optional[str] = None
+
+
+def _keep_result(result: ChunkTranscription) -> bool:
+    """Whether retries of a chunk should get this result instead of running again."""
+    return result.streamed or result.status not in ("throttled", "error")
 
 
 def transcribe_audio_chunk(
@@ -29,43 +192,218 @@ def transcribe_audio_chunk(
     Returns:
         List of segment dicts with text, start_seconds, end_seconds.
     """
+    return transcribe_chunk(audio_b64, user_id, chunk_start_seconds).segments
+
+
+def transcribe_chunk(
+    audio_b64: str,
+    user_id: str,
+    chunk_start_seconds: Optional[float] = None,
+    deadline: Optional[float] = None,
+    tab_id: Optional[int] = None,
+    language: Optional[str] = None,
+    mime_type: Optional[str] = None,
+    seq: Optional[int] = None,
+    engine: Optional[str] = None,
+) -> ChunkTranscription:
+    """Like transcribe_audio_chunk(), but also reports the tier that served the chunk.
+
+    `deadline` (time.monotonic() based, see asr_scheduler.chunk_deadline)
+    orders the chunk in the inference queue. The tier is picked by the
+    load-adaptive controller (see app/asr_tiers.py) when the chunk gets a
+    slot; tier is None if the chunk never got one.
+
+    With a tab_id, the (user_id, tab_id) session's pinned language and
+    transcript tail are used and updated (see app/asr_sessions.py);
+    `language` overrides the pinned language for this chunk.
+
+    Supported mime types (WebM/Opus by default, raw Opus, PCM16) are decoded
+    by the session's persistent AudioStream (see app/audio_stream.py), so
+    chunks without the WebM header work and only new audio is decoded. Other
+    types, a missing PyAV/numpy, or the multi-worker file session store
+    (ISWEEP_SESSION_STORE=file) fall back to decoding the chunk as a
+    standalone file. With a seq, streamed chunks pass through the session's
+    jitter buffer (see app/jitter_buffer.py) and are decoded in seq order: a
+    chunk after a gap is held (status "buffered") and transcribed by the
+    request that fills the gap or gives up on it.
+
+    Chunks over the user's or tab's rate limit get status "coalesced" (their
+    streamed audio is transcribed with the next admitted chunk) or
+    "throttled" (rejected, without streaming decode).
+
+    `engine` picks the ASR engine for this chunk (default ISWEEP_ASR_ENGINE,
+    see app/asr_engines.py); an unknown name raises ValueError. Only the
+    whisper engine has tiers and can decode types without streaming
+    support. A streaming engine (vosk) keeps one recognizer per session:
+    each chunk is fed to it, and segments come every STREAMING_FINAL_CHUNKS
+    chunks, with the partial hypothesis returned in between.
+
+    With a tab_id and seq, a resubmitted chunk (a client retry) is not
+    transcribed again: it gets the first submission's result, waiting for it
+    if it is still running (see app/asr_dedup.py). Throttled chunks and
+    errors before streaming decode are not remembered, so their retries run.
+    """
+    if seq is None or tab_id is None or not dedup.enabled:
+        return _transcribe_chunk(
+            audio_b64, user_id, chunk_start_seconds, deadline, tab_id, language, mime_type, seq, engine
+        )
+    result, outcome = dedup.run(
+        (user_id, tab_id, seq),
+        lambda: _transcribe_chunk(
+            audio_b64, user_id, chunk_start_seconds, deadline, tab_id, language, mime_type, seq, engine
+        ),
+        keep=_keep_result,
+    )
+    if outcome != "computed":
+        logger.debug("Duplicate chunk", extra={"user_id": user_id, "tab_id": tab_id, "seq": seq, "outcome": outcome})
+    return result
+
+
+def _transcribe_chunk(
+    audio_b64: str,
+    user_id: str,
+    chunk_start_seconds: Optional[float],
+    deadline: Optional[float],
+    tab_id: Optional[int],
+    language: Optional[str],
+    mime_type: Optional[str],
+    seq: Optional[int],
+    engine: Optional[str],
+) -> ChunkTranscription:
     temp_path = None
+    tier = None
+    stream = None
+    persistent = False
+    locked = None
+    recognizer_engine = get_engine(engine)
     try:
-        audio_bytes = base64.b64decode(audio_b64)
-
-        with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_audio:
-            temp_audio.write(audio_bytes)
-            temp_audio.flush()
-            temp_path = temp_audio.name
-
-        segments, info = model.transcribe(
-            temp_path,
-            beam_size=1,
-            word_timestamps=False,  # cheaper; turn on only if you need it
-            vad_filter=True,        # often helps for speech chunks
-        )
+        with span("decode"):
+            audio_bytes = base64.b64decode(audio_b64)
 
         offset = float(chunk_start_seconds) if chunk_start_seconds is not None else 0.0
+        session = get_session(user_id, tab_id) if tab_id is not None else SessionState()
+
+        if STREAM_DECODE and audio_stream.available() and audio_stream.supports(mime_type):
+            # Released in the finally below, after consume(): a concurrent
+            # chunk of this session would otherwise peek the same audio.
+            with span("session_wait"):
+                session.decode_lock.acquire()
+            locked = session.decode_lock
+            with span("demux"):
+                stream = session.audio_stream(mime_type)
+                jitter = session.jitter_buffer() if tab_id is not None and seq is not None else None
+                if jitter is None:
+                    new_samples = stream.feed(audio_bytes)
+                else:
+                    released = jitter.push(seq, (audio_bytes, chunk_start_seconds))
+                    if released is None:
+                        return ChunkTranscription([], None, "late", streamed=True)
+                    if not released:
+                        return ChunkTranscription([], None, "buffered", streamed=True)
+                    new_samples, first_start = feed_released(stream, released)
+                    if first_start is not None:
+                        offset = first_start
+                audio_input, stream_start, stream_end = stream.peek_new()
+            if len(audio_input) == 0:
+                return ChunkTranscription([], None, streamed=True)  # e.g. a header-only first chunk
+            # Unconsumed audio from earlier chunks (a failed run) precedes this chunk's.
+            offset -= (len(audio_input) - new_samples) / audio_stream.SAMPLE_RATE
+        elif not recognizer_engine.decodes_files:
+            raise ValueError(f"the {recognizer_engine.name} engine needs streaming decode for {mime_type!r}")
+        else:
+            with span("write"):
+                with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_audio:
+                    temp_audio.write(audio_bytes)
+                    temp_audio.flush()
+                    temp_path = temp_audio.name
+            audio_input = temp_path
+
+        over_quota = admission.admit(user_id, tab_id)
+        if over_quota is not None:
+            # Streamed audio stays unconsumed and goes out with the next admitted chunk.
+            outcome = "coalesced" if stream is not None else "throttled"
+            record_throttled(user_id, over_quota, outcome)
+            return ChunkTranscription([], None, outcome, streamed=stream is not None)
 
-        out: List[Dict] = []
-        for seg in segments:
-            text = (seg.text or "").strip()
-            if not text:
-                continue
-            out.append(
-                {
-                    "text": text,
-                    "start_seconds": float(seg.start) + offset,
-                    "end_seconds": float(seg.end) + offset,
-                }
+        options = session.options(language)
+        persistent = stream is not None and tab_id is not None and recognizer_engine.streaming
+
+        with span("queue"):
+            ticket = scheduler.acquire(deadline, user_id)
+        slot_started = time.monotonic()
+        try:
+            queue_wait = ticket.wait
+            QUEUE_WAIT.observe(queue_wait)
+            tier = tier_controller.current() if recognizer_engine.tiered else None
+
+            with span("model_load"):
+                if persistent:
+                    recognizer = _session_recognizer(session, recognizer_engine, options, stream_start)
+                else:
+                    recognizer = recognizer_engine.recognizer(options, tier)
+
+            with span("inference"):
+                started = time.perf_counter()
+                if persistent:
+                    # Only audio the recognizer has not seen yet (earlier chunks left it unconsumed).
+                    first = max(0, session.recognizer_fed - int(round(stream_start * audio_stream.SAMPLE_RATE)))
+                    recognizer.feed_audio(audio_input[first:])
+                    session.recognizer_fed = stream_end
+                    final = stream.chunks_pending >= STREAMING_FINAL_CHUNKS
+                else:
+                    recognizer.feed_audio(audio_input)
+                    final = True
+                result = recognizer.get_final() if final else None
+                inference = time.perf_counter() - started
+        finally:
+            scheduler.release(ticket, time.monotonic() - slot_started)
+
+        INFERENCE.observe(inference, tier=tier.name if tier else recognizer_engine.name)
+        if result is None:
+            # The audio stays unconsumed until the recognizer finalizes it.
+            return ChunkTranscription(
+                [], None, engine=recognizer_engine.name, streamed=True, partial=recognizer.get_partial()
             )
-        return out
 
-    except Exception as e:
-        print(f"[ASR] Transcription error (user_id={user_id}): {e}")
-        return []
+        out: List[Dict] = [
+            {
+                **seg,
+                "start_seconds": max(0.0, seg["start_seconds"] + offset),
+                "end_seconds": max(0.0, seg["end_seconds"] + offset),
+            }
+            for seg in result.segments
+        ]
+        if stream is not None:
+            stream.consume(stream_end)
+        if tier is not None:
+            tier_controller.observe(tier, queue_wait, inference, result.duration)
+        session.update(options, result.language, result.language_probability, " ".join(seg["text"] for seg in out))
+        return ChunkTranscription(
+            out,
+            tier,
+            language=options.language or result.language,
+            engine=recognizer_engine.name,
+            streamed=stream is not None,
+            partial="" if persistent else None,
+        )
+
+    except ChunkDropped:
+        logger.info("Chunk dropped: missed its deadline", extra={"user_id": user_id})
+        if stream is not None:
+            stream.consume(stream_end)  # too late to be useful; don't carry it into the next chunk
+        if persistent:
+            session.recognizer = None  # its timeline no longer lines up with the stream
+        return ChunkTranscription([], None, "dropped", streamed=stream is not None)
+
+    except Exception:
+        logger.exception("Transcription error", extra={"user_id": user_id})
+        if persistent:
+            session.recognizer = None  # start over from the unconsumed audio
+        return ChunkTranscription([], tier, "error", engine=recognizer_engine.name, streamed=stream is not None)
 
     finally:
+        if locked is not None:
+            locked.release()
         if temp_path and os.path.exists(temp_path):
             try:
                 os.unlink(temp_path)
@@ -0,0 +1,197 @@
+"""
+Per-session ASR decoding state, keyed by (user_id, tab_id).
+
+  - Language pinning: Whisper detects the language on every call unless one
+    is given. Once a chunk is detected with probability >=
+    ISWEEP_ASR_LANGUAGE_PIN, the session pins that language and later chunks
+    skip detection (cheaper, and stable on short clips).
+  - Audio decoding: the session's AudioStream (app/audio_stream.py) keeps
+    demuxer/decoder state and a ring of decoded samples across chunks. Its
+    JitterBuffer (app/jitter_buffer.py) feeds it chunks in seq order.
+  - Context carry-over: the tail of the previous transcript (up to
+    ISWEEP_ASR_CONTEXT_CHARS characters, cut at a word boundary) is passed as
+    the decoder prompt for the next chunk, so words split across chunks and
+    names keep consistent spellings.
+
+AudioChunk.language overrides the pinned language for a chunk; "auto" clears
+the pin and detects again. State lives in this worker process and idle
+sessions are pruned.
+
+Environment:
+  ISWEEP_ASR_LANGUAGE_PIN    detection probability needed to pin (default 0.8)
+  ISWEEP_ASR_CONTEXT_CHARS   previous-transcript characters carried over (default 200, 0 disables)
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+from . import memory
+from .audio_stream import AudioStream
+from .jitter_buffer import JitterBuffer, create_jitter_buffer
+from .metrics import REGISTRY
+
+LANGUAGE_PIN_PROBABILITY = float(os.getenv("ISWEEP_ASR_LANGUAGE_PIN", "0.8"))
+CONTEXT_CHARS = int(os.getenv("ISWEEP_ASR_CONTEXT_CHARS", "200"))
+SESSION_IDLE_SECONDS = 600.0
+
+AUTO_LANGUAGE = "auto"
+
+LANGUAGE_MODES = REGISTRY.counter(
+    "isweep_asr_language_mode_total",
+    "ASR chunks by language handling (detect, pinned, override)",
+    ("mode",),
+)
+
+
+class DecodeOptions:
+    """What the next chunk should be decoded with."""
+
+    __slots__ = ("language", "initial_prompt", "mode")
+
+    def __init__(self, language: Optional[str], initial_prompt: Optional[str], mode: str):
+        self.language = language
+        self.initial_prompt = initial_prompt
+        self.mode = mode
+
+
+class SessionState:
+    """Pinned language, transcript tail and audio stream for one (user_id, tab_id)."""
+
+    __slots__ = (
+        "language", "tail", "last_used", "lock", "decode_lock", "stream", "jitter", "recognizer", "recognizer_fed",
+    )
+
+    def __init__(self):
+        self.language: Optional[str] = None
+        self.tail = ""
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        # Held by one chunk at a time from feeding the stream to consuming what
+        # it transcribed, so concurrent chunks never transcribe the same audio.
+        self.decode_lock = threading.Lock()
+        self.stream: Optional[AudioStream] = None
+        self.jitter: Optional[JitterBuffer] = None
+        # (engine name, Recognizer) of a streaming engine fed across chunks (app/asr.py),
+        # and the AudioStream sample index fed to it so far.
+        self.recognizer: Optional[tuple[str, Any]] = None
+        self.recognizer_fed = 0
+
+    def audio_stream(self, mime_type: Optional[str]) -> AudioStream:
+        """The session's decoder for `mime_type` (a new one if the type changed)."""
+        with self.lock:
+            if self.stream is None or self.stream.mime_type != mime_type:
+                self.stream = AudioStream(mime_type)
+            return self.stream
+
+    def jitter_buffer(self) -> Optional[JitterBuffer]:
+        """The session's chunk reorder buffer; None when jitter buffering is disabled."""
+        with self.lock:
+            if self.jitter is None:
+                self.jitter = create_jitter_buffer()
+            return self.jitter
+
+    def stats(self) -> dict:
+        return {
+            "language": self.language,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            "jitter": self.jitter.stats() if self.jitter is not None else None,
+            "engine": self.recognizer[0] if self.recognizer is not None else None,
+            "partial": self.recognizer[1].get_partial() if self.recognizer is not None else None,
+        }
+
+    def options(self, override: Optional[str] = None) -> DecodeOptions:
+        """Decode options for the next chunk; `override` is AudioChunk.language."""
+        with self.lock:
+            self.last_used = time.monotonic()
+            if override and override.lower() == AUTO_LANGUAGE:
+                self.language = None
+                override = None
+            prompt = self.tail or None
+            if override:
+                mode, language = "override", override.lower()
+            elif self.language:
+                mode, language = "pinned", self.language
+            else:
+                mode, language = "detect", None
+        LANGUAGE_MODES.inc(mode=mode)
+        return DecodeOptions(language, prompt, mode)
+
+    def update(
+        self,
+        options: DecodeOptions,
+        detected_language: Optional[str],
+        probability: Optional[float],
+        text: str,
+    ) -> None:
+        """Record the outcome of a chunk decoded with `options`."""
+        with self.lock:
+            self.last_used = time.monotonic()
+            if (
+                options.mode == "detect"
+                and detected_language
+                and probability is not None
+                and probability >= LANGUAGE_PIN_PROBABILITY
+            ):
+                self.language = detected_language
+            if text:
+                self.tail = transcript_tail(f"{self.tail} {text}", CONTEXT_CHARS)
+
+
+def transcript_tail(text: str, max_chars: int) -> str:
+    """Last `max_chars` of `text`, starting at a word boundary."""
+    text = " ".join(text.split())
+    if max_chars <= 0:
+        return ""
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    space = tail.find(" ")
+    return tail[space + 1:] if 0 <= space < len(tail) - 1 else tail
+
+
+_sessions: dict[tuple[str, int], SessionState] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(user_id: str, tab_id: int) -> SessionState:
+    """Get or create the state for (user_id, tab_id); prunes idle sessions."""
+    key = (user_id, tab_id)
+    now = time.monotonic()
+    with _sessions_lock:
+        state = _sessions.get(key)
+        if state is None:
+            for other_key, other in list(_sessions.items()):
+                if now - other.last_used > SESSION_IDLE_SECONDS:
+                    del _sessions[other_key]
+            state = _sessions[key] = SessionState()
+        return state
+
+
+def find_session(user_id: str, tab_id: int) -> Optional[SessionState]:
+    """The existing state for (user_id, tab_id), without creating one."""
+    with _sessions_lock:
+        return _sessions.get((user_id, tab_id))
+
+
+def clear_session(user_id: str, tab_id: int) -> None:
+    with _sessions_lock:
+        _sessions.pop((user_id, tab_id), None)
+
+
+def _sessions_memory() -> dict:
+    with _sessions_lock:
+        states = list(_sessions.values())
+    total = 0
+    for state in states:
+        total += sys.getsizeof(state.tail) + 128
+        if state.stream is not None:
+            total += state.stream.nbytes
+    return {"bytes": total, "entries": len(states)}
+
+
+memory.register_reporter("asr_sessions.state", _sessions_memory)
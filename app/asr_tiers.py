@@ -0,0 +1,194 @@
+"""
+Load-adaptive ASR quality tiers.
+
+A tier is one (model size, beam size, compute type) setting. Tiers form a
+ladder from best quality to cheapest. The TierController watches how long
+each chunk spent waiting for the model plus how long inference took,
+relative to the chunk's audio duration (the "load factor"; above 1.0 we fall
+behind real time). When the smoothed load factor stays high it steps one
+tier down the ladder; when there is clear headroom it steps back up. It
+never leaves the configured ladder, and waits a few chunks after each step
+so the new tier's own latency is measured before the next decision.
+
+Environment:
+  ISWEEP_ASR_TIERS       ladder, best first, as size:beam:compute entries
+                         (default: WHISPER_MODEL_SIZE at beam 5 and 1, then each
+                         smaller model at beam 1, all with WHISPER_COMPUTE_TYPE)
+  ISWEEP_ASR_TIER_START  starting tier name (default: WHISPER_MODEL_SIZE with beam 1)
+  ISWEEP_ASR_ADAPTIVE    "false" pins the starting tier (default "true")
+  ISWEEP_ASR_TIER_DOWN   load factor that triggers a step down (default 0.8)
+  ISWEEP_ASR_TIER_UP     load factor that allows a step up (default 0.35)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import NamedTuple, Optional, Sequence
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Whisper sizes, largest first, for the default ladder below the configured model.
+MODEL_SIZES = ("large", "medium", "small", "base", "tiny")
+
+# Smoothing for the load factor and chunks to observe after each tier change.
+EWMA_ALPHA = 0.3
+COOLDOWN_CHUNKS = 5
+
+TIER_CHANGES = REGISTRY.counter("isweep_asr_tier_changes_total", "ASR quality tier changes", ("direction",))
+CHUNKS_BY_TIER = REGISTRY.counter("isweep_asr_tier_chunks_total", "ASR chunks transcribed per quality tier", ("tier",))
+
+
+class Tier(NamedTuple):
+    """One ASR quality setting."""
+
+    model_size: str
+    beam_size: int
+    compute_type: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.model_size}:{self.beam_size}:{self.compute_type}"
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "model_size": self.model_size,
+            "beam_size": self.beam_size,
+            "compute_type": self.compute_type,
+        }
+
+
+def parse_tiers(spec: str) -> list[Tier]:
+    """Parse "size:beam:compute,..." into tiers (best first)."""
+    tiers = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            size, beam, compute = entry.split(":")
+            tiers.append(Tier(size.strip(), int(beam), compute.strip()))
+        except ValueError:
+            raise ValueError(f"Invalid ASR tier {entry!r} (expected size:beam:compute)") from None
+    if not tiers:
+        raise ValueError("ISWEEP_ASR_TIERS is empty")
+    return tiers
+
+
+class TierController:
+    """Steps through `tiers` (best first) based on observed load."""
+
+    def __init__(
+        self,
+        tiers: Sequence[Tier],
+        start: int = 0,
+        adaptive: bool = True,
+        down_threshold: float = 0.8,
+        up_threshold: float = 0.35,
+        cooldown: int = COOLDOWN_CHUNKS,
+    ):
+        if not 0 <= start < len(tiers):
+            raise ValueError(f"start tier {start} out of range")
+        self.tiers = list(tiers)
+        self.adaptive = adaptive
+        self.down_threshold = down_threshold
+        self.up_threshold = up_threshold
+        self.cooldown = cooldown
+        self._index = start
+        self._load: Optional[float] = None
+        self._since_change = 0
+        self._lock = threading.Lock()
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    @property
+    def load(self) -> Optional[float]:
+        """Smoothed load factor for the current tier (None until measured)."""
+        return self._load
+
+    def current(self) -> Tier:
+        return self.tiers[self._index]
+
+    def observe(self, tier: Tier, queue_wait: float, inference: float, audio_seconds: float) -> None:
+        """Record one chunk served by `tier`.
+
+        Chunks served by a tier other than the current one (they started
+        before a change) are counted but do not steer the controller.
+        """
+        CHUNKS_BY_TIER.inc(tier=tier.name)
+        if not self.adaptive or audio_seconds <= 0:
+            return
+        load = (queue_wait + inference) / audio_seconds
+        with self._lock:
+            if tier != self.tiers[self._index]:
+                return
+            self._load = load if self._load is None else EWMA_ALPHA * load + (1 - EWMA_ALPHA) * self._load
+            self._since_change += 1
+            if self._since_change < self.cooldown:
+                return
+            if self._load > self.down_threshold and self._index < len(self.tiers) - 1:
+                self._step(+1, "down")
+            elif self._load < self.up_threshold and self._index > 0:
+                self._step(-1, "up")
+
+    def _step(self, delta: int, direction: str) -> None:
+        previous = self.tiers[self._index]
+        self._index += delta
+        logger.info(
+            "ASR tier changed",
+            extra={"direction": direction, "from": previous.name, "to": self.tiers[self._index].name, "load": round(self._load, 3)},
+        )
+        self._load = None
+        self._since_change = 0
+        TIER_CHANGES.inc(direction=direction)
+
+
+def default_tiers(model_size: str, compute_type: str) -> list[Tier]:
+    """The configured model at beam 5 and 1, then each smaller Whisper size at beam 1.
+
+    English-only sizes ("small.en") step down to English-only sizes. A model
+    that is not a standard size (a path, "distil-large-v3") gets no smaller
+    tiers, so the default ladder never loads a model nobody configured
+    except a smaller variant of the same family.
+    """
+    tiers = [Tier(model_size, 5, compute_type), Tier(model_size, 1, compute_type)]
+    base_name, dot, suffix = model_size.partition(".")
+    family = base_name.split("-")[0]
+    if family in MODEL_SIZES:
+        for smaller in MODEL_SIZES[MODEL_SIZES.index(family) + 1:]:
+            tiers.append(Tier(smaller + dot + suffix, 1, compute_type))
+    return tiers
+
+
+def _start_index(tiers: Sequence[Tier], start_name: Optional[str], model_size: str) -> int:
+    if start_name:
+        for index, tier in enumerate(tiers):
+            if tier.name == start_name:
+                return index
+        logger.warning(
+            "ISWEEP_ASR_TIER_START is not in the tier ladder; using the default start tier",
+            extra={"start": start_name, "tiers": ",".join(t.name for t in tiers)},
+        )
+    for index, tier in enumerate(tiers):
+        if tier.model_size == model_size and tier.beam_size == 1:
+            return index
+    return 0
+
+
+def create_controller(model_size: str = "base", compute_type: str = "int8") -> TierController:
+    """Build the controller from the environment (see module docstring)."""
+    spec = os.getenv("ISWEEP_ASR_TIERS")
+    tiers = parse_tiers(spec) if spec else default_tiers(model_size, compute_type)
+    return TierController(
+        tiers,
+        start=_start_index(tiers, os.getenv("ISWEEP_ASR_TIER_START"), model_size),
+        adaptive=os.getenv("ISWEEP_ASR_ADAPTIVE", "true").lower() == "true",
+        down_threshold=float(os.getenv("ISWEEP_ASR_TIER_DOWN", "0.8")),
+        up_threshold=float(os.getenv("ISWEEP_ASR_TIER_UP", "0.35")),
+    )
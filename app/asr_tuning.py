@@ -0,0 +1,300 @@
+"""
+ASR performance tuning: grid search over Whisper settings on a local corpus.
+
+`python -m app tune-asr <corpus_dir>` decodes the corpus once, cuts it into
+/asr/stream-sized chunks and, for every combination of model size, compute
+type, CPU threads per process, beam size and process count, transcribes all
+chunks with that many processes (one model each). For each setting it
+reports:
+
+  - rtf         inference seconds per audio second within a process (< 1 is
+                faster than real time)
+  - throughput  audio seconds transcribed per wall-clock second, all
+                processes together
+  - p95         95th percentile per-chunk latency
+
+The recommendation is the best-quality setting (largest model, then widest
+beam) whose p95 fits in the chunk duration, ties broken by throughput. It is
+written as a JSON file of environment defaults that the backend applies on
+startup (see load_tuned_config); variables set in the real environment
+always win.
+
+Environment:
+  ISWEEP_ASR_CONFIG  tuned config file applied on startup (default asr_tuned.json, if present)
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+from typing import Any, Callable, Iterable, NamedTuple, Optional, Sequence
+
+from . import memory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = "asr_tuned.json"
+
+# The tuned start tier names an entry of the tuned ladder.
+TIED_VARIABLES = (("ISWEEP_ASR_TIERS", "ISWEEP_ASR_TIER_START"),)
+SAMPLE_RATE = 16000
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".webm", ".mp4", ".mkv", ".aac")
+
+
+class TuneSetting(NamedTuple):
+    """One point of the grid."""
+
+    model_size: str
+    compute_type: str
+    cpu_threads: int
+    beam_size: int
+    processes: int
+
+    @property
+    def tier(self) -> str:
+        return f"{self.model_size}:{self.beam_size}:{self.compute_type}"
+
+
+class TuneResult(NamedTuple):
+    setting: TuneSetting
+    rtf: float
+    throughput: float
+    p95: float
+    audio_seconds: float
+    wall_seconds: float
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            **self.setting._asdict(),
+            "rtf": round(self.rtf, 4),
+            "throughput": round(self.throughput, 3),
+            "p95_seconds": round(self.p95, 4),
+            "audio_seconds": round(self.audio_seconds, 2),
+            "wall_seconds": round(self.wall_seconds, 2),
+        }
+
+
+def build_grid(
+    sizes: Sequence[str],
+    compute_types: Sequence[str],
+    threads: Sequence[int],
+    beams: Sequence[int],
+    processes: Sequence[int],
+    cpu_count: Optional[int] = None,
+) -> list[TuneSetting]:
+    """Every combination, minus those asking for more threads than `cpu_count` cores."""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return [
+        TuneSetting(*combo)
+        for combo in itertools.product(sizes, compute_types, threads, beams, processes)
+        if combo[2] * combo[4] <= cpu_count
+    ]
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# -------------------------------------------------
+# CORPUS
+# -------------------------------------------------
+def corpus_files(directory: str) -> list[str]:
+    """Audio/media files under `directory`, sorted."""
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def load_chunks(paths: Iterable[str], chunk_seconds: float, max_seconds: Optional[float] = None) -> list:
+    """Decode `paths` to 16 kHz mono and cut them into chunks of `chunk_seconds`."""
+    from faster_whisper import decode_audio
+
+    size = int(chunk_seconds * SAMPLE_RATE)
+    chunks = []
+    total = 0
+    for path in paths:
+        samples = decode_audio(path, sampling_rate=SAMPLE_RATE)
+        for start in range(0, len(samples), size):
+            chunk = samples[start:start + size]
+            if len(chunk) < SAMPLE_RATE // 2:
+                continue  # trailing sliver; not representative
+            chunks.append(chunk)
+            total += len(chunk)
+            if max_seconds is not None and total >= max_seconds * SAMPLE_RATE:
+                return chunks
+    return chunks
+
+
+# -------------------------------------------------
+# MEASUREMENT (one model per worker process)
+# -------------------------------------------------
+_worker_model = None
+
+
+def _init_worker(model_size: str, compute_type: str, cpu_threads: int, device: str) -> None:
+    global _worker_model
+    from faster_whisper import WhisperModel
+
+    _worker_model = WhisperModel(
+        model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads, num_workers=1
+    )
+
+
+def _transcribe(args) -> float:
+    samples, beam_size = args
+    started = time.perf_counter()
+    segments, _ = _worker_model.transcribe(samples, beam_size=beam_size, vad_filter=True)
+    for _ in segments:  # decoding happens while iterating
+        pass
+    return time.perf_counter() - started
+
+
+def measure(setting: TuneSetting, chunks: list, device: str = "cpu") -> TuneResult:
+    """Transcribe every chunk with `setting.processes` worker processes."""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(
+        setting.processes,
+        initializer=_init_worker,
+        initargs=(setting.model_size, setting.compute_type, setting.cpu_threads, device),
+    ) as pool:
+        # Warm up every worker so model load time is not measured.
+        pool.map(_transcribe, [(chunks[0], setting.beam_size)] * setting.processes, chunksize=1)
+        started = time.perf_counter()
+        latencies = pool.map(_transcribe, [(chunk, setting.beam_size) for chunk in chunks], chunksize=1)
+        wall = time.perf_counter() - started
+
+    audio = sum(len(chunk) for chunk in chunks) / SAMPLE_RATE
+    return TuneResult(
+        setting=setting,
+        rtf=sum(latencies) / audio if audio else 0.0,
+        throughput=audio / wall if wall else 0.0,
+        p95=percentile(latencies, 0.95),
+        audio_seconds=audio,
+        wall_seconds=wall,
+    )
+
+
+# -------------------------------------------------
+# RECOMMENDATION AND CONFIG FILE
+# -------------------------------------------------
+def _quality(setting: TuneSetting) -> tuple:
+    family = setting.model_size.split(".")[0].split("-")[0]
+    return (memory.WHISPER_PARAMS.get(family, 0), setting.beam_size)
+
+
+def recommend(results: Sequence[TuneResult], max_p95: float) -> Optional[TuneResult]:
+    """Best quality with p95 <= max_p95 (by throughput on ties); else the fastest setting."""
+    if not results:
+        return None
+    fitting = [r for r in results if r.p95 <= max_p95 and r.rtf < 1.0]
+    if not fitting:
+        return max(results, key=lambda r: r.throughput)
+    return max(fitting, key=lambda r: (_quality(r.setting), r.throughput))
+
+
+def tier_ladder(results: Sequence[TuneResult], best: TuneResult, max_p95: float) -> list[str]:
+    """ISWEEP_ASR_TIERS: the recommended tier, then cheaper measured tiers that also fit."""
+    ladder = [best.setting.tier]
+    cheaper = sorted(
+        (r for r in results if r.p95 <= max_p95 and _quality(r.setting) < _quality(best.setting)),
+        key=lambda r: _quality(r.setting),
+        reverse=True,
+    )
+    for result in cheaper:
+        if result.setting.tier not in ladder:
+            ladder.append(result.setting.tier)
+    if len(ladder) == 1:
+        fastest = min(results, key=lambda r: r.p95)
+        if fastest.setting.tier not in ladder:
+            ladder.append(fastest.setting.tier)
+    return ladder
+
+
+def config_env(results: Sequence[TuneResult], best: TuneResult, max_p95: float) -> dict[str, str]:
+    """Environment defaults for the recommended setting."""
+    setting = best.setting
+    return {
+        "WHISPER_MODEL_SIZE": setting.model_size,
+        "WHISPER_COMPUTE_TYPE": setting.compute_type,
+        "WHISPER_CPU_THREADS": str(setting.cpu_threads),
+        "ISWEEP_ASR_TIERS": ",".join(tier_ladder(results, best, max_p95)),
+        "ISWEEP_ASR_TIER_START": setting.tier,
+        "ISWEEP_WORKERS": str(setting.processes),
+    }
+
+
+def write_config(path: str, results: Sequence[TuneResult], best: TuneResult, max_p95: float) -> dict[str, Any]:
+    config = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "max_p95_seconds": max_p95,
+        "recommended": best.as_dict(),
+        "env": config_env(results, best, max_p95),
+        "results": [r.as_dict() for r in results],
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp, path)
+    return config
+
+
+def load_tuned_config(path: Optional[str] = None) -> dict[str, str]:
+    """Apply a tuned config's environment defaults; returns the variables it set.
+
+    Variables already in the environment are left alone, so an explicit
+    setting always overrides the tuned one. Variables that only make sense
+    together (TIED_VARIABLES) are applied as a unit: if any of them is set
+    explicitly, none of them is taken from the tuned config.
+    """
+    path = path or os.getenv("ISWEEP_ASR_CONFIG", DEFAULT_CONFIG_PATH)
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            env = json.load(f).get("env", {})
+    except (OSError, ValueError, AttributeError):
+        logger.warning("Ignoring unreadable tuned ASR config", extra={"path": path}, exc_info=True)
+        return {}
+    applied = {}
+    for name, value in env.items():
+        if name in os.environ:
+            continue
+        tied = next((group for group in TIED_VARIABLES if name in group), ())
+        if any(other in os.environ and other not in applied for other in tied):
+            logger.info("Skipping tuned ASR setting overridden as a group", extra={"variable": name})
+            continue
+        os.environ[name] = applied[name] = str(value)
+    if applied:
+        logger.info("Applied tuned ASR config", extra={"path": path, "env": applied})
+    return applied
+
+
+def run(
+    grid: Sequence[TuneSetting],
+    chunks: list,
+    device: str = "cpu",
+    on_result: Optional[Callable[[TuneResult], None]] = None,
+    measure_fn: Callable[..., TuneResult] = measure,
+) -> list[TuneResult]:
+    """Measure every setting of `grid`; a failing setting is logged and skipped."""
+    results = []
+    for setting in grid:
+        try:
+            result = measure_fn(setting, chunks, device)
+        except Exception:
+            logger.exception("Tuning run failed", extra={"setting": setting._asdict()})
+            continue
+        results.append(result)
+        if on_result:
+            on_result(result)
+    return results
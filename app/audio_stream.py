@@ -0,0 +1,525 @@
+"""
+Streaming audio decoding per ASR session.
+
+MediaRecorder sends the WebM header (EBML header, Segment, Tracks) only in
+its first chunk; later chunks are bare Cluster data. Decoding each chunk as
+a standalone file breaks on those chunks, and re-joining every buffered
+chunk re-parses everything. An AudioStream instead keeps container and
+codec state across chunks: each chunk is demuxed incrementally, only its new
+Opus packets are decoded, and the resulting 16 kHz mono float32 samples are
+appended to a NumPy ring buffer that ASR reads from.
+
+Accepted mime types:
+  audio/webm;codecs=opus         MediaRecorder chunks (header in the first one)
+  audio/opus[;rate=..;channels=..]
+                                 raw Opus packets, each prefixed with its
+                                 length as a big-endian uint16
+  audio/pcm[;rate=..;channels=..]  16-bit little-endian PCM
+  audio/l16[;rate=..;channels=..]  16-bit big-endian PCM (RFC 2586)
+
+Decoding needs numpy and PyAV (both installed with faster-whisper); callers
+check `available()` and fall back to file-based decoding otherwise.
+
+Environment:
+  ISWEEP_AUDIO_RING_SECONDS  decoded audio kept per session (default 60)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import threading
+from typing import Any, Optional
+
+from .metrics import REGISTRY
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on environment
+    np = None
+
+try:
+    import av
+except ImportError:  # pragma: no cover - depends on environment
+    av = None
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+RING_SECONDS = float(os.getenv("ISWEEP_AUDIO_RING_SECONDS", "60"))
+
+# Largest element we buffer whole (blocks, codec private data).
+MAX_ELEMENT_BYTES = 16 * 1024 * 1024
+
+DECODED_SECONDS = REGISTRY.counter(
+    "isweep_audio_decoded_seconds_total", "Audio decoded by session streams, in seconds", ("format",)
+)
+DEMUX_RESYNCS = REGISTRY.counter("isweep_audio_demux_resyncs_total", "WebM parse errors that forced a resync")
+RING_OVERRUNS = REGISTRY.counter(
+    "isweep_audio_ring_overrun_seconds_total", "Unconsumed audio overwritten in session ring buffers, in seconds"
+)
+
+
+def available() -> bool:
+    """True when numpy and PyAV are installed."""
+    return np is not None and av is not None
+
+
+def parse_mime_type(mime_type: Optional[str]) -> tuple[str, dict[str, str]]:
+    """("audio/webm", {"codecs": "opus"}) from "audio/webm;codecs=opus"."""
+    parts = [p.strip() for p in (mime_type or "audio/webm").split(";")]
+    params = {}
+    for part in parts[1:]:
+        if "=" in part:
+            name, value = part.split("=", 1)
+            params[name.strip().lower()] = value.strip().strip('"').lower()
+    return parts[0].lower(), params
+
+
+def supports(mime_type: Optional[str]) -> bool:
+    """Whether an AudioStream can decode `mime_type` (given available())."""
+    kind, params = parse_mime_type(mime_type)
+    if kind == "audio/webm":
+        return params.get("codecs", "opus") == "opus"
+    return kind in ("audio/opus", "audio/pcm", "audio/l16")
+
+
+# =========================================================
+# RING BUFFER
+# =========================================================
+class PCMRingBuffer:
+    """Fixed-capacity float32 sample ring addressed by absolute sample index."""
+
+    def __init__(self, seconds: float = RING_SECONDS, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.capacity = max(1, int(seconds * sample_rate))
+        self._data = np.zeros(self.capacity, dtype=np.float32)
+        self.written = 0  # total samples ever appended
+
+    @property
+    def oldest(self) -> int:
+        """Absolute index of the oldest sample still held."""
+        return max(0, self.written - self.capacity)
+
+    def append(self, samples: "np.ndarray") -> None:
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:n - first] = samples[first:]
+        self.written += n
+
+    def read(self, start: int, end: Optional[int] = None) -> "np.ndarray":
+        """Copy of samples [start, end) (clamped to what is still held)."""
+        end = self.written if end is None else min(end, self.written)
+        start = max(start, self.oldest)
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+        i, j = start % self.capacity, end % self.capacity
+        if i < j:
+            return self._data[i:j].copy()
+        return np.concatenate((self._data[i:], self._data[:j]))
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+
+# =========================================================
+# WEBM (EBML) DEMUXER
+# =========================================================
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+CLUSTER = 0x1F43B675
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+AUDIO = 0xE1
+BLOCK_GROUP = 0xA0
+SIMPLE_BLOCK = 0xA3
+BLOCK = 0xA1
+TRACK_NUMBER = 0xD7
+CODEC_ID = 0x86
+CODEC_PRIVATE = 0x63A2
+SAMPLING_FREQUENCY = 0xB5
+CHANNELS = 0x9F
+
+# Containers we step into rather than skip; their end is never tracked, the
+# children simply follow in the byte stream.
+_MASTERS = {SEGMENT, CLUSTER, TRACKS, TRACK_ENTRY, AUDIO, BLOCK_GROUP}
+_LEAVES = {SIMPLE_BLOCK, BLOCK, TRACK_NUMBER, CODEC_ID, CODEC_PRIVATE, SAMPLING_FREQUENCY, CHANNELS}
+_RESYNC_MARKERS = (struct.pack(">I", CLUSTER), struct.pack(">I", EBML_HEADER))
+
+
+class DemuxError(ValueError):
+    """Malformed WebM data."""
+
+
+def _read_vint(buf: bytearray, pos: int, keep_marker: bool) -> Optional[tuple[int, int, bool]]:
+    """(value, length, is_unknown_size) of the EBML varint at `pos`, or None if incomplete."""
+    if pos >= len(buf):
+        return None
+    first = buf[pos]
+    if first == 0:
+        raise DemuxError("invalid EBML varint")
+    length = 9 - first.bit_length()
+    if pos + length > len(buf):
+        return None
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in buf[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, length, unknown
+
+
+def _block_frames(payload: bytes) -> tuple[int, list[bytes]]:
+    """Track number and frames of a (Simple)Block, handling all lacing modes."""
+    head = _read_vint(bytearray(payload[:8]), 0, keep_marker=False)
+    if head is None or len(payload) < head[1] + 3:
+        raise DemuxError("truncated block")
+    track, n, _ = head
+    flags = payload[n + 2]
+    data = payload[n + 3:]
+    lacing = (flags >> 1) & 0x03
+    if lacing == 0:
+        return track, [data]
+
+    count = data[0] + 1
+    pos = 1
+    sizes: list[int] = []
+    if lacing == 1:  # Xiph
+        for _ in range(count - 1):
+            size = 0
+            while True:
+                byte = data[pos]
+                pos += 1
+                size += byte
+                if byte != 255:
+                    break
+            sizes.append(size)
+    elif lacing == 3:  # EBML
+        buf = bytearray(data)
+        size, length, _ = _read_vint(buf, pos, keep_marker=False)
+        pos += length
+        sizes.append(size)
+        for _ in range(count - 2):
+            raw, length, _ = _read_vint(buf, pos, keep_marker=False)
+            pos += length
+            size += raw - ((1 << (7 * length - 1)) - 1)
+            sizes.append(size)
+    else:  # fixed
+        if (len(data) - 1) % count:
+            raise DemuxError("bad fixed-size lacing")
+        sizes = [(len(data) - 1) // count] * (count - 1)
+
+    frames = []
+    for size in sizes:
+        frames.append(bytes(data[pos:pos + size]))
+        pos += size
+    if pos > len(data):
+        raise DemuxError("laced frames exceed block")
+    frames.append(bytes(data[pos:]))
+    return track, frames
+
+
+class WebMDemuxer:
+    """Incremental WebM parser that yields the Opus packets of the audio track.
+
+    Bytes can be fed in arbitrary pieces; incomplete elements wait for the
+    next feed. A new EBML header (the recorder restarted) resets the track
+    state; malformed data is skipped up to the next Cluster or EBML header.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._skip = 0
+        self._entry: Optional[dict[str, Any]] = None
+        self._lost_sync = False
+        self.audio_track: Optional[dict[str, Any]] = None
+        self.generation = 0  # bumped on each EBML header (new codec context needed)
+
+    @property
+    def codec_private(self) -> Optional[bytes]:
+        return self.audio_track.get("private") if self.audio_track else None
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Append `data`; return the complete audio packets now available."""
+        self._buf += data
+        if self._lost_sync:
+            positions = [p for p in (self._buf.find(m) for m in _RESYNC_MARKERS) if p >= 0]
+            if not positions:
+                del self._buf[:max(0, len(self._buf) - 3)]
+                return []
+            del self._buf[:min(positions)]
+            self._lost_sync = False
+        packets: list[bytes] = []
+        while True:
+            try:
+                if not self._step(packets):
+                    break
+            except (DemuxError, IndexError):
+                DEMUX_RESYNCS.inc()
+                self._resync()
+        return packets
+
+    def _step(self, packets: list[bytes]) -> bool:
+        buf = self._buf
+        if self._skip:
+            dropped = min(self._skip, len(buf))
+            del buf[:dropped]
+            self._skip -= dropped
+            if self._skip:
+                return False
+        head = _read_vint(buf, 0, keep_marker=True)
+        if head is None:
+            return False
+        element_id, id_len, _ = head
+        size_info = _read_vint(buf, id_len, keep_marker=False)
+        if size_info is None:
+            return False
+        size, size_len, unknown = size_info
+        header_len = id_len + size_len
+
+        if element_id in _MASTERS:
+            if element_id == TRACK_ENTRY:
+                self._entry = {}
+            del buf[:header_len]
+            return True
+        if unknown:
+            raise DemuxError(f"unknown-size element 0x{element_id:X}")
+        if element_id == EBML_HEADER:
+            self._entry = None
+            self.audio_track = None
+            self.generation += 1
+        if element_id not in _LEAVES or size > MAX_ELEMENT_BYTES:
+            del buf[:header_len]
+            self._skip = size
+            return True
+        if len(buf) < header_len + size:
+            return False
+        payload = bytes(buf[header_len:header_len + size])
+        del buf[:header_len + size]
+        self._leaf(element_id, payload, packets)
+        return True
+
+    def _leaf(self, element_id: int, payload: bytes, packets: list[bytes]) -> None:
+        if element_id in (SIMPLE_BLOCK, BLOCK):
+            if self.audio_track is None:
+                return
+            track, frames = _block_frames(payload)
+            if track == self.audio_track.get("number", track):
+                packets.extend(f for f in frames if f)
+            return
+        entry = self._entry
+        if entry is None:
+            return
+        if element_id == TRACK_NUMBER:
+            entry["number"] = int.from_bytes(payload, "big")
+        elif element_id == CODEC_ID:
+            entry["codec"] = payload.rstrip(b"\x00").decode("ascii", "replace")
+            if entry["codec"] == "A_OPUS" and self.audio_track is None:
+                self.audio_track = entry
+        elif element_id == CODEC_PRIVATE:
+            entry["private"] = payload
+        elif element_id == SAMPLING_FREQUENCY:
+            entry["rate"] = struct.unpack(">f" if len(payload) == 4 else ">d", payload)[0]
+        elif element_id == CHANNELS:
+            entry["channels"] = int.from_bytes(payload, "big")
+
+    def discontinuity(self) -> None:
+        """The next bytes do not follow the previous ones (chunks were lost).
+
+        The partial element is dropped and parsing restarts at the next
+        Cluster or EBML header.
+        """
+        self._buf.clear()
+        self._skip = 0
+        self._lost_sync = True
+
+    def _resync(self) -> None:
+        self._skip = 0
+        positions = [p for p in (self._buf.find(m, 1) for m in _RESYNC_MARKERS) if p > 0]
+        if positions:
+            del self._buf[:min(positions)]
+        else:
+            # Keep a few bytes in case a marker is split across chunks.
+            del self._buf[:max(0, len(self._buf) - 3)]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buf)
+
+
+# =========================================================
+# DECODERS
+# =========================================================
+class _OpusDecoder:
+    """Persistent Opus decoder + resampler to 16 kHz mono float32."""
+
+    def __init__(self, extradata: Optional[bytes] = None, channels: int = 1):
+        name = "libopus" if "libopus" in av.codecs_available else "opus"
+        self._ctx = av.CodecContext.create(name, "r")
+        self._ctx.sample_rate = 48000
+        if extradata:
+            self._ctx.extradata = extradata
+        else:
+            self._ctx.layout = "stereo" if channels == 2 else "mono"
+        self._resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+
+    def decode(self, packets: list[bytes]) -> "np.ndarray":
+        out = []
+        for packet in packets:
+            try:
+                frames = self._ctx.decode(av.Packet(packet))
+            except av.error.FFmpegError:
+                continue  # corrupt packet: Opus recovers on the next one
+            for frame in frames:
+                for resampled in self._resampler.resample(frame):
+                    out.append(resampled.to_ndarray().reshape(-1))
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+
+def _resample_linear(samples: "np.ndarray", rate: int) -> "np.ndarray":
+    if rate == SAMPLE_RATE or len(samples) == 0:
+        return samples
+    n_out = int(round(len(samples) * SAMPLE_RATE / rate))
+    positions = np.linspace(0, len(samples) - 1, n_out)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+class AudioStream:
+    """Decoded audio for one session; see module docstring.
+
+    `peek_new()` returns the audio not yet consumed and `consume()` marks it
+    used, so a failed transcription can retry the same audio.
+    """
+
+    def __init__(self, mime_type: Optional[str], ring_seconds: float = RING_SECONDS):
+        if not available():
+            raise RuntimeError("numpy and PyAV are required for streaming audio decoding")
+        kind, params = parse_mime_type(mime_type)
+        if not supports(mime_type):
+            raise ValueError(f"Unsupported audio mime type: {mime_type!r}")
+        self.mime_type = mime_type
+        self.kind = kind
+        self.rate = int(params.get("rate", "48000" if kind == "audio/opus" else str(SAMPLE_RATE)))
+        self.channels = int(params.get("channels", "1"))
+        self.ring = PCMRingBuffer(ring_seconds)
+        self.consumed = 0
+        self.chunks_pending = 0
+        self._demuxer = WebMDemuxer() if kind == "audio/webm" else None
+        self._generation = -1
+        self._decoder: Optional[_OpusDecoder] = _OpusDecoder(channels=self.channels) if kind == "audio/opus" else None
+        self._pending = b""  # partial length-prefixed Opus packet or odd PCM byte
+        self._lock = threading.Lock()
+
+    def feed(self, data: bytes) -> int:
+        """Decode a chunk; returns the number of new 16 kHz samples."""
+        with self._lock:
+            samples = self._decode(data)
+            self.chunks_pending += 1
+            if len(samples):
+                overrun = max(0, self.ring.written + len(samples) - self.ring.capacity - self.consumed)
+                if overrun:
+                    RING_OVERRUNS.inc(overrun / SAMPLE_RATE)
+                self.ring.append(samples)
+                DECODED_SECONDS.inc(len(samples) / SAMPLE_RATE, format=self.kind)
+            return len(samples)
+
+    def _decode(self, data: bytes) -> "np.ndarray":
+        if self._demuxer is not None:
+            packets = self._demuxer.feed(data)
+            # Create the decoder with the first packets, once CodecPrivate (OpusHead) has been seen.
+            if packets and self._demuxer.generation != self._generation:
+                track = self._demuxer.audio_track
+                self._decoder = _OpusDecoder(self._demuxer.codec_private, int(track.get("channels", 1)))
+                self._generation = self._demuxer.generation
+            if self._decoder is None:
+                return np.zeros(0, dtype=np.float32)
+            return self._decoder.decode(packets)
+
+        data = self._pending + data
+        if self.kind == "audio/opus":
+            packets = []
+            pos = 0
+            while pos + 2 <= len(data):
+                (length,) = struct.unpack_from(">H", data, pos)
+                if pos + 2 + length > len(data):
+                    break
+                packets.append(data[pos + 2:pos + 2 + length])
+                pos += 2 + length
+            self._pending = data[pos:]
+            return self._decoder.decode(packets)
+
+        frame_bytes = 2 * self.channels
+        usable = len(data) - len(data) % frame_bytes
+        self._pending = data[usable:]
+        dtype = "<i2" if self.kind == "audio/pcm" else ">i2"
+        pcm = np.frombuffer(data[:usable], dtype=dtype).astype(np.float32) / 32768.0
+        if self.channels > 1:
+            pcm = pcm.reshape(-1, self.channels).mean(axis=1)
+        return _resample_linear(pcm, self.rate)
+
+    def discontinuity(self) -> None:
+        """Chunks between the last fed one and the next were lost (see app/jitter_buffer.py)."""
+        with self._lock:
+            self._pending = b""
+            if self._demuxer is not None:
+                self._demuxer.discontinuity()
+
+    def peek_new(self) -> tuple["np.ndarray", float, int]:
+        """(samples, start_seconds, end_index) of audio not yet consumed.
+
+        start_seconds is relative to the start of the stream.
+        """
+        with self._lock:
+            start = max(self.consumed, self.ring.oldest)
+            end = self.ring.written
+            return self.ring.read(start, end), start / SAMPLE_RATE, end
+
+    def consume(self, end_index: int) -> None:
+        """Mark audio up to `end_index` (from peek_new) as transcribed."""
+        with self._lock:
+            self.consumed = max(self.consumed, end_index)
+            self.chunks_pending = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.ring.nbytes + (self._demuxer.nbytes if self._demuxer else 0) + len(self._pending)
+
+
+# =========================================================
+# FILES
+# =========================================================
+def iter_file_windows(path: str, window_seconds: float = 30.0):
+    """Decode any media file PyAV reads, yielding (start_seconds, samples) windows.
+
+    Samples are 16 kHz mono float32; at most one window (plus one decoded
+    frame) is held at a time, so long files are never fully in memory.
+    """
+    window = int(window_seconds * SAMPLE_RATE)
+    with av.open(path) as container:
+        stream = container.streams.audio[0]
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+        parts: list = []
+        buffered = 0
+        start = 0
+
+        def frames():
+            for frame in container.decode(stream):
+                yield from resampler.resample(frame)
+            yield from resampler.resample(None)  # flush
+
+        for frame in frames():
+            samples = frame.to_ndarray().reshape(-1)
+            parts.append(samples)
+            buffered += len(samples)
+            while buffered >= window:
+                joined = np.concatenate(parts)
+                yield start / SAMPLE_RATE, joined[:window]
+                start += window
+                rest = joined[window:]
+                parts, buffered = [rest], len(rest)
+        if buffered:
+            yield start / SAMPLE_RATE, np.concatenate(parts)
@@ -0,0 +1,233 @@
+"""
+Offline batch transcription of a media catalog.
+
+`python -m app transcribe <media_dir>` walks the directory and transcribes
+every audio/media file so mute timelines exist before anyone watches:
+
+  - a pool of worker processes, each holding one Whisper model (the same
+    model settings as the backend, including a tuned config)
+  - files are decoded in windows (audio_stream.iter_file_windows), so long
+    files are never fully in memory; the language pin and transcript tail
+    carry across windows like a live session (app/asr_sessions.py)
+  - each file gets a WebVTT transcript under the output directory, and its
+    segments go to the shared transcript store (app/transcript_index.py)
+    with the file's path relative to the media directory as media_id
+  - finished files are appended to a manifest; a re-run skips files whose
+    size and mtime match, so an interrupted run resumes where it stopped
+
+Throughput is reported as audio-hours per wall-hour.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from .asr_sessions import SessionState
+from .asr_tuning import corpus_files
+from .transcript_index import store_transcript
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.jsonl"
+WINDOW_SECONDS = 30.0
+
+
+class BatchProgress:
+    """Running totals for a batch run."""
+
+    def __init__(self, total: int = 0, skipped: int = 0):
+        self.started = time.perf_counter()
+        self.total = total
+        self.skipped = skipped
+        self.files = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.errors: list[dict] = []
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def audio_hours_per_hour(self) -> float:
+        elapsed = self.elapsed
+        return self.audio_seconds / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "files": self.files,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "audio_hours": round(self.audio_seconds / 3600, 3),
+            "elapsed_seconds": round(self.elapsed, 1),
+            "audio_hours_per_hour": round(self.audio_hours_per_hour, 2),
+        }
+
+
+# -------------------------------------------------
+# WEBVTT
+# -------------------------------------------------
+def _vtt_timestamp(seconds: float) -> str:
+    millis = int(round(max(0.0, seconds) * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def format_vtt(segments: Iterable[dict]) -> str:
+    """WebVTT document for segment dicts (text, start_seconds, end_seconds)."""
+    cues = ["WEBVTT", ""]
+    for segment in segments:
+        cues.append(f"{_vtt_timestamp(segment['start_seconds'])} --> {_vtt_timestamp(segment['end_seconds'])}")
+        # A blank line would end the cue early.
+        cues.append(" ".join(segment["text"].split()))
+        cues.append("")
+    return "\n".join(cues)
+
+
+# -------------------------------------------------
+# MANIFEST (resume)
+# -------------------------------------------------
+class Manifest:
+    """Append-only record of finished files, keyed by relative path."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._done: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by an interrupted run
+                    self._done[entry["media_id"]] = entry
+
+    def is_done(self, media_id: str, stat: os.stat_result) -> bool:
+        entry = self._done.get(media_id)
+        return entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+
+    def record(self, media_id: str, stat: os.stat_result, **details: Any) -> None:
+        entry = {"media_id": media_id, "size": stat.st_size, "mtime": stat.st_mtime, **details}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._done[media_id] = entry
+
+
+# -------------------------------------------------
+# WORKERS (one model per process)
+# -------------------------------------------------
+def transcribe_file(path: str, beam_size: int = 5, language: Optional[str] = None) -> dict[str, Any]:
+    """Transcribe one file window by window with this process's model."""
+    from . import asr_service
+    from .audio_stream import SAMPLE_RATE, iter_file_windows
+
+    model = asr_service.get_model()
+    session = SessionState()
+    segments: list[dict] = []
+    audio_seconds = 0.0
+    detected = None
+    for start, samples in iter_file_windows(path, WINDOW_SECONDS):
+        audio_seconds = start + len(samples) / SAMPLE_RATE
+        options = session.options(language)
+        results, info = model.transcribe(
+            samples,
+            beam_size=beam_size,
+            language=options.language,
+            initial_prompt=options.initial_prompt,
+            vad_filter=True,
+        )
+        texts = []
+        for seg in results:
+            text = (seg.text or "").strip()
+            if not text:
+                continue
+            texts.append(text)
+            segments.append({
+                "text": text,
+                "start_seconds": max(0.0, float(seg.start) + start),
+                "end_seconds": max(0.0, float(seg.end) + start),
+            })
+        detected = getattr(info, "language", None) or detected
+        session.update(options, detected, getattr(info, "language_probability", None), " ".join(texts))
+    return {"segments": segments, "audio_seconds": audio_seconds, "language": session.language or detected}
+
+
+def _worker(task: tuple) -> dict[str, Any]:
+    path, beam_size, language = task
+    try:
+        return {"path": path, **transcribe_file(path, beam_size, language)}
+    except Exception as exc:
+        logger.exception("Batch transcription failed", extra={"path": path})
+        return {"path": path, "error": str(exc) or type(exc).__name__}
+
+
+def _write_atomic(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def transcribe_directory(
+    media_dir: str,
+    output_dir: str,
+    db: Session,
+    processes: int = 1,
+    beam_size: int = 5,
+    language: Optional[str] = None,
+    on_file: Optional[Callable[[BatchProgress, dict], None]] = None,
+) -> BatchProgress:
+    """Transcribe every file under `media_dir` not already in the manifest."""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+
+    pending: list[tuple[str, str, os.stat_result]] = []
+    files = corpus_files(media_dir)
+    for path in files:
+        media_id = os.path.relpath(path, media_dir).replace(os.sep, "/")
+        stat = os.stat(path)
+        if not manifest.is_done(media_id, stat):
+            pending.append((path, media_id, stat))
+    progress = BatchProgress(total=len(files), skipped=len(files) - len(pending))
+    by_path = {path: (media_id, stat) for path, media_id, stat in pending}
+    tasks = [(path, beam_size, language) for path, _, _ in pending]
+
+    def finish(result: dict) -> None:
+        media_id, stat = by_path[result["path"]]
+        if "error" in result:
+            progress.failed += 1
+            progress.errors.append({"media_id": media_id, "error": result["error"]})
+        else:
+            _write_atomic(os.path.join(output_dir, media_id + ".vtt"), format_vtt(result["segments"]))
+            store_transcript(db, media_id, result["segments"], source="asr")
+            manifest.record(
+                media_id, stat, audio_seconds=round(result["audio_seconds"], 3), language=result["language"]
+            )
+            progress.files += 1
+            progress.audio_seconds += result["audio_seconds"]
+        if on_file:
+            on_file(progress, {"media_id": media_id, **result})
+
+    if processes <= 1:
+        for task in tasks:
+            finish(_worker(task))
+    elif tasks:
+        # Results are written by this process only: one SQLite writer, one manifest writer.
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            for result in pool.imap_unordered(_worker, tasks, chunksize=1):
+                finish(result)
+    logger.info("Batch transcription finished", extra=progress.as_dict())
+    return progress
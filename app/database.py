@@ -54,6 +54,59 @@ class PreferenceDB(Base):
         return f"<PreferenceDB(user={self.user_id}, category={self.category})>"
 
 
+class PreferenceChangeDB(Base):
+    """Append-only change feed for preferences.
+
+    Every preference write inserts a row in the same transaction. Worker
+    processes poll for ids above the last one they saw to invalidate their
+    caches, and a user's highest id serves as their preference version.
+    """
+    __tablename__ = "preference_changes"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, index=True, nullable=False)
+    changed_at = Column(Float, nullable=False)
+
+    def __repr__(self):
+        return f"<PreferenceChangeDB(id={self.id}, user={self.user_id})>"
+
+
+class MediaCueDB(Base):
+    """One caption cue or transcript segment of a media item.
+
+    `cue_index` is the cue's position within the media item; together with
+    `media_id` it identifies the cue in media_tokens.
+    """
+    __tablename__ = "media_cues"
+
+    media_id = Column(String, primary_key=True)
+    cue_index = Column(Integer, primary_key=True)
+    start_seconds = Column(Float, nullable=False)
+    end_seconds = Column(Float, nullable=False)
+    text = Column(String, nullable=False)
+    source = Column(String, default="captions")  # "captions" or "asr"
+
+    def __repr__(self):
+        return f"<MediaCueDB(media={self.media_id}, cue={self.cue_index})>"
+
+
+class MediaTokenDB(Base):
+    """Inverted index: normalized token -> cues of a media item that contain it.
+
+    The primary key doubles as the lookup index, and WITHOUT ROWID keeps the
+    table to that one b-tree.
+    """
+    __tablename__ = "media_tokens"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    media_id = Column(String, primary_key=True)
+    token = Column(String, primary_key=True)
+    cue_index = Column(Integer, primary_key=True)
+
+    def __repr__(self):
+        return f"<MediaTokenDB(media={self.media_id}, token={self.token}, cue={self.cue_index})>"
+
+
 def migrate_db():
     """Add missing columns to existing database tables."""
     inspector = inspect(engine)
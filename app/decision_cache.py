@@ -0,0 +1,151 @@
+"""
+Memoized decisions for repeated caption lines and ASR segments.
+
+Captions repeat a lot ("[Music]", "Yeah.", catchphrases). rules.decide()
+looks decisions up in a bounded LRU keyed by
+
+    (user_id, preference version, normalized text, content_type, confidence bucket)
+
+The preference version (see app/pref_cache.py) changes on every write, so
+entries never outlive the preferences they were computed from; entries for a
+user are also dropped as soon as their cached preferences are invalidated.
+The confidence bucket only records which side of the threshold the
+confidence falls on; decisions whose reason echoes the exact confidence are
+re-rendered on a hit, so cached responses are identical to uncached ones.
+
+Caches are kept per database engine, like the preference cache.
+
+Environment:
+  ISWEEP_DECISION_CACHE_SIZE  max memoized decisions per worker (default 20000, 0 disables)
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from sqlalchemy.orm import Session
+
+from . import memory
+from .metrics import REGISTRY
+from .pref_cache import cache_for
+
+CACHE_SIZE = int(os.getenv("ISWEEP_DECISION_CACHE_SIZE", "20000"))
+
+LOOKUPS = REGISTRY.counter("isweep_decision_cache_lookups_total", "Decision cache lookups", ("result",))
+
+
+class DecisionCache:
+    """LRU of decisions; values are opaque to the cache."""
+
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._by_user: dict[str, set[tuple]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: tuple) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        LOOKUPS.inc(result="miss" if value is None else "hit")
+        return value
+
+    def put(self, key: tuple, user_id: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._forget(evicted)
+
+    def _forget(self, key: tuple) -> None:
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every decision memoized for `user_id`."""
+        with self._lock:
+            for key in self._by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def nbytes(self) -> int:
+        with self._lock:
+            keys = list(self._entries)
+        # Keys hold the normalized text; decisions are small fixed-size models.
+        return sum(sys.getsizeof(k[2] or "") + 400 for k in keys)
+
+
+_caches: "weakref.WeakKeyDictionary[Any, DecisionCache]" = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def cache_key(
+    user_id: str,
+    version: int,
+    normalized_text: Optional[str],
+    content_type: Optional[str],
+    confidence_bucket: Hashable,
+) -> tuple:
+    return (user_id, version, normalized_text, content_type, confidence_bucket)
+
+
+def decision_cache_for(db: Session) -> DecisionCache:
+    """The decision cache for the database `db` is bound to."""
+    bind = db.get_bind()
+    with _caches_lock:
+        cache = _caches.get(bind)
+        if cache is None:
+            cache = _caches[bind] = DecisionCache()
+            cache_for(db).add_invalidation_listener(cache.invalidate_user)
+        return cache
+
+
+def _hit_rate_gauge():
+    with _caches_lock:
+        caches = list(_caches.values())
+    hits = sum(c.hits for c in caches)
+    total = hits + sum(c.misses for c in caches)
+    yield (), hits / total if total else 0.0
+
+
+REGISTRY.gauge("isweep_decision_cache_hit_ratio", "Decision cache hit rate since start", callback=_hit_rate_gauge)
+
+
+def _caches_memory() -> dict:
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {
+        "bytes": sum(c.nbytes() for c in caches),
+        "entries": sum(len(c) for c in caches),
+        "hit_rate": round(sum(c.hits for c in caches) / max(1, sum(c.hits + c.misses for c in caches)), 4),
+    }
+
+
+memory.register_reporter("decision_cache.entries", _caches_memory)
@@ -0,0 +1,169 @@
+"""
+Sequence-aware jitter buffer for ASR chunks of one session.
+
+Concurrent /asr/stream POSTs from a tab can arrive out of order, and the
+session's AudioStream (app/audio_stream.py) decodes whatever it is fed in
+arrival order: a Cluster fed before its predecessor decodes as garbage, and
+the model then spends a slot on it. A JitterBuffer sits in front of the
+stream and hands out chunks strictly by seq:
+
+  - a chunk whose predecessors are all released is released at once, along
+    with any later chunks that were waiting for it
+  - a chunk after a gap is held; the gap is given up once the oldest held
+    chunk has waited ISWEEP_ASR_JITTER_MS, or once more than
+    ISWEEP_ASR_JITTER_CHUNKS are held. The missing seqs are released as a
+    Gap marker, so the consumer knows the audio is discontinuous
+  - a chunk arriving after its seq was given up (late) is rejected
+  - a seq far behind the buffer means the client restarted its numbering;
+    the buffer starts over from it
+
+The buffer is request-driven: held chunks are released by the next push
+(or poll), not by a timer.
+
+Environment:
+  ISWEEP_ASR_JITTER_MS      max time a chunk waits for a missing predecessor (default 500, 0 disables)
+  ISWEEP_ASR_JITTER_CHUNKS  max chunks held behind a gap (default 8)
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, NamedTuple, Optional, Union
+
+from .metrics import REGISTRY
+
+CHUNKS = REGISTRY.counter(
+    "isweep_asr_jitter_chunks_total",
+    "ASR chunks by arrival order: in_order, reordered (after a higher seq), late (after their seq was skipped), duplicate",
+    ("outcome",),
+)
+LOST = REGISTRY.counter("isweep_asr_jitter_lost_chunks_total", "ASR chunk seqs skipped as gaps after waiting")
+
+
+class Gap(NamedTuple):
+    """Seqs first_seq..last_seq were never received; audio is discontinuous here."""
+
+    first_seq: int
+    last_seq: int
+
+    @property
+    def count(self) -> int:
+        return self.last_seq - self.first_seq + 1
+
+
+Released = Union[tuple[int, Any], Gap]
+
+
+class JitterBuffer:
+    """Reorders one session's chunks by seq; items are opaque to the buffer."""
+
+    def __init__(self, max_wait_seconds: float = 0.5, max_pending: int = 8):
+        self.max_wait_seconds = max_wait_seconds
+        self.max_pending = max(1, max_pending)
+        self.next_seq: Optional[int] = None
+        self._highest: Optional[int] = None
+        self._pending: dict[int, tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self.received = 0
+        self.reordered = 0
+        self.late = 0
+        self.duplicates = 0
+        self.lost = 0
+        self.gaps = 0
+        self.restarts = 0
+        self.max_depth = 0
+
+    def push(self, seq: int, item: Any, now: Optional[float] = None) -> Optional[list[Released]]:
+        """Add a chunk; returns what can be released in order (maybe nothing).
+
+        Returns None if the chunk is rejected: late, or already held.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.received += 1
+            if self.next_seq is not None and self.next_seq - seq > self.max_pending:
+                self.restarts += 1
+                self._pending.clear()
+                self.next_seq = self._highest = None
+            if self.next_seq is None:
+                self.next_seq = seq
+            if seq < self.next_seq or seq in self._pending:
+                outcome = "late" if seq < self.next_seq else "duplicate"
+                if outcome == "late":
+                    self.late += 1
+                else:
+                    self.duplicates += 1
+                CHUNKS.inc(outcome=outcome)
+                return None
+            if self._highest is not None and seq < self._highest:
+                self.reordered += 1
+                outcome = "reordered"
+            else:
+                self._highest = seq
+                outcome = "in_order"
+            self._pending[seq] = (item, now)
+            self.max_depth = max(self.max_depth, len(self._pending))
+            released = self._release(now)
+        CHUNKS.inc(outcome=outcome)
+        return released
+
+    def poll(self, now: Optional[float] = None) -> list[Released]:
+        """Release chunks whose gap has timed out, without adding one."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self._release(now)
+
+    def _release(self, now: float) -> list[Released]:
+        out: list[Released] = []
+        while self._pending:
+            if self.next_seq in self._pending:
+                item, _ = self._pending.pop(self.next_seq)
+                out.append((self.next_seq, item))
+                self.next_seq += 1
+                continue
+            first = min(self._pending)
+            oldest = min(arrived for _, arrived in self._pending.values())
+            if (
+                now - oldest < self.max_wait_seconds
+                and len(self._pending) <= self.max_pending
+                and first - self.next_seq <= self.max_pending
+            ):
+                break
+            gap = Gap(self.next_seq, first - 1)
+            out.append(gap)
+            self.gaps += 1
+            self.lost += gap.count
+            LOST.inc(gap.count)
+            self.next_seq = first
+        return out
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "received": self.received,
+                "reordered": self.reordered,
+                "late": self.late,
+                "duplicates": self.duplicates,
+                "lost": self.lost,
+                "gaps": self.gaps,
+                "restarts": self.restarts,
+                "held": len(self._pending),
+                "max_depth": self.max_depth,
+                "next_seq": self.next_seq,
+            }
+
+
+JITTER_SECONDS = float(os.getenv("ISWEEP_ASR_JITTER_MS", "500")) / 1000.0
+JITTER_CHUNKS = int(os.getenv("ISWEEP_ASR_JITTER_CHUNKS", "8"))
+
+
+def create_jitter_buffer() -> Optional[JitterBuffer]:
+    """A buffer configured from the environment; None when disabled."""
+    if JITTER_SECONDS <= 0:
+        return None
+    return JitterBuffer(JITTER_SECONDS, JITTER_CHUNKS)
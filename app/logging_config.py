@@ -0,0 +1,184 @@
+"""
+Logging setup for ISweep backend.
+
+Request threads only put records on a queue (QueueHandler); a single
+QueueListener thread formats them and writes to stderr, so a slow terminal
+or pipe never stalls a request.
+
+Environment:
+  ISWEEP_LOG_LEVEL    default level for the "app" loggers (default: INFO)
+  ISWEEP_LOG_LEVELS   per-module overrides, e.g. "app.asr=DEBUG,app.rules=WARNING"
+  ISWEEP_LOG_FORMAT   "text" (key=value, default) or "json"
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Any, Optional
+
+# Attributes every LogRecord has; anything else came in through `extra=`.
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+_configure_lock = threading.Lock()
+
+
+def _extra_fields(record: logging.LogRecord) -> dict[str, Any]:
+    return {k: v for k, v in record.__dict__.items() if k not in _STANDARD_ATTRS and not k.startswith("_")}
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback out of the message text."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Format records as `ts=... level=... logger=... msg="..." key=value ...`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [
+            f"ts={self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}",
+            f"level={record.levelname}",
+            f"logger={record.name}",
+            f"msg={json.dumps(record.getMessage(), ensure_ascii=False)}",
+        ]
+        for key, value in _extra_fields(record).items():
+            if isinstance(value, str) and (" " in value or not value):
+                value = json.dumps(value, ensure_ascii=False)
+            parts.append(f"{key}={value}")
+        line = " ".join(parts)
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        payload.update(_extra_fields(record))
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+def _parse_levels(spec: str) -> dict[str, int]:
+    """Parse "app.asr=DEBUG,app.rules=WARNING" into {logger_name: level}."""
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        level_value = logging.getLevelName(level.strip().upper())
+        if isinstance(level_value, int):
+            levels[name.strip()] = level_value
+    return levels
+
+
+def configure_logging() -> None:
+    """Install the queue handler on the "app" logger (idempotent)."""
+    global _listener, _queue_handler
+
+    with _configure_lock:
+        if _listener is not None:
+            return
+
+        fmt = os.getenv("ISWEEP_LOG_FORMAT", "text").lower()
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(JsonFormatter() if fmt == "json" else KeyValueFormatter())
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+        _listener.start()
+        atexit.unregister(stop_logging)  # registered once across restarts
+        atexit.register(stop_logging)
+
+        app_logger = logging.getLogger("app")
+        _queue_handler = _QueueHandler(log_queue)
+        app_logger.addHandler(_queue_handler)
+        app_logger.setLevel(os.getenv("ISWEEP_LOG_LEVEL", "INFO").upper())
+        app_logger.propagate = False
+
+        for name, level in _parse_levels(os.getenv("ISWEEP_LOG_LEVELS", "")).items():
+            logging.getLogger(name).setLevel(level)
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the listener thread; configure_logging() can run again."""
+    global _listener, _queue_handler
+
+    with _configure_lock:
+        if _listener is None:
+            return
+        logging.getLogger("app").removeHandler(_queue_handler)
+        _listener.stop()  # drains the queue before returning
+        _listener = _queue_handler = None
+
+
+class SampledLogger:
+    """Rate-limited wrapper for per-chunk log lines.
+
+    Allows at most `per_second` records per second (token bucket with a burst
+    of the same size). Suppressed records are counted and reported as
+    `suppressed=N` on the next record that gets through. The level check runs
+    first, so a disabled level costs one `isEnabledFor` call.
+    """
+
+    def __init__(self, logger: logging.Logger, per_second: float = 5.0):
+        self.logger = logger
+        self.per_second = per_second
+        self._tokens = per_second
+        self._last = time.monotonic()
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def _allow(self) -> int:
+        """Return -1 if the record should be dropped, else the suppressed count."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.per_second, self._tokens + (now - self._last) * self.per_second)
+            self._last = now
+            if self._tokens < 1.0:
+                self._suppressed += 1
+                return -1
+            self._tokens -= 1.0
+            suppressed, self._suppressed = self._suppressed, 0
+            return suppressed
+
+    def log(self, level: int, msg: str, *args: Any, extra: Optional[dict] = None, **kwargs: Any) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = self._allow()
+        if suppressed < 0:
+            return
+        if suppressed:
+            extra = dict(extra or {}, suppressed=suppressed)
+        self.logger.log(level, msg, *args, extra=extra, **kwargs)
+
+    def debug(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        self.log(logging.INFO, msg, *args, **kwargs)
@@ -4,15 +4,46 @@ ISweep FastAPI backend.
 Acts as the central decision engine for filtering behavior.
 """
 
-from typing import Any
-from fastapi import FastAPI, Depends, HTTPException, Body
+import hmac
+import json
+import logging
+import os
+import time
+from typing import Any, Optional
+from fastapi import FastAPI, Depends, HTTPException, Body, Query, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
-from .models import Preference, Event, DecisionResponse, AudioChunk, ASRStreamResponse
+from .models import (
+    Action, Preference, Event, DecisionResponse, AudioChunk, ASRStreamResponse, MediaScanResponse, MediaTranscript,
+)
 from . import rules
+from . import asr
 from . import asr_service
+from . import memory
+from . import pref_transfer
+from . import profiling
+from . import push
+from . import timing
+from . import transcript_index
+from .asr_engines import ENGINES
+from .asr_scheduler import DEADLINE_SLACK_SECONDS, chunk_deadline
+from .asr_sessions import find_session
+from .matching import char_span_to_interval
+from .metrics import REGISTRY
+from .serialization import FastJSONResponse, blocked_span_payload, preference_payload, segment_payload
 from .database import init_db, get_db
+from .logging_config import configure_logging, SampledLogger
+
+configure_logging()
+logger = logging.getLogger(__name__)
+chunk_log = SampledLogger(logger)
+
+# In debug mode, per-stage timings are also returned in the response body.
+DEBUG = os.getenv("ISWEEP_DEBUG", "false").lower() == "true"
 
 # -------------------------------------------------
 # CREATE APP (MUST BE BEFORE ANY @app.* DECORATORS)
@@ -21,6 +52,7 @@ app = FastAPI(
     title="ISweep Backend",
     description="AI brain that decides when to mute, skip, or fast-forward.",
     version="0.1.0",
+    default_response_class=FastJSONResponse,
 )
 
 
@@ -30,7 +62,7 @@ app = FastAPI(
 @app.on_event("startup")
 def startup_event():
     """Initialize database on startup."""
-    print("ISweep backend listening on http://127.0.0.1:8001")
+    logger.info("ISweep backend starting")
     init_db()
 
 
@@ -48,10 +80,71 @@ app.add_middleware(
 )
 
 
+# -------------------------------------------------
+# PER-STAGE TIMINGS (Server-Timing header)
+# -------------------------------------------------
+TIMED_ROUTES = {
+    "/event": "event",
+    "/asr/stream": "asr_stream",
+}
+
+
+@app.middleware("http")
+async def server_timing_middleware(request: Request, call_next):
+    """Collect per-stage timings for hot routes and return them as Server-Timing."""
+    route = TIMED_ROUTES.get(request.url.path)
+    if route is None:
+        return await call_next(request)
+
+    timer = timing.RequestTimer(route)
+    token = timing.activate(timer)
+    try:
+        response = await call_next(request)
+    finally:
+        timing.deactivate(token)
+    timer.finish()
+    response.headers["Server-Timing"] = timer.server_timing_header()
+    return response
+
+
+# -------------------------------------------------
+# ON-DEMAND PROFILING (see app/profiling.py)
+# -------------------------------------------------
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    """Mark requests for profiling by header or sampling; handlers use @profiled."""
+    if not profiling.should_profile(request.headers.get(profiling.PROFILE_HEADER)):
+        return await call_next(request)
+
+    profile_request, token = profiling.request_profile(request.url.path)
+    try:
+        response = await call_next(request)
+    finally:
+        profiling.clear_profile(token)
+    if profile_request.output_path:
+        response.headers["X-ISweep-Profile-Path"] = profile_request.output_path
+    return response
+
+
+def _with_debug_timings(result: Any) -> Any:
+    """In debug mode, return `result` with a `timings_ms` field added to the body.
+
+    Plain dicts (already-serializable payloads) always go out as a
+    FastJSONResponse, skipping response_model validation.
+    """
+    timer = timing.current()
+    if not DEBUG or timer is None:
+        return FastJSONResponse(result) if isinstance(result, dict) else result
+    payload = result if isinstance(result, dict) else jsonable_encoder(result)
+    payload["timings_ms"] = timer.as_dict()
+    return FastJSONResponse(payload)
+
+
 # -------------------------------------------------
 # ROOT REDIRECT + HEALTH CHECK
 # -------------------------------------------------
 @app.get("/")
+@profiling.profiled
 def root() -> dict[str, Any]:
     """Root endpoint - redirects to docs or returns status."""
     return {
@@ -64,6 +157,7 @@ def root() -> dict[str, Any]:
 
 
 @app.get("/health")
+@profiling.profiled
 def health_check() -> dict[str, Any]:
     return {
         "status": "ok",
@@ -71,10 +165,71 @@ def health_check() -> dict[str, Any]:
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+@profiling.profiled
+def metrics() -> str:
+    """Prometheus text exposition of this worker's metrics."""
+    return REGISTRY.render()
+
+
+# -------------------------------------------------
+# ADMIN AUTH (/admin/*, tracemalloc)
+# -------------------------------------------------
+ADMIN_TOKEN = os.getenv("ISWEEP_ADMIN_TOKEN", "")
+
+
+def _require_admin(request: Request) -> None:
+    """Admin routes need ISWEEP_ADMIN_TOKEN in X-ISweep-Admin-Token; without a configured token they are off."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin routes are disabled (ISWEEP_ADMIN_TOKEN is not set)")
+    if not hmac.compare_digest(request.headers.get("x-isweep-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+# -------------------------------------------------
+# MEMORY DIAGNOSTICS
+# -------------------------------------------------
+@app.get("/diagnostics/memory")
+@profiling.profiled
+def memory_diagnostics() -> dict[str, Any]:
+    """Bytes held by audio buffers, caches and loaded models in this worker."""
+    return memory.report()
+
+
+@app.post("/diagnostics/memory/tracemalloc/start")
+@profiling.profiled
+def start_tracemalloc(request: Request) -> dict[str, Any]:
+    """Start tracemalloc (admin; it slows allocations until stopped) and take a baseline."""
+    _require_admin(request)
+    memory.start_tracemalloc()
+    return {"tracing": True}
+
+
+@app.post("/diagnostics/memory/tracemalloc/stop")
+@profiling.profiled
+def stop_tracemalloc(request: Request) -> dict[str, Any]:
+    """Stop tracemalloc and drop its traces (admin)."""
+    _require_admin(request)
+    memory.stop_tracemalloc()
+    return {"tracing": False}
+
+
+@app.get("/diagnostics/memory/tracemalloc")
+@profiling.profiled
+def tracemalloc_diff(request: Request, limit: int = Query(default=25, ge=1, le=500)) -> dict[str, Any]:
+    """Allocation sites that grew since the previous call (or since start) (admin)."""
+    _require_admin(request)
+    try:
+        return {"top": memory.tracemalloc_diff(limit)}
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # -------------------------------------------------
 # SAVE USER PREFERENCES
 # -------------------------------------------------
 @app.post("/preferences")
+@profiling.profiled
 def set_preference(pref: Preference, db: Session = Depends(get_db)) -> dict[str, Any]:
     """Save a preference for a user."""
     try:
@@ -93,12 +248,13 @@ def set_preference(pref: Preference, db: Session = Depends(get_db)) -> dict[str,
 
 
 @app.post("/preferences/bulk")
+@profiling.profiled
 def set_bulk_preferences(bulk: dict = Body(...), db: Session = Depends(get_db)) -> dict[str, Any]:
     """Save all preferences for a user in one request."""
     try:
-        # Log the raw request for debugging
-        import json
-        print(f"[DEBUG] Received bulk request: {json.dumps(bulk, indent=2)}")
+        # Log the raw request for debugging (serialized only when DEBUG is on)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received bulk request", extra={"payload": json.dumps(bulk)})
         
         # Extract user_id and preferences from request
         user_id = bulk.get('user_id', '').strip() if isinstance(bulk, dict) else ''
@@ -109,7 +265,7 @@ def set_bulk_preferences(bulk: dict = Body(...), db: Session = Depends(get_db))
         if not preferences:
             raise HTTPException(status_code=400, detail="preferences cannot be empty")
         
-        print(f"[DEBUG] Processing {len(preferences)} categories for user: {user_id}")
+        logger.debug("Processing bulk preferences", extra={"user_id": user_id, "categories": len(preferences)})
         rules.save_bulk_preferences(db, user_id, preferences)
         return {
             "status": "saved",
@@ -119,12 +275,12 @@ def set_bulk_preferences(bulk: dict = Body(...), db: Session = Depends(get_db))
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Failed to save bulk preferences")
         raise HTTPException(status_code=500, detail=f"Failed to save bulk preferences: {str(e)}")
 
 
 @app.get("/preferences/{user_id}")
+@profiling.profiled
 def get_all_preferences(user_id: str, db: Session = Depends(get_db)) -> dict[str, Any]:
     """Get all preferences for a user."""
     try:
@@ -132,10 +288,10 @@ def get_all_preferences(user_id: str, db: Session = Depends(get_db)) -> dict[str
             raise HTTPException(status_code=400, detail="user_id cannot be empty")
         
         prefs = rules.get_all_preferences(db, user_id)
-        return {
+        return FastJSONResponse({
             "user_id": user_id,
-            "preferences": {cat: p.model_dump() for cat, p in prefs.items()},
-        }
+            "preferences": {cat: preference_payload(p) for cat, p in prefs.items()},
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch preferences: {str(e)}")
 
@@ -144,14 +300,24 @@ def get_all_preferences(user_id: str, db: Session = Depends(get_db)) -> dict[str
 # EVENT DECISION ENDPOINT
 # -------------------------------------------------
 @app.post("/event", response_model=DecisionResponse)
+@profiling.profiled
 def handle_event(event: Event, db: Session = Depends(get_db)) -> DecisionResponse:
     """Process an event and return a decision."""
+    timer = timing.current()
+    if timer is not None:
+        # Body read, JSON parsing, validation and DB session setup
+        timer.mark_since_start("parse")
     try:
         if not event.user_id.strip():
             raise HTTPException(status_code=400, detail="user_id cannot be empty")
         
         decision = rules.decide(db, event)
-        return decision
+        if event.tab_id is not None and decision.action != Action.none:
+            push.publish(event.user_id, event.tab_id, "decision", {
+                "decision": decision.model_dump(mode="json"),
+                "timestamp_seconds": event.timestamp_seconds,
+            })
+        return _with_debug_timings(decision)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Decision failed: {str(e)}")
 
@@ -160,12 +326,8 @@ def handle_event(event: Event, db: Session = Depends(get_db)) -> DecisionRespons
 # -------------------------------------------------
 # ASR (AUTOMATIC SPEECH RECOGNITION) ENDPOINT (OpenAI Whisper)
 # -------------------------------------------------
-from fastapi import Body
-from sqlalchemy.orm import Session
-from .models import AudioChunk, ASRStreamResponse, TranscriptSegment
-from typing import List
-
 @app.post("/asr/stream", response_model=ASRStreamResponse)
+@profiling.profiled
 def handle_asr_stream(
     chunk: AudioChunk = Body(...),
     db: Session = Depends(get_db)
@@ -173,35 +335,176 @@ def handle_asr_stream(
     """
     Receive audio chunk from extension, transcribe it, check for blocked words, return segments
     """
-    print(f"[ASR] Received chunk seq={chunk.seq} from user={chunk.user_id}")
-    # Transcribe audio using Whisper
-    segments = asr_service.transcribe_audio_chunk(
+    timer = timing.current()
+    if timer is not None:
+        # Body read, JSON parsing, validation and DB session setup
+        timer.mark_since_start("parse")
+    chunk_log.debug("Received chunk", extra={"user_id": chunk.user_id, "tab_id": chunk.tab_id, "seq": chunk.seq})
+    if chunk.engine is not None and chunk.engine.lower() not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown ASR engine; expected one of {sorted(ENGINES)}")
+    deadline = chunk_deadline(
+        time.monotonic(), chunk.chunk_start_seconds, chunk.playback_position_seconds, DEADLINE_SLACK_SECONDS
+    )
+    # Transcribe audio using Whisper (earliest deadline first, see app/asr_scheduler.py)
+    result = asr_service.transcribe_chunk(
         audio_b64=chunk.audio_b64,
         user_id=chunk.user_id,
         chunk_start_seconds=chunk.chunk_start_seconds,
+        deadline=deadline,
+        tab_id=chunk.tab_id,
+        language=chunk.language,
+        mime_type=chunk.mime_type,
+        seq=chunk.seq,
+        engine=chunk.engine,
     )
-    print(f"[ASR] Transcribed {len(segments)} segments")
-    # Check each segment for blocked words
-    flagged_segments: List[TranscriptSegment] = []
-    for segment in segments:
+    segments = result.segments
+    chunk_log.debug("Transcribed chunk", extra={"seq": chunk.seq, "segments": len(segments)})
+    # Check each segment for blocked words (one scan per segment, all hits with spans).
+    # Results stay plain dicts; see app/serialization.py.
+    flagged_segments = []
+    all_matches = rules.find_all_blocked_word_matches(db, chunk.user_id, [segment["text"] for segment in segments])
+    for segment, matches in zip(segments, all_matches):
         text = segment["text"]
-        match = rules._find_blocked_word_match(db, chunk.user_id, text)
-        blocked_word = None
-        category = None
-        is_blocked = False
-        if match:
-            category, blocked_word, pattern = match
-            is_blocked = True
-            print(f"[ASR] 🚨 BLOCKED WORD FOUND: '{blocked_word}' in '{text}'")
+        spans = []
+        for m in matches:
+            start_s, end_s = char_span_to_interval(
+                m.start, m.end, len(text), segment["start_seconds"], segment["end_seconds"]
+            )
+            spans.append(blocked_span_payload(m.word, m.category, m.start, m.end, start_s, end_s))
+        if matches:
+            logger.info(
+                "Blocked words found",
+                extra={"user_id": chunk.user_id, "words": [m.word for m in matches], "category": matches[0].category},
+            )
         flagged_segments.append(
-            TranscriptSegment(
-                text=text,
-                start_seconds=segment["start_seconds"],
-                end_seconds=segment["end_seconds"],
-                confidence=0.9,  # Whisper API does not return confidence per segment
-                is_blocked=is_blocked,
-                blocked_word=blocked_word,
-                category=category,
+            segment_payload(
+                text,
+                segment["start_seconds"],
+                segment["end_seconds"],
+                confidence=segment.get("confidence", 0.9),
+                matches=spans,
             )
         )
-    return ASRStreamResponse(segments=flagged_segments)
+    blocked_segments = [s for s in flagged_segments if s["is_blocked"]]
+    if blocked_segments:
+        push.publish(chunk.user_id, chunk.tab_id, "segments", {"seq": chunk.seq, "segments": blocked_segments})
+    return _with_debug_timings({
+        "segments": flagged_segments,
+        "tier": result.tier.as_dict() if result.tier else None,
+        "status": result.status,
+        "language": result.language,
+        "engine": result.engine,
+        "partial": result.partial,
+    })
+
+
+@app.get("/asr/sessions/{user_id}/{tab_id}")
+@profiling.profiled
+def get_asr_session(user_id: str, tab_id: int) -> dict[str, Any]:
+    """Decoding state of an ASR session in this worker: pinned language and chunk reorder/loss stats."""
+    session = find_session(user_id, tab_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No ASR session for this tab in this worker")
+    return {"user_id": user_id, "tab_id": tab_id, **session.stats()}
+
+
+# -------------------------------------------------
+# SHARED MEDIA TRANSCRIPTS (inverted token index)
+# -------------------------------------------------
+@app.put("/media/{media_id}/transcript")
+@profiling.profiled
+def put_media_transcript(media_id: str, transcript: MediaTranscript, db: Session = Depends(get_db)) -> dict[str, Any]:
+    """Store a media item's caption track and index it for later scans."""
+    if not media_id.strip():
+        raise HTTPException(status_code=400, detail="media_id cannot be empty")
+    stored = transcript_index.store_transcript(db, media_id, transcript.cues)
+    return {"status": "stored", "media_id": media_id, **stored}
+
+
+@app.get("/media/{media_id}/matches", response_model=MediaScanResponse)
+@profiling.profiled
+def get_media_matches(media_id: str, user_id: str = Query(...), db: Session = Depends(get_db)):
+    """Cues of a stored media transcript that match the user's wordlists."""
+    if not transcript_index.has_transcript(db, media_id):
+        raise HTTPException(status_code=404, detail="No transcript stored for this media")
+    segments = transcript_index.scan_media(db, media_id, user_id)
+    return _with_debug_timings({"media_id": media_id, "user_id": user_id, "segments": segments})
+
+
+# -------------------------------------------------
+# ADMIN: bulk preference export/import (NDJSON)
+# -------------------------------------------------
+@app.get("/admin/preferences/export")
+def export_preferences(
+    request: Request,
+    batch_size: int = Query(default=pref_transfer.DEFAULT_BATCH_SIZE, ge=1, le=10000),
+    db: Session = Depends(get_db),
+):
+    """Stream every stored preference row as NDJSON (see app/pref_transfer.py)."""
+    _require_admin(request)
+    return StreamingResponse(
+        pref_transfer.export_preferences(db, batch_size=batch_size),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.post("/admin/preferences/import")
+async def import_preferences(
+    request: Request,
+    skip: int = Query(default=0, ge=0, description="Input lines to skip (committed_lines of an earlier run)"),
+    batch_size: int = Query(default=pref_transfer.DEFAULT_BATCH_SIZE, ge=1, le=10000),
+    db: Session = Depends(get_db),
+) -> dict[str, Any]:
+    """
+    Import an NDJSON request body of preference rows, batch_size rows per
+    transaction. Idempotent; returns progress including committed_lines and
+    rows_per_second.
+    """
+    _require_admin(request)
+    importer = pref_transfer.PreferenceImporter(db, batch_size=batch_size, skip=skip)
+    lines = []
+    async for line in pref_transfer.aiter_lines(request.stream()):
+        lines.append(line)
+        if len(lines) >= batch_size:
+            await run_in_threadpool(_feed_lines, importer, lines)
+            lines = []
+    await run_in_threadpool(_feed_lines, importer, lines)
+    progress = await run_in_threadpool(importer.finish)
+    return progress.as_dict()
+
+
+def _feed_lines(importer: "pref_transfer.PreferenceImporter", lines: list[bytes]) -> None:
+    for line in lines:
+        importer.feed(line)
+
+
+# -------------------------------------------------
+# SERVER-SENT EVENTS: decisions pushed per tab
+# -------------------------------------------------
+@app.get("/decisions/stream/{user_id}/{tab_id}")
+async def stream_decisions(
+    request: Request,
+    user_id: str,
+    tab_id: int,
+    last_event_id: Optional[int] = Query(default=None, description="Resume after this event id"),
+):
+    """
+    Stream decisions and flagged ASR segments for one tab as Server-Sent Events.
+
+    Events: `decision` (from /event with this tab_id) and `segments` (blocked
+    segments from /asr/stream). A heartbeat comment is sent when idle.
+    Reconnecting clients resume via the Last-Event-ID header (or
+    ?last_event_id=).
+    """
+    if not user_id.strip():
+        raise HTTPException(status_code=400, detail="user_id cannot be empty")
+    header_id = request.headers.get("last-event-id")
+    # Only a reconnect (with an id) replays history; a fresh connection starts at the head.
+    resume_after = last_event_id if last_event_id is not None else int(header_id) if header_id and header_id.isdigit() else None
+
+    channel = push.get_channel(user_id, tab_id)
+    return StreamingResponse(
+        push.event_stream(channel, resume_after, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,425 @@
+"""
+Obfuscation-tolerant blocked-word matching.
+
+Text is normalized once (Unicode folding, leetspeak mapping, repeat
+collapsing) into a NormalizedText that every category and every user in a
+batch can reuse. Wordlists are normalized the same way and compiled into a
+single alternation regex across all categories, so tolerant matching costs
+one linear regex scan per text. Compiled matchers are interned by a hash of
+their canonical (category, words) configuration, so users with the same
+wordlists share one Matcher (see MatcherRegistry).
+
+Normalization rules:
+  - NFKD + strip combining marks + casefold ("Fück" -> "fuck")
+  - leetspeak inside tokens that contain a letter: 0->o 1->i 3->e 4->a
+    5->s 7->t @->a $->s, and "!" before a letter ("sh1t", "$hit", "sh!t")
+  - runs of 3+ identical letters collapse to 3 ("shiiiiit" -> "shiiit"):
+    a run of 3 marks emphasis, while runs of 1 and 2 are spelling, so
+    "god" and "good" stay different words
+  - "*" is kept as a mask character and never collapsed; in patterns every
+    letter after the first may also match "*" ("f*ck", "f**k", "f***")
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import sys
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional
+
+from . import memory
+from .metrics import REGISTRY
+
+LEET_MAP = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"}
+MASK_CHAR = "*"
+_TOKEN_EXTRA = set(LEET_MAP) | {"!", MASK_CHAR}
+
+# Plain ASCII text without leetspeak next to letters or long runs only needs lower().
+_NEEDS_FULL_NORMALIZATION = re.compile(r"[^\x00-\x7f]|[a-z][0-9@$!]|[0-9@$!][a-z]|([a-z])\1{3}", re.IGNORECASE)
+
+# Longest run of one letter kept by normalization; longer runs are emphasis.
+_MAX_RUN = 3
+
+# Unreferenced matchers kept for reuse before eviction.
+_MAX_IDLE = 256
+
+
+class NormalizedText:
+    """Normalized form of a text plus the mapping back to original offsets."""
+
+    __slots__ = ("original", "text", "offsets")
+
+    def __init__(self, original: str, text: str, offsets: Optional[list[int]] = None):
+        self.original = original
+        self.text = text
+        # offsets[i] is the index in `original` that produced text[i];
+        # None means the two strings line up one-to-one.
+        self.offsets = offsets
+
+    def original_span(self, start: int, end: int) -> tuple[int, int]:
+        """Map a [start, end) span in `text` back to `original`."""
+        if self.offsets is None:
+            return start, end
+        if start >= end:
+            position = self.offsets[start] if start < len(self.offsets) else len(self.original)
+            return position, position
+        return self.offsets[start], self.offsets[end - 1] + 1
+
+
+def _fold(text: str) -> tuple[list[str], list[int]]:
+    chars: list[str] = []
+    offsets: list[int] = []
+    for index, ch in enumerate(text):
+        if ch.isascii():
+            chars.append(ch.lower())
+            offsets.append(index)
+            continue
+        decomposed = unicodedata.normalize("NFKD", ch)
+        folded = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+        for c in folded:
+            chars.append(c)
+            offsets.append(index)
+    return chars, offsets
+
+
+def _map_leet(chars: list[str]) -> None:
+    """Replace leetspeak characters in place, only within tokens that contain a letter."""
+    n = len(chars)
+    i = 0
+    while i < n:
+        if not (chars[i].isalnum() or chars[i] in _TOKEN_EXTRA):
+            i += 1
+            continue
+        j = i
+        has_letter = False
+        while j < n and (chars[j].isalnum() or chars[j] in _TOKEN_EXTRA):
+            has_letter = has_letter or chars[j].isalpha()
+            j += 1
+        if has_letter:
+            for k in range(i, j):
+                c = chars[k]
+                if c in LEET_MAP:
+                    chars[k] = LEET_MAP[c]
+                elif c == "!" and k + 1 < j and chars[k + 1].isalpha():
+                    chars[k] = "i"
+        i = j
+
+
+def normalize_text(text: str) -> NormalizedText:
+    """Normalize `text` for matching; cheap for plain ASCII text."""
+    if not _NEEDS_FULL_NORMALIZATION.search(text):
+        return NormalizedText(text, text.lower())
+
+    chars, offsets = _fold(text)
+    _map_leet(chars)
+
+    out_chars: list[str] = []
+    out_offsets: list[int] = []
+    run = 0
+    for c, offset in zip(chars, offsets):
+        run = run + 1 if out_chars and out_chars[-1] == c else 1
+        if run > _MAX_RUN and c.isalpha():
+            continue
+        out_chars.append(c)
+        out_offsets.append(offset)
+    return NormalizedText(text, "".join(out_chars), out_offsets)
+
+
+def _letter_run(letter: str, length: int, maskable: bool) -> str:
+    """Regex for a run of `length` (1 or 2) copies of `letter`.
+
+    The run matches as spelled or as emphasis (a run of 3, see normalize_text);
+    a maskable run also matches the same number of "*".
+    """
+    escaped = re.escape(letter)
+    if not maskable:
+        return f"{escaped * length}(?:{escaped * (_MAX_RUN - length)})?"
+    masked = f"[{escaped}{re.escape(MASK_CHAR)}]"
+    return f"(?:{escaped * _MAX_RUN}|{masked if length == 1 else masked + '{2}'})"
+
+
+def word_pattern(word: str) -> Optional[str]:
+    """Regex for one blocked word/phrase, in normalized space.
+
+    Each run of a letter matches as spelled or stretched ("shit" matches
+    "shiiiit" but not "shiit"; "god" does not match "good"), letters after
+    the first may be masked with "*", and whitespace matches any run of
+    whitespace. Word-like ends get boundaries so "cat" does not match inside
+    "scatter".
+    Example: "god almighty" -> (?<![\\w*])g(?:gg)?(?:ooo|[o*])(?:ddd|[d*])\\s+...(?![\\w*])
+    """
+    normalized = normalize_text(word.strip()).text
+    if not normalized:
+        return None
+
+    parts: list[str] = []
+    index = 0
+    while index < len(normalized):
+        ch = normalized[index]
+        end = index + 1
+        while end < len(normalized) and normalized[end] == ch:
+            end += 1
+        if ch.isspace():
+            parts.append(r"\s+")
+        elif ch.isalpha():
+            # A word's own runs are spelling; anything longer is emphasis.
+            parts.append(_letter_run(ch, min(end - index, _MAX_RUN - 1), maskable=index > 0))
+        else:
+            parts.append(re.escape(normalized[index:end]))
+        index = end
+
+    pattern = "".join(parts)
+    if re.match(r"\w", normalized[0]):
+        pattern = r"(?<![\w*])" + pattern
+    if re.match(r"\w", normalized[-1]):
+        pattern = pattern + r"(?![\w*])"
+    return pattern
+
+
+class WordMatch(NamedTuple):
+    """One blocked-word hit; `start`/`end` are offsets into the original text."""
+
+    category: str
+    word: str
+    pattern: str
+    start: int
+    end: int
+
+
+class Matcher:
+    """All categories' wordlists compiled into one alternation regex.
+
+    `find_all` is a single linear scan (non-overlapping, leftmost first) that
+    reports every hit with its category and character span. Longer patterns
+    come first so that at a given position the longest phrase wins
+    ("god almighty" over "god"). If two categories block the same word, the
+    first category wins. Immutable once built.
+    """
+
+    __slots__ = ("entries", "regex", "key")
+
+    def __init__(self, categories: Iterable[tuple[str, Iterable[str]]], key: str = ""):
+        entries: list[tuple[str, str, str]] = []
+        seen: set[str] = set()
+        for category, words in categories:
+            for word in words:
+                if not word or not word.strip():
+                    continue
+                pattern = word_pattern(word)
+                if pattern is None or pattern in seen:
+                    continue
+                seen.add(pattern)
+                entries.append((category, word, pattern))
+        entries.sort(key=lambda e: -len(e[2]))
+
+        self.entries: tuple[tuple[str, str, str], ...] = tuple(entries)
+        self.regex = re.compile("|".join(f"({p})" for _, _, p in entries)) if entries else None
+        self.key = key  # canonical configuration hash when interned
+
+    def _to_match(self, normalized: NormalizedText, m: re.Match) -> WordMatch:
+        category, word, pattern = self.entries[m.lastindex - 1]
+        start, end = normalized.original_span(m.start(), m.end())
+        return WordMatch(category, word, pattern, start, end)
+
+    def search(self, normalized: NormalizedText) -> Optional[WordMatch]:
+        """Leftmost match, or None."""
+        if self.regex is None:
+            return None
+        m = self.regex.search(normalized.text)
+        return self._to_match(normalized, m) if m else None
+
+    def find_all(self, normalized: NormalizedText) -> list[WordMatch]:
+        """Every match, in text order."""
+        if self.regex is None:
+            return []
+        return [self._to_match(normalized, m) for m in self.regex.finditer(normalized.text)]
+
+
+def char_span_to_interval(
+    start_char: int,
+    end_char: int,
+    text_length: int,
+    start_seconds: float,
+    end_seconds: float,
+) -> tuple[float, float]:
+    """Estimate the time window of a character span inside a timed segment.
+
+    Assumes characters are spread evenly over [start_seconds, end_seconds],
+    which is close enough to mute a word instead of the whole segment.
+    """
+    if text_length <= 0 or end_seconds <= start_seconds:
+        return start_seconds, end_seconds
+    per_char = (end_seconds - start_seconds) / text_length
+    t0 = start_seconds + max(0, start_char) * per_char
+    t1 = start_seconds + min(text_length, end_char) * per_char
+    return t0, max(t0, t1)
+
+
+CategoryWords = tuple[tuple[str, tuple[str, ...]], ...]
+
+
+def canonical_config(categories: Iterable[tuple[str, Iterable[str]]]) -> CategoryWords:
+    """(category, words) pairs in canonical form: words sorted and deduplicated, no empty parts.
+
+    Users whose enabled wordlists contain the same words end up with the same
+    configuration, whatever order the words were stored in. Categories keep
+    the caller's order, since the first category wins a word blocked by two.
+    """
+    config = []
+    for category, words in categories:
+        kept = tuple(sorted({w for w in words if w and w.strip()}))
+        if kept:
+            config.append((category, kept))
+    return tuple(config)
+
+
+def config_hash(config: CategoryWords) -> str:
+    """Stable digest of a canonical configuration."""
+    digest = hashlib.sha256()
+    for category, words in config:
+        digest.update(category.encode("utf-8") + b"\x00")
+        for word in words:
+            digest.update(word.encode("utf-8") + b"\x01")
+        digest.update(b"\x02")
+    return digest.hexdigest()
+
+
+class MatcherRegistry:
+    """Interned matchers, one per canonical configuration, shared by all users.
+
+    `acquire` returns the shared Matcher and counts a reference; `release`
+    drops it. Matchers nobody references stay in a small LRU so a user whose
+    preferences were just invalidated recompiles nothing, and are evicted
+    from there.
+    """
+
+    def __init__(self, max_idle: int = _MAX_IDLE):
+        self.max_idle = max_idle
+        self._live: dict[str, Matcher] = {}
+        self._refs: dict[str, int] = {}
+        self._idle: "OrderedDict[str, Matcher]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str, acquire: bool) -> Optional[Matcher]:
+        """Find `key` and, with `acquire`, count the reference; call with the lock held.
+
+        Doing both in one critical section keeps another thread's eviction
+        from dropping the matcher between the lookup and the refcount.
+        """
+        matcher = self._live.get(key)
+        if matcher is None:
+            matcher = self._idle.get(key)
+            if matcher is None:
+                return None
+            if acquire:
+                del self._idle[key]
+                self._live[key] = matcher
+            else:
+                self._idle.move_to_end(key)
+        if acquire:
+            self._refs[key] = self._refs.get(key, 0) + 1
+        return matcher
+
+    def get(self, categories: Iterable[tuple[str, Iterable[str]]], acquire: bool = False) -> Matcher:
+        config = canonical_config(categories)
+        key = config_hash(config)
+        with self._lock:
+            matcher = self._lookup(key, acquire)
+        if matcher is None:
+            built = Matcher(config, key)
+            with self._lock:
+                # Another thread may have compiled the same configuration meanwhile.
+                matcher = self._lookup(key, acquire)
+                if matcher is None:
+                    matcher = built
+                    if acquire:
+                        self._live[key] = matcher
+                        self._refs[key] = 1
+                    else:
+                        self._idle[key] = matcher
+                        self._evict()
+        return matcher
+
+    def acquire(self, categories: Iterable[tuple[str, Iterable[str]]]) -> Matcher:
+        return self.get(categories, acquire=True)
+
+    def release(self, matcher: Matcher) -> None:
+        key = matcher.key
+        with self._lock:
+            refs = self._refs.get(key, 0) - 1
+            if refs > 0:
+                self._refs[key] = refs
+                return
+            self._refs.pop(key, None)
+            if self._live.pop(key, None) is not None:
+                self._idle[key] = matcher
+                self._evict()
+
+    def _evict(self) -> None:
+        while len(self._idle) > self.max_idle:
+            self._idle.popitem(last=False)
+
+    def refcount(self, matcher: Matcher) -> int:
+        with self._lock:
+            return self._refs.get(matcher.key, 0)
+
+    def stats(self) -> dict:
+        """Unique matchers held vs. references to them (one per cached user)."""
+        with self._lock:
+            return {
+                "unique": len(self._live) + len(self._idle),
+                "live": len(self._live),
+                "idle": len(self._idle),
+                "users": sum(self._refs.values()),
+            }
+
+    def matchers(self) -> list[Matcher]:
+        with self._lock:
+            return list(self._live.values()) + list(self._idle.values())
+
+
+registry = MatcherRegistry()
+
+
+def compile_matcher(categories: Iterable[tuple[str, Iterable[str]]]) -> Matcher:
+    """The shared Matcher for `categories` = [(category, words), ...], without a reference."""
+    return registry.get(categories)
+
+
+def acquire_matcher(categories: Iterable[tuple[str, Iterable[str]]]) -> Matcher:
+    """The shared Matcher for `categories`; release it with release_matcher()."""
+    return registry.acquire(categories)
+
+
+def release_matcher(matcher: Matcher) -> None:
+    registry.release(matcher)
+
+
+def _registry_gauge():
+    stats = registry.stats()
+    for kind in ("unique", "live", "idle", "users"):
+        yield (kind,), stats[kind]
+
+
+REGISTRY.gauge(
+    "isweep_matcher_registry",
+    "Interned matchers (unique, live, idle) and the users referencing them",
+    ("kind",),
+    callback=_registry_gauge,
+)
+
+
+def _compiled_memory() -> dict:
+    total = 0
+    for matcher in registry.matchers():
+        if matcher.regex is not None:
+            total += sys.getsizeof(matcher.regex)
+        total += sum(sys.getsizeof(w) + sys.getsizeof(p) for _, w, p in matcher.entries)
+    stats = registry.stats()
+    return {"bytes": total, "entries": stats["unique"], "users": stats["users"]}
+
+
+memory.register_reporter("matching.compiled_matchers", _compiled_memory)
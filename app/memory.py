@@ -0,0 +1,170 @@
+"""
+Memory accounting for buffers, caches and loaded models.
+
+Modules that hold memory register a reporter with `register_reporter`. A
+reporter returns a dict with at least `bytes` (estimated bytes held) and
+usually `entries`. GET /diagnostics/memory calls every reporter; the same
+numbers are exposed as the `isweep_memory_bytes{component}` gauge.
+
+Leak hunting: with ISWEEP_TRACEMALLOC=1 (or after POST
+/diagnostics/memory/tracemalloc/start) `tracemalloc_diff()` returns the top
+allocation sites that grew since the previous call. Tracing slows every
+allocation; `stop_tracemalloc()` (POST .../tracemalloc/stop) turns it off.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from typing import Any, Callable, Iterable, Optional
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+Reporter = Callable[[], dict[str, Any]]
+
+_reporters: dict[str, Reporter] = {}
+_reporters_lock = threading.Lock()
+
+_baseline: Optional[tracemalloc.Snapshot] = None
+_baseline_lock = threading.Lock()
+
+# Parameter counts for Whisper checkpoints, used to estimate model memory.
+WHISPER_PARAMS = {
+    "tiny": 39_000_000,
+    "base": 74_000_000,
+    "small": 244_000_000,
+    "medium": 769_000_000,
+    "large": 1_550_000_000,
+}
+
+BYTES_PER_PARAM = {
+    "int8": 1,
+    "int8_float16": 1,
+    "int8_bfloat16": 1,
+    "int8_float32": 1,
+    "float16": 2,
+    "bfloat16": 2,
+    "float32": 4,
+    "default": 4,
+}
+
+
+def register_reporter(name: str, reporter: Reporter) -> None:
+    """Register (or replace) the reporter for component `name`."""
+    with _reporters_lock:
+        _reporters[name] = reporter
+
+
+def estimate_whisper_model_bytes(model_size: str, compute_type: str) -> int:
+    """Rough resident size of a loaded Whisper model (weights only)."""
+    base_name = model_size.split(".")[0].split("-")[0]
+    params = WHISPER_PARAMS.get(base_name, WHISPER_PARAMS["base"])
+    return params * BYTES_PER_PARAM.get(compute_type, 4)
+
+
+def bytes_size(values: Iterable[bytes]) -> int:
+    """Total size of bytes objects including per-object overhead."""
+    return sum(sys.getsizeof(v) for v in values)
+
+
+def _rss_bytes() -> Optional[int]:
+    """Current resident set size, where /proc is available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def report() -> dict[str, Any]:
+    """Call every reporter and return the combined accounting."""
+    with _reporters_lock:
+        reporters = list(_reporters.items())
+
+    components: dict[str, Any] = {}
+    for name, reporter in reporters:
+        try:
+            components[name] = reporter()
+        except Exception:
+            logger.exception("Memory reporter failed", extra={"component": name})
+            components[name] = {"bytes": 0, "error": True}
+
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": _rss_bytes(),
+        "accounted_bytes": sum(int(c.get("bytes", 0)) for c in components.values()),
+        "components": components,
+        "tracemalloc": tracemalloc.is_tracing(),
+    }
+
+
+def _gauge_values():
+    for name, component in report()["components"].items():
+        yield (name,), component.get("bytes", 0)
+
+
+REGISTRY.gauge(
+    "isweep_memory_bytes",
+    "Estimated bytes held per component",
+    ("component",),
+    callback=_gauge_values,
+)
+
+
+def start_tracemalloc(frames: int = 10) -> None:
+    """Start tracing (if needed) and take the baseline snapshot."""
+    global _baseline
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    with _baseline_lock:
+        _baseline = tracemalloc.take_snapshot()
+
+
+def stop_tracemalloc() -> None:
+    """Stop tracing and drop the baseline."""
+    global _baseline
+
+    with _baseline_lock:
+        _baseline = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def tracemalloc_diff(limit: int = 25) -> list[dict[str, Any]]:
+    """Top allocation sites by growth since the previous snapshot.
+
+    The new snapshot becomes the baseline for the next call.
+    """
+    global _baseline
+
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running; set ISWEEP_TRACEMALLOC=1 or start it first")
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),)
+    )
+    with _baseline_lock:
+        previous, _baseline = _baseline, snapshot
+    if previous is None:
+        return []
+
+    stats = snapshot.compare_to(previous, "lineno")
+    return [
+        {
+            "location": str(stat.traceback[0]),
+            "size_diff_bytes": stat.size_diff,
+            "size_bytes": stat.size,
+            "count_diff": stat.count_diff,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+if os.getenv("ISWEEP_TRACEMALLOC", "false").lower() in ("1", "true"):
+    start_tracemalloc()
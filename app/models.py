@@ -46,6 +46,7 @@ class Event(BaseModel):
     content_type: Optional[str] = None
     confidence: Optional[float] = Field(None, ge=0.0, le=1.0, description="Confidence score 0-1")
     timestamp_seconds: Optional[float] = None
+    tab_id: Optional[int] = Field(None, description="Chrome tab ID; when set, decisions are also pushed to the tab's SSE stream")
 
 
 class DecisionResponse(BaseModel):
@@ -109,6 +110,19 @@ class AudioChunk(BaseModel):
         ge=0,
         description="Absolute start time of this chunk on the media timeline (seconds)",
     )
+    playback_position_seconds: Optional[float] = Field(
+        default=None,
+        ge=0,
+        description="Client's media playback position when the chunk was sent; with chunk_start_seconds sets the chunk's deadline",
+    )
+    language: Optional[str] = Field(
+        default=None,
+        description="Force the transcription language (e.g. 'en'); 'auto' clears the session's pinned language",
+    )
+    engine: Optional[str] = Field(
+        default=None,
+        description="ASR engine for this chunk ('whisper' or 'vosk'); default set by ISWEEP_ASR_ENGINE",
+    )
 
     class Config:
         json_schema_extra = {
@@ -118,11 +132,22 @@ class AudioChunk(BaseModel):
                 "seq": 1,
                 "mime_type": "audio/webm;codecs=opus",
                 "audio_b64": "GkXfo59...",
-                "chunk_start_seconds": 12.3
+                "chunk_start_seconds": 12.3,
+                "playback_position_seconds": 9.8
             }
         }
 
 
+class BlockedSpan(BaseModel):
+    """One blocked word inside a segment, with its character span and estimated time window."""
+    word: str = Field(..., description="The blocked word that matched")
+    category: str = Field(..., description="The preference category that matched")
+    char_start: int = Field(..., ge=0, description="Start offset of the match in the segment text")
+    char_end: int = Field(..., ge=0, description="End offset (exclusive) of the match in the segment text")
+    start_seconds: float = Field(..., ge=0, description="Estimated start of the word in seconds")
+    end_seconds: float = Field(..., ge=0, description="Estimated end of the word in seconds")
+
+
 class TranscriptSegment(BaseModel):
     """Transcribed audio segment with timing."""
     text: str = Field(..., description="Transcribed text")
@@ -132,8 +157,55 @@ class TranscriptSegment(BaseModel):
     is_blocked: bool = Field(default=False, description="True if this segment matched a blocked word")
     blocked_word: Optional[str] = Field(default=None, description="The blocked word that matched, if any")
     category: Optional[str] = Field(default=None, description="The preference category that matched, if any")
+    matches: List[BlockedSpan] = Field(default_factory=list, description="Every blocked word in the segment, in text order")
+
+
+class ASRTier(BaseModel):
+    """ASR quality tier (model size, beam size, compute type) that served a chunk."""
+    name: str = Field(..., description="Tier name, size:beam:compute")
+    model_size: str = Field(..., description="Whisper model size")
+    beam_size: int = Field(..., ge=1, description="Decoder beam size")
+    compute_type: str = Field(..., description="CTranslate2 compute type")
 
 
 class ASRStreamResponse(BaseModel):
     """Response from /asr/stream endpoint."""
     segments: List[TranscriptSegment] = Field(default_factory=list, description="Transcribed segments")
+    tier: Optional[ASRTier] = Field(default=None, description="Quality tier that transcribed this chunk (None if transcription failed or the engine has no tiers)")
+    status: str = Field(
+        default="ok",
+        description=(
+            "ok, dropped (could not be transcribed before its deadline), coalesced (over quota; "
+            "audio is transcribed with the next chunk), throttled (over quota, rejected), buffered "
+            "(held for a missing earlier seq; audio is transcribed when the gap fills or is skipped), "
+            "late (arrived after its seq was skipped; discarded) or error"
+        ),
+    )
+    language: Optional[str] = Field(default=None, description="Language the chunk was transcribed as")
+    engine: Optional[str] = Field(default=None, description="ASR engine that transcribed the chunk")
+    partial: Optional[str] = Field(
+        default=None,
+        description="Streaming engines: hypothesis for the session's audio not finalized into segments yet",
+    )
+
+
+# -------------------------------------------------
+# SHARED MEDIA TRANSCRIPTS
+# -------------------------------------------------
+class MediaCue(BaseModel):
+    """One caption cue of a media item."""
+    text: str = Field(..., description="Cue text")
+    start_seconds: float = Field(..., ge=0, description="Cue start time in seconds")
+    end_seconds: float = Field(..., ge=0, description="Cue end time in seconds")
+
+
+class MediaTranscript(BaseModel):
+    """Caption track of a media item, shared by every user who watches it."""
+    cues: List[MediaCue] = Field(..., description="Cues in track order")
+
+
+class MediaScanResponse(BaseModel):
+    """Cues of a media item that match a user's wordlists."""
+    media_id: str
+    user_id: str
+    segments: List[TranscriptSegment] = Field(default_factory=list, description="Blocked cues, in time order")
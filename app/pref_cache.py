@@ -0,0 +1,193 @@
+"""
+Per-worker preference cache kept coherent through the preference change feed.
+
+Each worker caches resolved preferences per user. Writes append to the
+`preference_changes` table (see database.PreferenceChangeDB) in the same
+transaction, and every cache polls that table for ids above the last one it
+saw, at most once per poll interval. So a write handled by any worker is
+visible everywhere within ISWEEP_PREF_CACHE_POLL_MS, and a request costs no
+extra query unless a poll is due (the poll itself is an index range scan
+that normally returns no rows).
+
+Caches are kept per database engine, so separate databases (e.g. tests with
+in-memory SQLite) never share entries.
+
+Environment:
+  ISWEEP_PREF_CACHE_SIZE     max cached users per worker (default 10000, 0 disables)
+  ISWEEP_PREF_CACHE_POLL_MS  max staleness across workers (default 500)
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import memory
+from .database import PreferenceChangeDB
+from .metrics import REGISTRY
+
+CACHE_SIZE = int(os.getenv("ISWEEP_PREF_CACHE_SIZE", "10000"))
+POLL_INTERVAL_SECONDS = int(os.getenv("ISWEEP_PREF_CACHE_POLL_MS", "500")) / 1000.0
+
+# Keep this many recent change rows (plus each user's latest) when pruning.
+CHANGE_FEED_RETENTION = 10000
+
+CACHE_LOOKUPS = REGISTRY.counter("isweep_pref_cache_lookups_total", "Preference cache lookups", ("result",))
+CACHE_INVALIDATIONS = REGISTRY.counter(
+    "isweep_pref_cache_invalidations_total", "Preference cache entries invalidated", ("source",)
+)
+
+
+class PreferenceCache:
+    """LRU of per-user values, invalidated from the change feed."""
+
+    def __init__(self, max_entries: int = CACHE_SIZE, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._last_change_id: Optional[int] = None
+        self._last_poll = 0.0
+        self._invalidation_listeners: list[Callable[[str], None]] = []
+
+    def add_invalidation_listener(self, listener: Callable[[str], None]) -> None:
+        """Call `listener(user_id)` whenever a user's entry is invalidated."""
+        self._invalidation_listeners.append(listener)
+
+    def get(self, db: Session, user_id: str, loader: Callable[[], Any]) -> Any:
+        """Cached value for `user_id`, loading it with `loader()` on a miss."""
+        if self.max_entries <= 0:
+            return loader()
+
+        self.poll(db)
+        with self._lock:
+            value = self._entries.get(user_id)
+            if value is not None:
+                self._entries.move_to_end(user_id)
+        if value is not None:
+            CACHE_LOOKUPS.inc(result="hit")
+            return value
+
+        CACHE_LOOKUPS.inc(result="miss")
+        value = loader()
+        with self._lock:
+            self._entries[user_id] = value
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._notify(evicted)
+        return value
+
+    def invalidate(self, user_id: str, source: str = "local") -> None:
+        with self._lock:
+            removed = self._entries.pop(user_id, None) is not None
+        if removed:
+            CACHE_INVALIDATIONS.inc(source=source)
+            self._notify(user_id)
+
+    def _notify(self, user_id: str) -> None:
+        for listener in self._invalidation_listeners:
+            listener(user_id)
+
+    def poll(self, db: Session, force: bool = False) -> None:
+        """Apply changes from the feed if the poll interval has elapsed."""
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_interval:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return  # another thread is polling right now
+        try:
+            self._last_poll = now
+            if self._last_change_id is None:
+                # First poll: nothing is cached yet, just find the feed head.
+                self._last_change_id = db.execute(select(func.max(PreferenceChangeDB.id))).scalar() or 0
+                return
+            rows = db.execute(
+                select(PreferenceChangeDB.id, PreferenceChangeDB.user_id)
+                .where(PreferenceChangeDB.id > self._last_change_id)
+                .order_by(PreferenceChangeDB.id)
+            ).all()
+            for change_id, user_id in rows:
+                self.invalidate(user_id, source="feed")
+                self._last_change_id = change_id
+        finally:
+            self._poll_lock.release()
+
+    def values(self) -> list[Any]:
+        with self._lock:
+            return list(self._entries.values())
+
+
+_caches: "weakref.WeakKeyDictionary[Any, PreferenceCache]" = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def cache_for(db: Session) -> PreferenceCache:
+    """The cache for the database `db` is bound to."""
+    bind = db.get_bind()
+    with _caches_lock:
+        cache = _caches.get(bind)
+        if cache is None:
+            cache = _caches[bind] = PreferenceCache()
+        return cache
+
+
+def all_caches() -> list[PreferenceCache]:
+    with _caches_lock:
+        return list(_caches.values())
+
+
+def record_change(db: Session, user_id: str) -> None:
+    """Append a change-feed row for `user_id` (committed with the caller's transaction)."""
+    change = PreferenceChangeDB(user_id=user_id, changed_at=time.time())
+    db.add(change)
+    db.flush()
+    if change.id % 1000 == 0:
+        _prune_changes(db, change.id - CHANGE_FEED_RETENTION)
+
+
+def record_changes(db: Session, user_ids: Iterable[str]) -> None:
+    """record_change() for many users with one flush (bulk imports)."""
+    now = time.time()
+    changes = [PreferenceChangeDB(user_id=user_id, changed_at=now) for user_id in user_ids]
+    if not changes:
+        return
+    db.add_all(changes)
+    db.flush()
+    first, last = changes[0].id, changes[-1].id
+    if last // 1000 > (first - 1) // 1000:
+        _prune_changes(db, last - CHANGE_FEED_RETENTION)
+
+
+def _prune_changes(db: Session, cutoff: int) -> None:
+    """Delete old feed rows, keeping each user's latest row (their version)."""
+    latest = select(func.max(PreferenceChangeDB.id)).group_by(PreferenceChangeDB.user_id)
+    db.query(PreferenceChangeDB).filter(
+        PreferenceChangeDB.id < cutoff,
+        PreferenceChangeDB.id.not_in(latest),
+    ).delete(synchronize_session=False)
+
+
+def user_version(db: Session, user_id: str) -> int:
+    """Current preference version for `user_id` (0 if never written)."""
+    return db.execute(
+        select(func.max(PreferenceChangeDB.id)).where(PreferenceChangeDB.user_id == user_id)
+    ).scalar() or 0
+
+
+def _caches_memory() -> dict:
+    values = [value for cache in all_caches() for value in cache.values()]
+    total = sum(value.nbytes() if hasattr(value, "nbytes") else sys.getsizeof(value) for value in values)
+    return {"bytes": total, "entries": len(values)}
+
+
+memory.register_reporter("pref_cache.entries", _caches_memory)
@@ -0,0 +1,239 @@
+"""
+Streaming NDJSON export/import of stored preferences.
+
+One line per (user_id, category) row, in the same shape as GET
+/preferences/{user_id} entries:
+
+  {"user_id": "u1", "category": "language", "enabled": true, "action": "mute", ...}
+
+Export pages through the table by primary key, `batch_size` rows at a time,
+so memory stays bounded however many users there are. Import validates each
+line, then upserts `batch_size` rows per transaction: one SELECT for the
+batch's existing rows, one commit, and one change-feed entry per user (see
+app/pref_cache.py). Upserting by (user_id, category) makes import
+idempotent; `skip` resumes after the last committed line reported by a
+previous run.
+
+Used by /admin/preferences/export, /admin/preferences/import and
+`python -m app export-preferences|import-preferences`.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, Optional, Union
+
+from pydantic import ValidationError
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from .database import PreferenceDB
+from .models import Preference
+from .pref_cache import cache_for, record_changes
+from .rules import _db_to_preference, preference_columns
+from .serialization import preference_payload
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+# Invalid lines reported individually; the rest are only counted.
+MAX_REPORTED_ERRORS = 20
+
+
+def _dumps(payload: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(line: Union[str, bytes]):
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+class TransferProgress:
+    """Running totals for an export or import."""
+
+    def __init__(self, skipped: int = 0):
+        self.started = time.perf_counter()
+        self.lines = skipped     # input lines consumed (import), including skipped ones
+        self.committed_lines = skipped  # resume point: lines fully committed
+        self.skipped = skipped
+        self.rows = 0
+        self.users = 0
+        self.errors = 0
+        self.error_lines: list[dict] = []
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "users": self.users,
+            "lines": self.lines,
+            "committed_lines": self.committed_lines,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "error_lines": self.error_lines,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+ProgressCallback = Callable[[TransferProgress], None]
+
+
+def export_preferences(
+    db: Session,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    progress: Optional[TransferProgress] = None,
+    on_batch: Optional[ProgressCallback] = None,
+) -> Iterator[bytes]:
+    """Yield one NDJSON line (bytes, newline-terminated) per stored preference row."""
+    progress = progress or TransferProgress()
+    last_id = 0
+    while True:
+        rows = (
+            db.query(PreferenceDB)
+            .filter(PreferenceDB.id > last_id)
+            .order_by(PreferenceDB.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        last_id = rows[-1].id
+        users = set()
+        for row in rows:
+            users.add(row.user_id)
+            yield _dumps(preference_payload(_db_to_preference(row))) + b"\n"
+        progress.rows += len(rows)
+        progress.users += len(users)  # users split across batches count twice; progress only
+        # Drop the batch from the identity map so memory stays bounded.
+        db.expunge_all()
+        if on_batch:
+            on_batch(progress)
+    logger.info("Preference export finished", extra=progress.as_dict())
+
+
+class PreferenceImporter:
+    """Batched, idempotent NDJSON import; feed lines, then call finish()."""
+
+    def __init__(
+        self,
+        db: Session,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        skip: int = 0,
+        on_batch: Optional[ProgressCallback] = None,
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.progress = TransferProgress(skipped=skip)
+        self._skip = skip
+        self._seen = 0
+        self._batch: dict[tuple[str, str], Preference] = {}
+
+    def feed(self, line: Union[str, bytes]) -> None:
+        """Add one input line; commits when a batch is full."""
+        self._seen += 1
+        if self._seen <= self._skip:
+            return
+        self.progress.lines += 1
+        if not line.strip():
+            self._maybe_flush()
+            return
+        try:
+            pref = Preference.model_validate(_loads(line))
+        except (ValueError, ValidationError) as exc:
+            self.progress.errors += 1
+            if len(self.progress.error_lines) < MAX_REPORTED_ERRORS:
+                self.progress.error_lines.append({"line": self._seen, "error": str(exc).splitlines()[0]})
+            self._maybe_flush()
+            return
+        # A later line for the same row wins, as it would with separate saves.
+        self._batch[(pref.user_id, pref.category)] = pref
+        self._maybe_flush()
+
+    def feed_all(self, lines: Iterable[Union[str, bytes]]) -> TransferProgress:
+        for line in lines:
+            self.feed(line)
+        return self.finish()
+
+    def _maybe_flush(self) -> None:
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Upsert the pending batch in one transaction."""
+        batch, self._batch = self._batch, {}
+        if batch:
+            existing = {
+                (row.user_id, row.category): row
+                for row in self.db.query(PreferenceDB).filter(
+                    tuple_(PreferenceDB.user_id, PreferenceDB.category).in_(list(batch))
+                )
+            }
+            for key, pref in batch.items():
+                columns = preference_columns(pref)
+                row = existing.get(key)
+                if row is None:
+                    self.db.add(PreferenceDB(user_id=pref.user_id, category=pref.category, **columns))
+                else:
+                    for column, value in columns.items():
+                        setattr(row, column, value)
+            users = sorted({user_id for user_id, _ in batch})
+            record_changes(self.db, users)
+            self.db.commit()
+            self.db.expunge_all()
+            cache = cache_for(self.db)
+            for user_id in users:
+                cache.invalidate(user_id)
+            self.progress.rows += len(batch)
+            self.progress.users += len(users)
+        self.progress.committed_lines = self.progress.lines
+        if self.on_batch:
+            self.on_batch(self.progress)
+
+    def finish(self) -> TransferProgress:
+        self.flush()
+        logger.info("Preference import finished", extra=self.progress.as_dict())
+        return self.progress
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Split a stream of byte chunks into lines without holding the whole body."""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        yield from lines
+    if pending:
+        yield pending
+
+
+async def aiter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """iter_lines() for an async byte stream (a request body)."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
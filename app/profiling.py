@@ -0,0 +1,176 @@
+"""
+On-demand per-request profiling.
+
+A request is profiled when its `X-ISweep-Profile` header carries
+ISWEEP_PROFILE_TOKEN (header-triggered profiling is off while the token is
+unset), or when it is picked by random sampling (ISWEEP_PROFILE_SAMPLE_RATE). The middleware
+in main.py makes that decision and stores a ProfileRequest in a context
+variable; handlers wrapped with `@profiled` then run under the profiler in
+their own worker thread, so rules/ASR calls beneath them are included.
+
+Environment:
+  ISWEEP_PROFILE_DIR          output directory (default: profiles)
+  ISWEEP_PROFILE_SAMPLE_RATE  fraction of requests to profile (default: 0)
+  ISWEEP_PROFILE_TOKEN        token the header must carry (default: empty, header ignored)
+  ISWEEP_PROFILE_MAX_FILES    profiles kept in the output directory; older ones
+                              are deleted (default: 100)
+  ISWEEP_PROFILE_MODE         "cprofile" (deterministic, writes .pstats) or
+                              "sample" (stack sampler, writes .collapsed for
+                              flamegraph.pl / speedscope)
+  ISWEEP_PROFILE_INTERVAL_MS  sampling interval for "sample" mode (default: 5)
+"""
+
+from __future__ import annotations
+
+import cProfile
+import functools
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-isweep-profile"
+
+PROFILE_DIR = os.getenv("ISWEEP_PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("ISWEEP_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("ISWEEP_PROFILE_TOKEN", "")
+PROFILE_MAX_FILES = int(os.getenv("ISWEEP_PROFILE_MAX_FILES", "100"))
+PROFILE_MODE = os.getenv("ISWEEP_PROFILE_MODE", "cprofile").lower()
+PROFILE_INTERVAL_MS = float(os.getenv("ISWEEP_PROFILE_INTERVAL_MS", "5"))
+
+
+class ProfileRequest:
+    """Marks the current request for profiling; `output_path` is set once written."""
+
+    def __init__(self, name: str, mode: str = PROFILE_MODE):
+        self.name = name
+        self.mode = mode
+        self.output_path: Optional[str] = None
+
+
+_current: ContextVar[Optional[ProfileRequest]] = ContextVar("isweep_profile_request", default=None)
+
+
+def should_profile(header_value: Optional[str]) -> bool:
+    """Decide whether a request with this header value (or none) gets profiled."""
+    if header_value and PROFILE_TOKEN:
+        return hmac.compare_digest(header_value, PROFILE_TOKEN)
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def request_profile(path: str) -> tuple[ProfileRequest, object]:
+    """Mark the current context for profiling; returns (request, reset token)."""
+    name = path.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+    profile_request = ProfileRequest(name)
+    return profile_request, _current.set(profile_request)
+
+
+def clear_profile(token: object) -> None:
+    _current.reset(token)
+
+
+_PROFILE_SUFFIXES = (".pstats", ".collapsed")
+
+
+def _prune_profiles(keep: int) -> None:
+    """Delete the oldest profiles so at most `keep` remain."""
+    try:
+        names = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(_PROFILE_SUFFIXES))
+    except FileNotFoundError:
+        return
+    # Names start with a millisecond timestamp, so they sort oldest first.
+    for name in names[:max(0, len(names) - keep)]:
+        try:
+            os.unlink(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def _output_path(profile_request: ProfileRequest, suffix: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    _prune_profiles(PROFILE_MAX_FILES - 1)  # room for the one about to be written
+    filename = f"{int(time.time() * 1000)}-{os.getpid()}-{profile_request.name}.{suffix}"
+    return os.path.join(PROFILE_DIR, filename)
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, interval_seconds: float):
+        self.thread_id = thread_id
+        self.interval = interval_seconds
+        self.counts: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="isweep-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _run_profiled(profile_request: ProfileRequest, func: Callable, args: tuple, kwargs: dict):
+    if profile_request.mode == "sample":
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000.0)
+        sampler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sampler.stop()
+            profile_request.output_path = _output_path(profile_request, "collapsed")
+            sampler.write(profile_request.output_path)
+            logger.info("Wrote request profile", extra={"path": profile_request.output_path})
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profile_request.output_path = _output_path(profile_request, "pstats")
+        profiler.dump_stats(profile_request.output_path)
+        logger.info("Wrote request profile", extra={"path": profile_request.output_path})
+
+
+def profiled(func: Callable) -> Callable:
+    """Run a (sync) handler under the profiler when the request asked for it.
+
+    Goes between the route decorator and the function, e.g.::
+
+        @app.post("/event")
+        @profiled
+        def handle_event(...): ...
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile_request = _current.get()
+        if profile_request is None or profile_request.output_path is not None:
+            return func(*args, **kwargs)
+        return _run_profiled(profile_request, func, args, kwargs)
+
+    return wrapper
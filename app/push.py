@@ -0,0 +1,202 @@
+"""
+Server-Sent Events push of decisions per (user_id, tab_id).
+
+Producers (/event with a tab_id, /asr/stream) publish into the tab's
+DecisionChannel from worker threads. Each channel keeps a bounded history
+with increasing event ids, so a client that reconnects with Last-Event-ID
+gets what it missed; a client connecting without one starts at the newest
+event, so stale mute/skip commands are not replayed onto what is playing
+now. Ids start at the channel's creation time in microseconds, so a channel
+recreated after idle pruning or a restart issues ids above any the client
+saw before instead of restarting at 1. Subscribers are asyncio queues on
+the server's event loop, fed with call_soon_threadsafe.
+
+Channels live in this worker process; with several workers, the SSE
+connection and the producing requests must reach the same worker.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, NamedTuple, Optional
+
+from . import memory
+from .metrics import REGISTRY
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+HISTORY_SIZE = 256
+HEARTBEAT_SECONDS = 15.0
+SUBSCRIBER_QUEUE_SIZE = 1000
+CHANNEL_IDLE_SECONDS = 600.0
+
+PUBLISHED = REGISTRY.counter("isweep_push_events_total", "Events published to SSE channels", ("event",))
+DROPPED = REGISTRY.counter("isweep_push_dropped_total", "Events dropped because a subscriber queue was full")
+
+
+def _dumps(payload: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload).decode("utf-8")
+    return json.dumps(payload, separators=(",", ":"))
+
+
+class PushEvent(NamedTuple):
+    id: int
+    event: str
+    data: str
+
+    def encode(self) -> str:
+        return f"id: {self.id}\nevent: {self.event}\ndata: {self.data}\n\n"
+
+
+class DecisionChannel:
+    """Event history and live subscribers for one (user_id, tab_id)."""
+
+    def __init__(self, history_size: int = HISTORY_SIZE):
+        self._history: deque[PushEvent] = deque(maxlen=history_size)
+        # Above every id of an earlier channel for the same tab (see module docstring).
+        self._next_id = time.time_ns() // 1000
+        self._subscribers: set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = set()
+        self._lock = threading.Lock()
+        self.last_active = time.monotonic()
+
+    def publish(self, event: str, payload: Any) -> int:
+        """Append an event and wake subscribers; safe to call from any thread."""
+        data = _dumps(payload)
+        with self._lock:
+            item = PushEvent(self._next_id, event, data)
+            self._next_id += 1
+            self._history.append(item)
+            subscribers = list(self._subscribers)
+            self.last_active = time.monotonic()
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_offer, queue, item)
+        PUBLISHED.inc(event=event)
+        return item.id
+
+    def subscribe(self, loop: asyncio.AbstractEventLoop) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add((loop, queue))
+            self.last_active = time.monotonic()
+        return queue
+
+    def unsubscribe(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard((loop, queue))
+            self.last_active = time.monotonic()
+
+    @property
+    def head(self) -> int:
+        """Id of the newest event published (the first id minus one if none)."""
+        with self._lock:
+            return self._next_id - 1
+
+    def events_after(self, last_id: int) -> list[PushEvent]:
+        """History events with id > last_id (oldest first)."""
+        with self._lock:
+            return [item for item in self._history if item.id > last_id]
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(len(item.data) + len(item.event) + 64 for item in self._history)
+
+
+def _offer(queue: asyncio.Queue, item: PushEvent) -> None:
+    try:
+        queue.put_nowait(item)
+    except asyncio.QueueFull:
+        # The client can catch up from history via Last-Event-ID.
+        DROPPED.inc()
+
+
+_channels: dict[tuple[str, int], DecisionChannel] = {}
+_channels_lock = threading.Lock()
+
+
+def get_channel(user_id: str, tab_id: int) -> DecisionChannel:
+    """Get or create the channel for (user_id, tab_id); prunes idle channels."""
+    key = (user_id, tab_id)
+    now = time.monotonic()
+    with _channels_lock:
+        channel = _channels.get(key)
+        if channel is None:
+            for other_key, other in list(_channels.items()):
+                if other.subscriber_count == 0 and now - other.last_active > CHANNEL_IDLE_SECONDS:
+                    del _channels[other_key]
+            channel = _channels[key] = DecisionChannel()
+        return channel
+
+
+def publish(user_id: str, tab_id: Optional[int], event: str, payload: Any) -> Optional[int]:
+    """Publish to a tab's channel; no-op without a tab_id."""
+    if tab_id is None:
+        return None
+    return get_channel(user_id, tab_id).publish(event, payload)
+
+
+async def event_stream(
+    channel: DecisionChannel,
+    last_event_id: Optional[int],
+    is_disconnected: Callable[[], Any],
+    heartbeat_seconds: float = HEARTBEAT_SECONDS,
+) -> AsyncIterator[str]:
+    """SSE body: replay after last_event_id, then live events with heartbeats.
+
+    A last_event_id of None (a fresh connection), or one this channel never
+    issued, starts at the channel head without replaying history.
+    """
+    loop = asyncio.get_running_loop()
+    # Subscribe before replaying so nothing published in between is lost.
+    queue = channel.subscribe(loop)
+    head = channel.head
+    if last_event_id is None or last_event_id > head:
+        last_event_id = head
+    try:
+        yield f"retry: {int(heartbeat_seconds * 1000)}\n\n"
+        for item in channel.events_after(last_event_id):
+            last_event_id = item.id
+            yield item.encode()
+        while True:
+            if await is_disconnected():
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if item.id <= last_event_id:
+                continue
+            last_event_id = item.id
+            yield item.encode()
+    finally:
+        channel.unsubscribe(loop, queue)
+
+
+def _subscriber_gauge():
+    with _channels_lock:
+        total = sum(c.subscriber_count for c in _channels.values())
+    yield (), total
+
+
+REGISTRY.gauge("isweep_push_subscribers", "Open SSE connections", callback=_subscriber_gauge)
+
+
+def _channels_memory() -> dict:
+    with _channels_lock:
+        channels = list(_channels.values())
+    return {"bytes": sum(c.nbytes() for c in channels), "entries": len(channels)}
+
+
+memory.register_reporter("push.channels", _channels_memory)
@@ -6,68 +6,124 @@ Now uses SQLAlchemy ORM for persistence.
 
 from __future__ import annotations
 
-import re
-from typing import Optional
+import json
+import sys
+import weakref
+from typing import Any, NamedTuple, Optional, Union
 from sqlalchemy.orm import Session
 from .models import Preference, Event, DecisionResponse, Action
 from .database import PreferenceDB
+from .matching import (
+    Matcher, NormalizedText, WordMatch, acquire_matcher, compile_matcher, normalize_text, release_matcher,
+)
+from .pref_cache import cache_for, record_change, user_version
+from .decision_cache import cache_key, decision_cache_for
+from .timing import span
+
+
+# -------------------------------------------------
+# RESOLVED PREFERENCES (internal form)
+# -------------------------------------------------
+class ResolvedPreference(NamedTuple):
+    """Immutable internal form of a Preference, used by decide() and the matchers.
+
+    No user_id, so default instances are shared by every user; `stored` is
+    False for defaults. Convert with to_model() at the API boundary.
+    """
+
+    category: str
+    enabled: bool
+    action: Action
+    duration_seconds: float
+    blocked_words: tuple[str, ...] = ()
+    custom_words: tuple[str, ...] = ()
+    selected_packs: tuple[tuple[str, Any], ...] = ()
+    caption_offset_ms: int = 300
+    stored: bool = True
+
+    @classmethod
+    def from_model(cls, pref: Preference, stored: bool = True) -> "ResolvedPreference":
+        return cls(
+            pref.category,
+            pref.enabled,
+            pref.action,
+            pref.duration_seconds,
+            tuple(pref.blocked_words),
+            tuple(pref.custom_words),
+            tuple(pref.selected_packs.items()),
+            pref.caption_offset_ms,
+            stored,
+        )
+
+    def to_model(self, user_id: str) -> Preference:
+        return Preference(
+            user_id=user_id,
+            category=self.category,
+            enabled=self.enabled,
+            action=self.action,
+            duration_seconds=self.duration_seconds,
+            blocked_words=list(self.blocked_words),
+            selected_packs=dict(self.selected_packs),
+            custom_words=list(self.custom_words),
+            caption_offset_ms=self.caption_offset_ms,
+        )
 
 
 # -------------------------------------------------
 # DEFAULT PREFERENCES
 # -------------------------------------------------
+# Standardized category keys: language, violence, sexual
+DEFAULT_PREFERENCES: tuple[ResolvedPreference, ...] = (
+    ResolvedPreference("language", True, Action.mute, 0.5, stored=False),
+    ResolvedPreference("violence", True, Action.fast_forward, 10, stored=False),
+    ResolvedPreference("sexual", True, Action.skip, 30, stored=False),
+)
+
+
 def _default_preferences_for_user(user_id: str) -> list[Preference]:
-    """Default preferences when user has no custom config.
-    
-    Standardized category keys: language, violence, sexual
-    """
-    return [
-        Preference(user_id=user_id, category="language", enabled=True, action=Action.mute, duration_seconds=0.5, blocked_words=[], caption_offset_ms=300),
-        Preference(user_id=user_id, category="violence", enabled=True, action=Action.fast_forward, duration_seconds=10, blocked_words=[], caption_offset_ms=300),
-        Preference(user_id=user_id, category="sexual", enabled=True, action=Action.skip, duration_seconds=30, blocked_words=[], caption_offset_ms=300),
-    ]
+    """Default preferences when user has no custom config."""
+    return [default.to_model(user_id) for default in DEFAULT_PREFERENCES]
 
 
 # -------------------------------------------------
 # DATABASE OPERATIONS
 # -------------------------------------------------
-def save_preference(db: Session, pref: Preference) -> None:
-    """
-    Save/overwrite a preference by user_id + category.
-    """
-    # Check if preference already exists
+def preference_columns(pref: Preference) -> dict[str, Any]:
+    """PreferenceDB column values for `pref` (lists/dicts encoded for storage)."""
+    return {
+        "enabled": pref.enabled,
+        "action": pref.action.value,
+        "duration_seconds": pref.duration_seconds,
+        "blocked_words": ",".join(pref.blocked_words),
+        "selected_packs": json.dumps(pref.selected_packs),
+        "custom_words": json.dumps(pref.custom_words),
+        "caption_offset_ms": pref.caption_offset_ms,
+    }
+
+
+def _upsert_preference(db: Session, pref: Preference) -> None:
     existing = db.query(PreferenceDB).filter(
         PreferenceDB.user_id == pref.user_id,
         PreferenceDB.category == pref.category,
     ).first()
 
-    import json
-    
     if existing:
         # Update
-        existing.enabled = pref.enabled
-        existing.action = pref.action.value
-        existing.duration_seconds = pref.duration_seconds
-        existing.blocked_words = ",".join(pref.blocked_words)
-        existing.selected_packs = json.dumps(pref.selected_packs)
-        existing.custom_words = json.dumps(pref.custom_words)
-        existing.caption_offset_ms = pref.caption_offset_ms
+        for column, value in preference_columns(pref).items():
+            setattr(existing, column, value)
     else:
         # Insert
-        db_pref = PreferenceDB(
-            user_id=pref.user_id,
-            category=pref.category,
-            enabled=pref.enabled,
-            action=pref.action.value,
-            duration_seconds=pref.duration_seconds,
-            blocked_words=",".join(pref.blocked_words),
-            selected_packs=json.dumps(pref.selected_packs),
-            custom_words=json.dumps(pref.custom_words),
-            caption_offset_ms=pref.caption_offset_ms,
-        )
-        db.add(db_pref)
+        db.add(PreferenceDB(user_id=pref.user_id, category=pref.category, **preference_columns(pref)))
+
 
+def save_preference(db: Session, pref: Preference) -> None:
+    """
+    Save/overwrite a preference by user_id + category.
+    """
+    _upsert_preference(db, pref)
+    record_change(db, pref.user_id)
     db.commit()
+    cache_for(db).invalidate(pref.user_id)
 
 
 def save_bulk_preferences(db: Session, user_id: str, preferences: dict[str, any]) -> None:
@@ -75,8 +131,6 @@ def save_bulk_preferences(db: Session, user_id: str, preferences: dict[str, any]
     Save multiple preferences for a user in one transaction.
     preferences: dict mapping category -> {enabled, action, duration_seconds, blocked_words, selected_packs, custom_words, caption_offset_ms}
     """
-    import json
-    
     for category, pref_data in preferences.items():
         # Convert dict to Preference model
         pref = Preference(
@@ -90,38 +144,11 @@ def save_bulk_preferences(db: Session, user_id: str, preferences: dict[str, any]
             custom_words=pref_data.get('custom_words', []),
             caption_offset_ms=int(pref_data.get('caption_offset_ms', 300)),
         )
-        
-        # Check if preference already exists
-        existing = db.query(PreferenceDB).filter(
-            PreferenceDB.user_id == user_id,
-            PreferenceDB.category == category,
-        ).first()
-
-        if existing:
-            # Update
-            existing.enabled = pref.enabled
-            existing.action = pref.action.value
-            existing.duration_seconds = pref.duration_seconds
-            existing.blocked_words = ",".join(pref.blocked_words)
-            existing.selected_packs = json.dumps(pref.selected_packs)
-            existing.custom_words = json.dumps(pref.custom_words)
-            existing.caption_offset_ms = pref.caption_offset_ms
-        else:
-            # Insert
-            db_pref = PreferenceDB(
-                user_id=user_id,
-                category=category,
-                enabled=pref.enabled,
-                action=pref.action.value,
-                duration_seconds=pref.duration_seconds,
-                blocked_words=",".join(pref.blocked_words),
-                selected_packs=json.dumps(pref.selected_packs),
-                custom_words=json.dumps(pref.custom_words),
-                caption_offset_ms=pref.caption_offset_ms,
-            )
-            db.add(db_pref)
+        _upsert_preference(db, pref)
     
+    record_change(db, user_id)
     db.commit()
+    cache_for(db).invalidate(user_id)
 
 
 def get_preference(db: Session, user_id: str, category: str) -> Optional[Preference]:
@@ -137,32 +164,77 @@ def get_preference(db: Session, user_id: str, category: str) -> Optional[Prefere
     return _db_to_preference(db_pref)
 
 
+class CachedPreferences:
+    """A user's resolved preferences as held in the preference cache.
+
+    `prefs` maps category -> ResolvedPreference, defaults included (their
+    `stored` is False). `version` is the user's change-feed version.
+    `matcher` is the interned matcher for the user's wordlists (see
+    MatcherRegistry), shared with every user configured the same way; the
+    reference is released when the entry is garbage collected.
+    """
+
+    __slots__ = ("user_id", "version", "prefs", "matcher", "__weakref__")
+
+    def __init__(self, user_id: str, version: int, prefs: dict[str, ResolvedPreference]):
+        self.user_id = user_id
+        self.version = version
+        self.prefs = prefs
+        self.matcher = acquire_matcher(_matcher_config(prefs))
+        weakref.finalize(self, release_matcher, self.matcher)
+
+    def stored_preference(self, category: str) -> Optional[ResolvedPreference]:
+        """Like get_preference(): only categories saved in the database."""
+        pref = self.prefs.get(category)
+        return pref if pref is not None and pref.stored else None
+
+    def nbytes(self) -> int:
+        """Estimated bytes held by this entry (shared defaults and matcher excluded)."""
+        total = sys.getsizeof(self.prefs)
+        for pref in self.prefs.values():
+            if pref.stored:
+                total += sys.getsizeof(pref) + sys.getsizeof(pref.blocked_words) + sys.getsizeof(pref.custom_words)
+                total += sum(sys.getsizeof(w) for w in pref.blocked_words + pref.custom_words)
+        return total + 64  # the slotted object itself
+
+
+def resolve_preferences(db: Session, user_id: str) -> CachedPreferences:
+    """Cached preferences for `user_id` (see app/pref_cache.py for coherence)."""
+    def load() -> CachedPreferences:
+        version = user_version(db, user_id)
+        return CachedPreferences(user_id, version, _with_defaults(_load_stored_preferences(db, user_id)))
+
+    return cache_for(db).get(db, user_id, load)
+
+
 def get_all_preferences(db: Session, user_id: str) -> dict[str, Preference]:
     """Get all preferences for a user, filling in defaults if needed."""
-    db_prefs = db.query(PreferenceDB).filter(PreferenceDB.user_id == user_id).all()
+    return {category: pref.to_model(user_id) for category, pref in resolve_preferences(db, user_id).prefs.items()}
 
-    result = {}
-    categories_found = set()
 
-    for db_pref in db_prefs:
-        pref = _db_to_preference(db_pref)
-        result[pref.category] = pref
-        categories_found.add(pref.category)
+def _load_stored_preferences(db: Session, user_id: str) -> dict[str, ResolvedPreference]:
+    """Preferences saved in the database for `user_id`, by category."""
+    db_prefs = db.query(PreferenceDB).filter(PreferenceDB.user_id == user_id).all()
+    return {db_pref.category: _db_to_resolved(db_pref) for db_pref in db_prefs}
 
-    # Add defaults for missing categories
-    defaults = _default_preferences_for_user(user_id)
-    for default_pref in defaults:
-        if default_pref.category not in categories_found:
-            result[default_pref.category] = default_pref
 
+def _with_defaults(stored: dict[str, ResolvedPreference]) -> dict[str, ResolvedPreference]:
+    """`stored` plus the shared default preferences for missing categories."""
+    result = dict(stored)
+    for default in DEFAULT_PREFERENCES:
+        if default.category not in stored:
+            result[default.category] = default
     return result
 
 
 def _db_to_preference(db_pref: PreferenceDB) -> Preference:
     """Convert database record to Pydantic model."""
-    import json
-    
-    blocked_words = [w.strip() for w in db_pref.blocked_words.split(",") if w.strip()] if db_pref.blocked_words else []
+    return _db_to_resolved(db_pref).to_model(db_pref.user_id)
+
+
+def _db_to_resolved(db_pref: PreferenceDB) -> ResolvedPreference:
+    """Convert database record to the internal form."""
+    blocked_words = tuple(w.strip() for w in db_pref.blocked_words.split(",") if w.strip()) if db_pref.blocked_words else ()
     
     # Parse JSON fields with fallback to defaults
     try:
@@ -178,16 +250,15 @@ def _db_to_preference(db_pref: PreferenceDB) -> Preference:
     # Get caption offset with fallback to default
     caption_offset_ms = int(db_pref.caption_offset_ms) if hasattr(db_pref, 'caption_offset_ms') and db_pref.caption_offset_ms is not None else 300
     
-    return Preference(
-        user_id=db_pref.user_id,
-        category=db_pref.category,
-        enabled=db_pref.enabled,
-        action=Action(db_pref.action),
-        duration_seconds=db_pref.duration_seconds,
-        blocked_words=blocked_words,
-        selected_packs=selected_packs,
-        custom_words=custom_words,
-        caption_offset_ms=caption_offset_ms,
+    return ResolvedPreference(
+        db_pref.category,
+        bool(db_pref.enabled),
+        Action(db_pref.action),
+        float(db_pref.duration_seconds or 0.0),
+        blocked_words,
+        tuple(custom_words),
+        tuple(selected_packs.items()) if isinstance(selected_packs, dict) else (),
+        caption_offset_ms,
     )
 
 
@@ -197,46 +268,71 @@ def _db_to_preference(db_pref: PreferenceDB) -> Preference:
 def _find_blocked_word_match(db: Session, user_id: str, text: str) -> Optional[tuple[str, str, str]]:
     """
     Return (category, matched_word, regex_used) if any blocked word matches.
-    Uses word-boundary regex matching to ensure exact phrase/word boundaries.
+    Matching runs on normalized text (see app/matching.py), so case, accents,
+    leetspeak, repeated letters and "*" masks are tolerated, while word
+    boundaries still apply.
     Example:
-      - "god" matches only as \bgod\b (standalone word, not inside other words)
-      - "god almighty" matches only as \bgod\s+almighty\b (words in sequence)
+      - "god" matches "god" and "G0D" but not "godly"
+      - "god almighty" matches the words in sequence with any whitespace between
+    """
+    with span("prefs"):
+        resolved = resolve_preferences(db, user_id)
+    with span("match"):
+        hit = resolved.matcher.search(normalize_text(text))
+    return (hit.category, hit.word, hit.pattern) if hit else None
+
+
+def find_all_blocked_word_matches(db: Session, user_id: str, texts: list[str]) -> list[list[WordMatch]]:
+    """
+    Every blocked-word hit (with category, word and character span) for each
+    text, e.g. the segments of one ASR chunk. One preference lookup for the
+    whole batch, one linear scan per text.
+    """
+    with span("prefs"):
+        resolved = resolve_preferences(db, user_id)
+    with span("match"):
+        return [resolved.matcher.find_all(normalize_text(text)) for text in texts]
+
+
+def _matcher_config(prefs: dict[str, Union[Preference, ResolvedPreference]]):
+    return (
+        (category, (*pref.blocked_words, *pref.custom_words))
+        for category, pref in prefs.items()
+        if pref.enabled
+    )
+
+
+def matcher_for_preferences(prefs: dict[str, Union[Preference, ResolvedPreference]]) -> Matcher:
+    """Compiled matcher over the enabled categories' blocked + custom words."""
+    return compile_matcher(_matcher_config(prefs))
+
+
+def match_blocked_words(prefs: dict[str, Union[Preference, ResolvedPreference]], normalized: NormalizedText) -> Optional[tuple[str, str, str]]:
     """
-    prefs = get_all_preferences(db, user_id)
-    text_lower = text.lower()
-
-    for category, pref in prefs.items():
-        if not pref.enabled:
-            continue
-
-        # Merge built-in blocked words with user-provided custom words.
-        merged_words = list(pref.blocked_words) + list(pref.custom_words)
-
-        for blocked_word in merged_words:
-            if not blocked_word or not blocked_word.strip():
-                continue
-            
-            w_clean = blocked_word.strip().lower()
-            
-            # Build regex pattern with word boundaries
-            # Replace punctuation with flexible whitespace, keep word characters
-            # Example: "god almighty" -> r'\bgod\s+almighty\b'
-            # Example: "goddamn" -> r'\bgoddamn\b'
-            
-            # Escape special regex chars, but preserve word structure
-            pattern = re.escape(w_clean)
-            # Replace escaped spaces with flexible whitespace
-            pattern = pattern.replace(r'\ ', r'\s+')
-            # Add word boundaries at start and end
-            pattern = r'\b' + pattern + r'\b'
-            
-            # Try to match the pattern in normalized text
-            match = re.search(pattern, text_lower)
-            if match:
-                matched_substring = match.group(0)
-                return (category, blocked_word, pattern)
-
-    return None
+    Scan already-normalized text against the enabled categories' words.
+
+    `normalized` can be shared across users, so a batch pays for
+    normalization once per text.
+    """
+    hit = matcher_for_preferences(prefs).search(normalized)
+    if hit is None:
+        return None
+    return (hit.category, hit.word, hit.pattern)
+
+
+# Content model confidence needed for a content_type match.
+CONFIDENCE_THRESHOLD = 0.70
+
+
+def _confidence_bucket(confidence: Optional[float]) -> Optional[bool]:
+    """Which side of the threshold `confidence` is on; all decide() depends on."""
+    if confidence is None:
+        return None
+    return confidence >= CONFIDENCE_THRESHOLD
+
+
+def _category_reason(content_type: str, confidence: Optional[float]) -> str:
+    return f"Matched category '{content_type}' (confidence={confidence})"
 
 
 def decide(db: Session, event: Event) -> DecisionResponse:
@@ -246,13 +342,49 @@ def decide(db: Session, event: Event) -> DecisionResponse:
       1) blocked word match (if any)
       2) content_type match + confidence threshold
       3) no action
+
+    Decisions are memoized per preference version and normalized text (see
+    app/decision_cache.py).
     """
+    with span("prefs"):
+        resolved = resolve_preferences(db, event.user_id)
+    normalized = normalize_text(event.text) if event.text else None
+
+    memo = decision_cache_for(db)
+    if not memo.enabled:
+        return _decide(resolved, normalized, event)[0]
+
+    key = cache_key(
+        event.user_id,
+        resolved.version,
+        normalized.text if normalized is not None else None,
+        event.content_type,
+        _confidence_bucket(event.confidence),
+    )
+    cached = memo.get(key)
+    if cached is not None:
+        decision, echoes_confidence = cached
+        if echoes_confidence:
+            # The reason quotes the exact confidence, which the key only buckets.
+            return decision.model_copy(update={"reason": _category_reason(event.content_type, event.confidence)})
+        return decision.model_copy()
+
+    decision, echoes_confidence = _decide(resolved, normalized, event)
+    memo.put(key, event.user_id, (decision.model_copy(), echoes_confidence))
+    return decision
+
+
+def _decide(
+    resolved: CachedPreferences, normalized: Optional[NormalizedText], event: Event
+) -> tuple[DecisionResponse, bool]:
+    """The decision for `event`, and whether its reason quotes event.confidence."""
     # 1) Blocked words
-    if event.text:
-        hit = _find_blocked_word_match(db, event.user_id, event.text)
+    if normalized is not None:
+        with span("match"):
+            hit = resolved.matcher.search(normalized)
         if hit:
-            category, word, regex_pattern = hit
-            pref = get_preference(db, event.user_id, category)
+            category, word, regex_pattern = hit.category, hit.word, hit.pattern
+            pref = resolved.stored_preference(category)
             if pref and pref.enabled:
                 return DecisionResponse(
                     action=pref.action,
@@ -260,22 +392,20 @@ def decide(db: Session, event: Event) -> DecisionResponse:
                     reason=f"Blocked word match: '{word}' (regex: {regex_pattern})",
                     matched_category=category,
                     matched_term=word,
-                )
+                ), False
 
     # 2) Content model category
     if event.content_type:
-        pref = get_preference(db, event.user_id, event.content_type)
+        pref = resolved.stored_preference(event.content_type)
         if pref and pref.enabled:
-            # Simple threshold you can tune later
-            threshold = 0.70
-            if event.confidence is None or event.confidence >= threshold:
+            if _confidence_bucket(event.confidence) is not False:
                 return DecisionResponse(
                     action=pref.action,
                     duration_seconds=pref.duration_seconds,
-                    reason=f"Matched category '{event.content_type}' (confidence={event.confidence})",
+                    reason=_category_reason(event.content_type, event.confidence),
                     matched_category=event.content_type,
                     matched_term=event.content_type,
-                )
+                ), True
 
     # 3) No action needed
     return DecisionResponse(
@@ -284,4 +414,4 @@ def decide(db: Session, event: Event) -> DecisionResponse:
         reason="No filter matched",
         matched_category=None,
         matched_term=None,
-    )
+    ), False
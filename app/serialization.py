@@ -0,0 +1,90 @@
+"""
+Fast response serialization.
+
+Hot endpoints build plain dicts from data that is already validated (request
+models on the way in, our own rules/ASR results on the way out) and return a
+FastJSONResponse directly, which skips FastAPI's second validation pass
+through `response_model`. The declared response models still document the
+shape in OpenAPI; tests check that these payloads validate against them.
+
+orjson is used when installed, otherwise the stdlib json encoder.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+
+from .models import Preference
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when available."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def preference_payload(pref: Preference) -> dict[str, Any]:
+    """Same fields as `pref.model_dump()`, without going through Pydantic."""
+    return {
+        "user_id": pref.user_id,
+        "category": pref.category,
+        "enabled": pref.enabled,
+        "action": pref.action.value,
+        "duration_seconds": pref.duration_seconds,
+        "blocked_words": list(pref.blocked_words),
+        "selected_packs": dict(pref.selected_packs),
+        "custom_words": list(pref.custom_words),
+        "caption_offset_ms": pref.caption_offset_ms,
+    }
+
+
+def blocked_span_payload(
+    word: str,
+    category: str,
+    char_start: int,
+    char_end: int,
+    start_seconds: float,
+    end_seconds: float,
+) -> dict[str, Any]:
+    """Plain-dict form of models.BlockedSpan."""
+    return {
+        "word": word,
+        "category": category,
+        "char_start": char_start,
+        "char_end": char_end,
+        "start_seconds": start_seconds,
+        "end_seconds": end_seconds,
+    }
+
+
+def segment_payload(
+    text: str,
+    start_seconds: float,
+    end_seconds: float,
+    confidence: float = 0.9,
+    matches: Optional[list[dict[str, Any]]] = None,
+) -> dict[str, Any]:
+    """Plain-dict form of models.TranscriptSegment; the first match fills blocked_word/category."""
+    matches = matches or []
+    first = matches[0] if matches else None
+    return {
+        "text": text,
+        "start_seconds": start_seconds,
+        "end_seconds": end_seconds,
+        "confidence": confidence,
+        "is_blocked": first is not None,
+        "blocked_word": first["word"] if first else None,
+        "category": first["category"] if first else None,
+        "matches": matches,
+    }
@@ -0,0 +1,370 @@
+"""
+Pluggable storage for buffered ASR audio chunks per (user_id, tab_id).
+
+  - InProcessSessionStore (default): AudioBuffer objects in a dict. Only
+    correct with a single worker process.
+  - FileSessionStore: one directory per session, one file per chunk named by
+    seq, guarded by an OS file lock. The buffered chunks are shared by worker
+    processes on one host (uvicorn --workers N). On Linux it defaults to
+    /dev/shm, so chunks stay in shared memory rather than on disk. Session
+    directories idle for SESSION_IDLE_SECONDS are removed.
+
+Select with ISWEEP_SESSION_STORE=memory|file; ISWEEP_SESSION_DIR overrides
+the FileSessionStore directory.
+
+Only the buffered audio lives here. The rest of a tab's live state — the
+language pin and transcript context (app/asr_sessions.py), SSE channels
+(app/push.py), admission buckets and in-flight dedup — stays in the worker
+process that built it, so with several workers each tab should still be
+routed to one worker; the file store keeps chunks from being lost when it
+is not.
+
+Reads return chunks ordered by seq, and `discard` removes only the chunks a
+caller actually consumed, so chunks added by another worker while ASR runs
+are kept for the next batch.
+"""
+
+from __future__ import annotations
+
+import bisect
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from . import memory
+
+SessionKey = Tuple[str, int]
+Chunk = Tuple[int, bytes]
+
+DEFAULT_MAX_CHUNKS = 10
+
+# FileSessionStore: session directories without writes this long are removed,
+# checked at most once per EXPIRE_INTERVAL_SECONDS per process.
+SESSION_IDLE_SECONDS = 600.0
+EXPIRE_INTERVAL_SECONDS = 60.0
+
+
+class AudioBuffer:
+    """In-memory rolling buffer for audio chunks."""
+
+    def __init__(self, max_chunks: int = DEFAULT_MAX_CHUNKS):
+        """
+        Args:
+            max_chunks: Maximum chunks to keep in memory per session.
+                       Chunks are processed in batches of N chunks (e.g., 3-4),
+                       so keeping 10 allows ~3 ASR runs before oldest is pruned.
+        """
+        self.max_chunks = max_chunks
+        self.chunks: List[Tuple[int, bytes]] = []  # (seq, audio_bytes), ordered by seq
+        self.lock = threading.Lock()
+
+    def add_chunk(self, seq: int, audio_bytes: bytes) -> int:
+        """Add a chunk in seq order; returns the number of buffered chunks.
+
+        A resent seq replaces the buffered copy. Over the limit, the lowest
+        seqs are pruned, like FileSessionStore.
+        """
+        with self.lock:
+            index = bisect.bisect_left([s for s, _ in self.chunks], seq)
+            if index < len(self.chunks) and self.chunks[index][0] == seq:
+                self.chunks[index] = (seq, audio_bytes)
+            else:
+                self.chunks.insert(index, (seq, audio_bytes))
+            # Prune if over limit
+            if len(self.chunks) > self.max_chunks:
+                self.chunks = self.chunks[-self.max_chunks:]
+            return len(self.chunks)
+
+    def get_all_bytes(self) -> Optional[bytes]:
+        """Concatenate all chunks into single audio bytes (for Whisper)."""
+        with self.lock:
+            if not self.chunks:
+                return None
+            # Simple concatenation (works for most audio formats)
+            return b''.join(audio_bytes for _, audio_bytes in self.chunks)
+
+    def get_and_clear(self) -> Optional[bytes]:
+        """Get all bytes and clear buffer."""
+        with self.lock:
+            if not self.chunks:
+                return None
+            audio_bytes = b''.join(audio_bytes for _, audio_bytes in self.chunks)
+            self.chunks = []
+            return audio_bytes
+
+    def snapshot(self) -> List[Chunk]:
+        """Copy of the buffered (seq, bytes) chunks, ordered by seq."""
+        with self.lock:
+            return list(self.chunks)
+
+    def discard(self, seqs: Iterable[int]) -> None:
+        """Remove the chunks with these sequence numbers."""
+        drop = set(seqs)
+        with self.lock:
+            self.chunks = [(seq, data) for seq, data in self.chunks if seq not in drop]
+
+    def clear(self) -> None:
+        """Clear the buffer."""
+        with self.lock:
+            self.chunks = []
+
+    def nbytes(self) -> int:
+        """Bytes held by buffered chunks (including object overhead)."""
+        with self.lock:
+            return memory.bytes_size(audio_bytes for _, audio_bytes in self.chunks)
+
+
+class SessionStore(ABC):
+    """Buffered audio chunks per session key."""
+
+    @abstractmethod
+    def add_chunk(self, key: SessionKey, seq: int, audio_bytes: bytes) -> int:
+        """Store a chunk; returns the number of chunks now buffered for `key`."""
+
+    @abstractmethod
+    def snapshot(self, key: SessionKey) -> List[Chunk]:
+        """Buffered chunks for `key` as (seq, bytes)."""
+
+    @abstractmethod
+    def discard(self, key: SessionKey, seqs: Iterable[int]) -> None:
+        """Remove the given chunks (after they were transcribed)."""
+
+    @abstractmethod
+    def clear(self, key: SessionKey) -> None:
+        """Drop everything buffered for `key`."""
+
+    @abstractmethod
+    def memory_report(self) -> dict:
+        """Accounting for the memory reporter (see app/memory.py)."""
+
+
+class InProcessSessionStore(SessionStore):
+    """Default store: AudioBuffer per session in this process."""
+
+    def __init__(self, max_chunks: int = DEFAULT_MAX_CHUNKS):
+        self.max_chunks = max_chunks
+        self.buffers: "defaultdict[SessionKey, AudioBuffer]" = defaultdict(lambda: AudioBuffer(max_chunks=max_chunks))
+        self.lock = threading.Lock()
+
+    def get_buffer(self, key: SessionKey) -> AudioBuffer:
+        with self.lock:
+            if key not in self.buffers:
+                self.buffers[key] = AudioBuffer(max_chunks=self.max_chunks)
+            return self.buffers[key]
+
+    def add_chunk(self, key: SessionKey, seq: int, audio_bytes: bytes) -> int:
+        return self.get_buffer(key).add_chunk(seq, audio_bytes)
+
+    def snapshot(self, key: SessionKey) -> List[Chunk]:
+        return self.get_buffer(key).snapshot()
+
+    def discard(self, key: SessionKey, seqs: Iterable[int]) -> None:
+        self.get_buffer(key).discard(seqs)
+
+    def clear(self, key: SessionKey) -> None:
+        with self.lock:
+            buffer = self.buffers.get(key)
+        if buffer is not None:
+            buffer.clear()
+
+    def memory_report(self) -> dict:
+        with self.lock:
+            buffers = list(self.buffers.values())
+        return {
+            "bytes": sum(b.nbytes() for b in buffers),
+            "entries": len(buffers),
+            "chunks": sum(len(b.chunks) for b in buffers),
+        }
+
+
+def _default_session_dir() -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "isweep-sessions")
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[int]:
+    """Exclusive cross-process lock on `path` (flock on POSIX, msvcrt on Windows); yields the fd."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            try:
+                yield fd
+            finally:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield fd
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def _is_current(fd: int, path: str) -> bool:
+    """Whether the locked `fd` is still the file at `path`.
+
+    After waiting for the lock, the file may have been removed by expiry
+    (and recreated by another process), so the lock no longer guards anything.
+    """
+    try:
+        return os.fstat(fd).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+
+class FileSessionStore(SessionStore):
+    """Chunks as files under `root/<session>/<seq>.chunk`, shared by local processes."""
+
+    SUFFIX = ".chunk"
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        max_chunks: int = DEFAULT_MAX_CHUNKS,
+        idle_seconds: float = SESSION_IDLE_SECONDS,
+    ):
+        self.root = root or _default_session_dir()
+        self.max_chunks = max_chunks
+        self.idle_seconds = idle_seconds
+        self._next_expiry = time.monotonic() + EXPIRE_INTERVAL_SECONDS
+        os.makedirs(self.root, exist_ok=True)
+
+    def _session_dir(self, key: SessionKey) -> str:
+        user_id, tab_id = key
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(self.root, f"{digest}_{int(tab_id)}")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @contextmanager
+    def _locked(self, key: SessionKey) -> Iterator[str]:
+        """Lock the session and yield its directory, recreated if expire() removed it meanwhile."""
+        while True:
+            session_dir = self._session_dir(key)
+            lock_path = os.path.join(session_dir, ".lock")
+            with ExitStack() as stack:
+                try:
+                    fd = stack.enter_context(_file_lock(lock_path))
+                except FileNotFoundError:
+                    continue  # directory expired between makedirs and open
+                if _is_current(fd, lock_path):
+                    yield session_dir
+                    return
+
+    def _chunk_files(self, session_dir: str) -> List[Tuple[int, str]]:
+        files = []
+        for name in os.listdir(session_dir):
+            if name.endswith(self.SUFFIX):
+                try:
+                    files.append((int(name[: -len(self.SUFFIX)]), os.path.join(session_dir, name)))
+                except ValueError:
+                    continue
+        files.sort()
+        return files
+
+    def add_chunk(self, key: SessionKey, seq: int, audio_bytes: bytes) -> int:
+        with self._locked(key) as session_dir:
+            tmp_path = os.path.join(session_dir, f".{seq}.{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(audio_bytes)
+            os.replace(tmp_path, os.path.join(session_dir, f"{seq:012d}{self.SUFFIX}"))
+            files = self._chunk_files(session_dir)
+            # Prune oldest (lowest seq) if over limit
+            for _, path in files[: max(0, len(files) - self.max_chunks)]:
+                os.unlink(path)
+            count = min(len(files), self.max_chunks)
+        now = time.monotonic()
+        if now >= self._next_expiry:
+            self._next_expiry = now + EXPIRE_INTERVAL_SECONDS
+            self.expire()
+        return count
+
+    def snapshot(self, key: SessionKey) -> List[Chunk]:
+        with self._locked(key) as session_dir:
+            chunks = []
+            for seq, path in self._chunk_files(session_dir):
+                with open(path, "rb") as f:
+                    chunks.append((seq, f.read()))
+            return chunks
+
+    def discard(self, key: SessionKey, seqs: Iterable[int]) -> None:
+        drop = set(seqs)
+        with self._locked(key) as session_dir:
+            for seq, path in self._chunk_files(session_dir):
+                if seq in drop:
+                    os.unlink(path)
+
+    def clear(self, key: SessionKey) -> None:
+        with self._locked(key) as session_dir:
+            for _, path in self._chunk_files(session_dir):
+                os.unlink(path)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Remove session directories with no write for `idle_seconds`; returns how many.
+
+        A directory's mtime changes with every chunk added or discarded.
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            lock_path = os.path.join(entry.path, ".lock")
+            try:
+                with _file_lock(lock_path):
+                    if now - os.stat(entry.path).st_mtime < self.idle_seconds:
+                        continue
+                    for name in os.listdir(entry.path):
+                        if name != ".lock":
+                            os.unlink(os.path.join(entry.path, name))
+                    os.unlink(lock_path)
+                    os.rmdir(entry.path)
+                    removed += 1
+            except OSError:
+                continue  # expired by another worker meanwhile (or the lock file is in use, on Windows)
+        return removed
+
+    def memory_report(self) -> dict:
+        total = chunks = sessions = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            try:
+                files = self._chunk_files(entry.path)
+            except FileNotFoundError:
+                continue  # expired meanwhile
+            sessions += 1
+            for seq, path in files:
+                try:
+                    total += os.path.getsize(path)
+                    chunks += 1
+                except OSError:
+                    continue  # consumed by another worker meanwhile
+        # Shared by all workers on the host, not resident in this process.
+        return {"bytes": total, "entries": sessions, "chunks": chunks, "shared": True, "root": self.root}
+
+
+STORE_KIND = os.getenv("ISWEEP_SESSION_STORE", "memory").lower()
+
+
+def create_session_store(kind: str = STORE_KIND) -> SessionStore:
+    """Build the store selected by ISWEEP_SESSION_STORE (memory|file)."""
+    if kind == "file":
+        return FileSessionStore(os.getenv("ISWEEP_SESSION_DIR") or None)
+    if kind != "memory":
+        raise ValueError(f"Unknown ISWEEP_SESSION_STORE: {kind!r} (expected 'memory' or 'file')")
+    return InProcessSessionStore()
@@ -0,0 +1,81 @@
+"""
+Per-request stage timings.
+
+A RequestTimer is bound to a context variable for the duration of a request
+(see the middleware in main.py). Code further down — rules, ASR — records
+stages with `span("name")` without having the timer passed in; outside a
+request `span` is a no-op. Finished timers are rendered as a `Server-Timing`
+header and fed into the `isweep_request_stage_seconds` histogram.
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Iterator, Optional
+
+from .metrics import REGISTRY
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "isweep_request_stage_seconds",
+    "Time spent per request stage",
+    ("route", "stage"),
+)
+
+_current: ContextVar[Optional["RequestTimer"]] = ContextVar("isweep_request_timer", default=None)
+
+
+class RequestTimer:
+    """Accumulates seconds per stage for one request."""
+
+    def __init__(self, route: str):
+        self.route = route
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def mark_since_start(self, stage: str) -> None:
+        """Record the time from request start to now as `stage`."""
+        self.add(stage, time.perf_counter() - self.started)
+
+    def as_dict(self) -> dict[str, float]:
+        """Stage durations in milliseconds, rounded for display."""
+        return {stage: round(seconds * 1000.0, 3) for stage, seconds in self.stages.items()}
+
+    def finish(self) -> None:
+        """Record total time and feed all stages into the metrics histogram."""
+        self.stages["total"] = time.perf_counter() - self.started
+        for stage, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, route=self.route, stage=stage)
+
+    def server_timing_header(self) -> str:
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.as_dict().items())
+
+
+def activate(timer: RequestTimer) -> Token:
+    return _current.set(timer)
+
+
+def deactivate(token: Token) -> None:
+    _current.reset(token)
+
+
+def current() -> Optional[RequestTimer]:
+    return _current.get()
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed block as `stage` on the current request, if any."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(stage, time.perf_counter() - started)
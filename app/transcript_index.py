@@ -0,0 +1,198 @@
+"""
+Shared per-media transcripts with a persistent inverted token index.
+
+A media item's caption cues (or ASR segments from `python -m app
+transcribe`, see app/batch_transcribe.py) are stored once in
+media_cues, and every normalized token is posted to media_tokens as
+(media_id, token, cue_index). Scanning a media item
+for a user then looks up the tokens of their wordlist instead of re-reading
+the transcript: the cost follows the wordlist, and only cues that contain
+every token of some blocked word are matched with the user's Matcher, which
+keeps results identical to a full scan.
+
+Index keys are tolerant in the same ways as word_pattern():
+  - text and words are normalized with normalize_text()
+  - repeated characters collapse ("daaamn" and "damn" share a key)
+  - tokens containing the mask character are posted under "*", so masked
+    cues ("f*ck") are candidates for every lookup
+Words with no indexable token fall back to scanning every cue.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from .database import MediaCueDB, MediaTokenDB
+from .matching import MASK_CHAR, Matcher, char_span_to_interval, normalize_text
+from .metrics import REGISTRY
+from .rules import resolve_preferences
+from .serialization import blocked_span_payload, segment_payload
+from .timing import span
+
+logger = logging.getLogger(__name__)
+
+# SQLite's default limit on bound parameters is 999.
+_IN_BATCH = 500
+
+_TOKEN_SPLIT = re.compile(r"[^\w*]+")
+_REPEATS = re.compile(r"(.)\1+")
+
+CUES = REGISTRY.counter(
+    "isweep_media_scan_cues_total",
+    "Cues per media scan that were matched (candidates) or ruled out by the index (skipped)",
+    ("result",),
+)
+
+
+def _token_key(token: str) -> str:
+    if MASK_CHAR in token:
+        return MASK_CHAR
+    return _REPEATS.sub(r"\1", token)
+
+
+def _keys(normalized: str) -> set[str]:
+    return {_token_key(token) for token in _TOKEN_SPLIT.split(normalized) if token}
+
+
+def index_keys(text: str) -> set[str]:
+    """Index keys posted for a cue's text."""
+    return _keys(normalize_text(text).text)
+
+
+@lru_cache(maxsize=65536)
+def word_keys(word: str) -> frozenset[str]:
+    """Keys a cue must contain to possibly match blocked word/phrase `word`."""
+    return frozenset(_keys(normalize_text(word.strip()).text))
+
+
+def store_transcript(
+    db: Session,
+    media_id: str,
+    cues: Iterable[Any],
+    source: str = "captions",
+) -> dict[str, int]:
+    """Replace the transcript of `media_id` and rebuild its index.
+
+    `cues` are objects or dicts with text, start_seconds and end_seconds
+    (MediaCue, TranscriptSegment or segment payloads).
+    """
+    cue_rows: list[dict[str, Any]] = []
+    token_rows: list[dict[str, Any]] = []
+    for cue_index, cue in enumerate(cues):
+        if not isinstance(cue, dict):
+            cue = {"text": cue.text, "start_seconds": cue.start_seconds, "end_seconds": cue.end_seconds}
+        text = cue["text"] or ""
+        cue_rows.append({
+            "media_id": media_id,
+            "cue_index": cue_index,
+            "start_seconds": cue["start_seconds"],
+            "end_seconds": cue["end_seconds"],
+            "text": text,
+            "source": source,
+        })
+        token_rows.extend(
+            {"media_id": media_id, "token": key, "cue_index": cue_index} for key in index_keys(text)
+        )
+
+    db.execute(delete(MediaTokenDB).where(MediaTokenDB.media_id == media_id))
+    db.execute(delete(MediaCueDB).where(MediaCueDB.media_id == media_id))
+    if cue_rows:
+        db.execute(insert(MediaCueDB), cue_rows)
+    if token_rows:
+        db.execute(insert(MediaTokenDB), token_rows)
+    db.commit()
+    logger.info("Stored media transcript", extra={"media_id": media_id, "cues": len(cue_rows), "postings": len(token_rows)})
+    return {"cues": len(cue_rows), "postings": len(token_rows)}
+
+
+def has_transcript(db: Session, media_id: str) -> bool:
+    return db.execute(
+        select(MediaCueDB.cue_index).where(MediaCueDB.media_id == media_id).limit(1)
+    ).first() is not None
+
+
+def _postings(db: Session, media_id: str, keys: set[str]) -> dict[str, set[int]]:
+    postings: dict[str, set[int]] = {}
+    keys = sorted(keys)
+    for i in range(0, len(keys), _IN_BATCH):
+        rows = db.execute(
+            select(MediaTokenDB.token, MediaTokenDB.cue_index).where(
+                MediaTokenDB.media_id == media_id,
+                MediaTokenDB.token.in_(keys[i:i + _IN_BATCH]),
+            )
+        )
+        for token, cue_index in rows:
+            postings.setdefault(token, set()).add(cue_index)
+    return postings
+
+
+def candidate_cues(db: Session, media_id: str, matcher: Matcher) -> Optional[set[int]]:
+    """Cues that may match `matcher`; None means every cue must be scanned."""
+    words = [word_keys(word) for _, word, _ in matcher.entries]
+    if any(not keys for keys in words):
+        return None
+    postings = _postings(db, media_id, set().union(*words) | {MASK_CHAR})
+    candidates = set(postings.get(MASK_CHAR, ()))
+    for keys in words:
+        found = None
+        for key in keys:
+            cues = postings.get(key)
+            if not cues:
+                found = None
+                break
+            found = set(cues) if found is None else found & cues
+            if not found:
+                break
+        if found:
+            candidates |= found
+    return candidates
+
+
+def _load_cues(db: Session, media_id: str, cue_indexes: Optional[set[int]]) -> list[MediaCueDB]:
+    query = select(MediaCueDB).where(MediaCueDB.media_id == media_id)
+    if cue_indexes is None:
+        return list(db.scalars(query.order_by(MediaCueDB.cue_index)))
+    indexes = sorted(cue_indexes)
+    cues: list[MediaCueDB] = []
+    for i in range(0, len(indexes), _IN_BATCH):
+        cues.extend(db.scalars(query.where(MediaCueDB.cue_index.in_(indexes[i:i + _IN_BATCH]))))
+    cues.sort(key=lambda cue: cue.cue_index)
+    return cues
+
+
+def scan_media(db: Session, media_id: str, user_id: str) -> list[dict[str, Any]]:
+    """Blocked cues of `media_id` for `user_id`, as segment payloads in time order."""
+    with span("prefs"):
+        matcher = resolve_preferences(db, user_id).matcher
+    if not matcher.entries:
+        return []
+    with span("index"):
+        candidates = candidate_cues(db, media_id, matcher)
+        cues = _load_cues(db, media_id, candidates)
+    if candidates is not None:
+        last = db.execute(
+            select(func.max(MediaCueDB.cue_index)).where(MediaCueDB.media_id == media_id)
+        ).scalar()
+        CUES.inc((last + 1 if last is not None else 0) - len(cues), result="skipped")
+    CUES.inc(len(cues), result="candidate")
+
+    segments = []
+    with span("match"):
+        for cue in cues:
+            matches = matcher.find_all(normalize_text(cue.text))
+            if not matches:
+                continue
+            spans = []
+            for m in matches:
+                start_s, end_s = char_span_to_interval(
+                    m.start, m.end, len(cue.text), cue.start_seconds, cue.end_seconds
+                )
+                spans.append(blocked_span_payload(m.word, m.category, m.start, m.end, start_s, end_s))
+            segments.append(segment_payload(cue.text, cue.start_seconds, cue.end_seconds, matches=spans))
+    return segments
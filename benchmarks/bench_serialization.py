@@ -0,0 +1,100 @@
+"""
+Microbenchmark: per-request CPU for building and serializing responses.
+
+Compares the previous path (Pydantic models per segment, re-validated through
+response_model, stdlib json) against the fast path (plain dicts + orjson via
+FastJSONResponse) for /asr/stream and /preferences/{user_id}.
+
+Usage:
+    python -m benchmarks.bench_serialization [--iterations 20000]
+"""
+
+import argparse
+import json
+import time
+
+from pydantic import TypeAdapter
+
+from app.models import Action, ASRStreamResponse, BlockedSpan, Preference, TranscriptSegment
+from app.serialization import FastJSONResponse, blocked_span_payload, preference_payload, segment_payload
+
+SEGMENTS = [
+    {"text": f"segment number {i} with a damn word", "start_seconds": 10.0 + i, "end_seconds": 11.0 + i}
+    for i in range(4)
+]
+PREFS = {
+    category: Preference(
+        user_id="bench", category=category, action=Action.mute, duration_seconds=4,
+        blocked_words=[f"word{i}" for i in range(40)], custom_words=["custom"],
+        selected_packs={"strong_profanity": True},
+    )
+    for category in ("language", "violence", "sexual")
+}
+
+_asr_adapter = TypeAdapter(ASRStreamResponse)
+_dict_adapter = TypeAdapter(dict)
+
+
+def asr_before() -> bytes:
+    segments = [
+        TranscriptSegment(
+            text=s["text"], start_seconds=s["start_seconds"], end_seconds=s["end_seconds"],
+            confidence=0.9, is_blocked=True, blocked_word="damn", category="language",
+            matches=[BlockedSpan(word="damn", category="language", char_start=26, char_end=30,
+                                 start_seconds=s["start_seconds"], end_seconds=s["end_seconds"])],
+        )
+        for s in SEGMENTS
+    ]
+    response = ASRStreamResponse(segments=segments)
+    # What FastAPI does with response_model: validate again, dump, json.dumps
+    validated = _asr_adapter.validate_python(response.model_dump())
+    return json.dumps(_asr_adapter.dump_python(validated, mode="json")).encode("utf-8")
+
+
+def asr_after() -> bytes:
+    segments = [
+        segment_payload(
+            s["text"], s["start_seconds"], s["end_seconds"],
+            matches=[blocked_span_payload("damn", "language", 26, 30, s["start_seconds"], s["end_seconds"])],
+        )
+        for s in SEGMENTS
+    ]
+    return FastJSONResponse({"segments": segments}).body
+
+
+def prefs_before() -> bytes:
+    payload = {"user_id": "bench", "preferences": {cat: p.model_dump() for cat, p in PREFS.items()}}
+    return json.dumps(_dict_adapter.dump_python(_dict_adapter.validate_python(payload), mode="json")).encode("utf-8")
+
+
+def prefs_after() -> bytes:
+    return FastJSONResponse(
+        {"user_id": "bench", "preferences": {cat: preference_payload(p) for cat, p in PREFS.items()}}
+    ).body
+
+
+def measure(func, iterations: int) -> float:
+    """CPU microseconds per call."""
+    func()
+    start = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, before, after in (
+        ("/asr/stream (4 segments)", asr_before, asr_after),
+        ("/preferences/{user_id}", prefs_before, prefs_after),
+    ):
+        b = measure(before, args.iterations)
+        a = measure(after, args.iterations)
+        print(f"{name:28s} before {b:8.1f} us   after {a:8.1f} us   speedup {b / a:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Tests for per-user/per-tab ASR admission control.
+"""
+
+import base64
+from types import SimpleNamespace
+
+import pytest
+
+from app import asr_service, audio_stream
+from app.asr_admission import THROTTLED, AdmissionController
+from app.asr_sessions import clear_session
+
+
+class _FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, **kwargs):
+        self.calls.append(kwargs)
+        info = SimpleNamespace(language="en", language_probability=0.95, duration=0.1)
+        return iter([SimpleNamespace(text=" hi", start=0.0, end=0.1)]), info
+
+
+def test_tab_bucket_limits_one_tab_not_others():
+    admission = AdmissionController(user_rate=0, user_burst=0, tab_rate=1, tab_burst=2)
+    assert admission.admit("u", 1, now=0.0) is None
+    assert admission.admit("u", 1, now=0.0) is None
+    assert admission.admit("u", 1, now=0.0) == "tab"
+    assert admission.admit("u", 2, now=0.0) is None
+    # One token per second refills.
+    assert admission.admit("u", 1, now=1.0) is None
+
+
+def test_user_bucket_spans_tabs_and_is_all_or_nothing():
+    admission = AdmissionController(user_rate=1, user_burst=3, tab_rate=1, tab_burst=1)
+    assert admission.admit("u", 1, now=0.0) is None
+    # The tab is out of tokens; the user's token must not be spent.
+    assert admission.admit("u", 1, now=0.0) == "tab"
+    assert admission.admit("u", 2, now=0.0) is None
+    assert admission.admit("u", 3, now=0.0) is None
+    assert admission.admit("u", 4, now=0.0) == "user"
+    assert admission.admit("other", 1, now=0.0) is None
+
+
+def test_over_quota_chunk_is_coalesced_into_next(monkeypatch):
+    if not audio_stream.available():
+        pytest.skip("streaming decode needs numpy and PyAV")
+    fake = _FakeModel()
+    monkeypatch.setattr(asr_service, "get_model", lambda *args: fake)
+    monkeypatch.setattr(asr_service, "admission", AdmissionController(0, 0, tab_rate=1, tab_burst=1))
+    audio = base64.b64encode(b"\x00\x00" * 1600).decode()  # 0.1s of PCM16
+    clear_session("quota_user", 3)
+    before = THROTTLED.value(scope="tab", outcome="coalesced")
+
+    kwargs = dict(tab_id=3, chunk_start_seconds=0.0, mime_type="audio/pcm;rate=16000")
+    first = asr_service.transcribe_chunk(audio, "quota_user", **kwargs)
+    second = asr_service.transcribe_chunk(audio, "quota_user", **kwargs)
+    assert (first.status, second.status) == ("ok", "coalesced")
+    assert len(fake.calls) == 1
+    assert THROTTLED.value(scope="tab", outcome="coalesced") == before + 1
+
+    # Once a token is back, the held audio goes out with the next chunk.
+    stream = asr_service.get_session("quota_user", 3).stream
+    assert stream.peek_new()[0].shape[0] == 1600
+    clear_session("quota_user", 3)
@@ -0,0 +1,117 @@
+"""
+Tests for idempotent (user_id, tab_id, seq) ASR chunk handling.
+"""
+
+import base64
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app import asr, asr_service, audio_stream
+from app.asr_dedup import DEDUPLICATED, ChunkDeduplicator
+
+
+class _FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe(self, audio, **kwargs):
+        self.calls += 1
+        info = SimpleNamespace(language="en", language_probability=0.95, duration=0.1)
+        return iter([SimpleNamespace(text=" hello", start=0.0, end=0.1)]), info
+
+
+def test_concurrent_duplicates_share_one_computation():
+    dedup = ChunkDeduplicator(window_seconds=30)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    before = DEDUPLICATED.value(outcome="inflight")
+    first = []
+    leader = threading.Thread(target=lambda: first.append(dedup.run(("u", 1, 7), compute)))
+    leader.start()
+    started.wait(5)
+    waiter = []
+    follower = threading.Thread(target=lambda: waiter.append(dedup.run(("u", 1, 7), compute)))
+    follower.start()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert first == [("result", "computed")]
+    assert waiter == [("result", "inflight")]
+    assert len(calls) == 1
+    assert DEDUPLICATED.value(outcome="inflight") == before + 1
+    # Later retries are served from the stored result; other seqs compute.
+    assert dedup.run(("u", 1, 7), compute) == ("result", "cached")
+    assert dedup.run(("u", 1, 8), compute) == ("result", "computed")
+
+
+def test_failed_computation_is_not_stored():
+    dedup = ChunkDeduplicator(window_seconds=30)
+
+    def boom():
+        raise RuntimeError("model crashed")
+
+    with pytest.raises(RuntimeError):
+        dedup.run(("u", 1, 1), boom)
+    assert dedup.run(("u", 1, 1), lambda: "ok") == ("ok", "computed")
+
+
+def test_results_not_kept_are_computed_again():
+    dedup = ChunkDeduplicator(window_seconds=30)
+    keep = lambda result: result != "throttled"  # noqa: E731
+    assert dedup.run(("u", 1, 1), lambda: "throttled", keep) == ("throttled", "computed")
+    assert dedup.run(("u", 1, 1), lambda: "ok", keep) == ("ok", "computed")
+    assert dedup.run(("u", 1, 1), lambda: "again", keep) == ("ok", "cached")
+
+
+def test_forget_drops_a_tabs_results():
+    dedup = ChunkDeduplicator(window_seconds=30)
+    dedup.run(("u", 1, 1), lambda: "a")
+    dedup.run(("u", 2, 1), lambda: "b")
+    dedup.forget(("u", 1))
+    assert dedup.run(("u", 1, 1), lambda: "c") == ("c", "computed")
+    assert dedup.run(("u", 2, 1), lambda: "d") == ("b", "cached")
+
+
+def test_retried_chunk_is_not_transcribed_or_streamed_twice(monkeypatch):
+    if not audio_stream.available():
+        pytest.skip("streaming decode needs numpy and PyAV")
+    model = _FakeModel()
+    monkeypatch.setattr(asr_service, "get_model", lambda *args: model)
+    monkeypatch.setattr(asr_service, "dedup", ChunkDeduplicator(window_seconds=30))
+    asr.clear_session_buffer("dedup_user", 4)
+    audio = base64.b64encode(b"\x00\x00" * 1600).decode()  # 0.1s of PCM16
+    kwargs = dict(tab_id=4, chunk_start_seconds=0.0, mime_type="audio/pcm;rate=16000", seq=1)
+
+    first = asr_service.transcribe_chunk(audio, "dedup_user", **kwargs)
+    retry = asr_service.transcribe_chunk(audio, "dedup_user", **kwargs)
+    assert retry is first
+    assert model.calls == 1
+    stream = asr_service.get_session("dedup_user", 4).audio_stream("audio/pcm;rate=16000")
+    assert stream.chunks_pending == 0
+    asr.clear_session_buffer("dedup_user", 4)
+
+
+def test_throttled_chunk_is_transcribed_on_retry(monkeypatch):
+    model = _FakeModel()
+    monkeypatch.setattr(asr_service, "get_model", lambda *args: model)
+    monkeypatch.setattr(asr_service, "dedup", ChunkDeduplicator(window_seconds=30))
+    over_quota = ["tab", None]
+    monkeypatch.setattr(asr_service, "admission", SimpleNamespace(admit=lambda user_id, tab_id: over_quota.pop(0)))
+    # A type without streaming decode: a throttled chunk leaves no session state behind.
+    kwargs = dict(tab_id=8, chunk_start_seconds=0.0, mime_type="audio/mp4", seq=1)
+
+    throttled = asr_service.transcribe_chunk("AAAA", "dedup_user", **kwargs)
+    retry = asr_service.transcribe_chunk("AAAA", "dedup_user", **kwargs)
+    assert (throttled.status, retry.status) == ("throttled", "ok")
+    assert model.calls == 1
+    asr.clear_session_buffer("dedup_user", 8)
@@ -0,0 +1,104 @@
+"""
+Tests for pluggable ASR engines.
+"""
+
+import base64
+
+import pytest
+
+from app import asr, asr_service, audio_stream
+from app.asr_dedup import ChunkDeduplicator
+from app.asr_engines import ENGINES, ASREngine, EngineResult, Recognizer, get_engine
+
+
+class _FakeRecognizer(Recognizer):
+    def __init__(self, engine):
+        self.engine = engine
+        self.fed = []
+
+    def feed_audio(self, audio):
+        self.fed.append(len(audio))
+
+    def get_partial(self):
+        return "so far" if self.fed else ""
+
+    def get_final(self):
+        seconds = sum(self.fed) / 16000
+        self.engine.finals.append(list(self.fed))
+        self.fed = []
+        return EngineResult([{"text": "hello", "start_seconds": 0.0, "end_seconds": seconds, "confidence": 0.5}])
+
+
+class _FakeStreamingEngine(ASREngine):
+    name = "fake"
+    streaming = True
+
+    def __init__(self):
+        self.finals = []
+        self.created = 0
+
+    def recognizer(self, options, tier=None, **kwargs):
+        self.created += 1
+        return _FakeRecognizer(self)
+
+
+@pytest.fixture
+def fake_engine(monkeypatch):
+    if not audio_stream.available():
+        pytest.skip("streaming decode needs numpy and PyAV")
+    engine = _FakeStreamingEngine()
+    monkeypatch.setitem(ENGINES, "fake", engine)
+    monkeypatch.setattr(asr_service, "get_model", lambda *args: pytest.fail("whisper must not run"))
+    return engine
+
+
+AUDIO = base64.b64encode(b"\x00\x00" * 1600).decode()  # 0.1s of PCM16
+PCM = "audio/pcm;rate=16000"
+
+
+def test_unknown_engine_is_rejected():
+    assert get_engine("WHISPER").name == "whisper"
+    with pytest.raises(ValueError):
+        get_engine("nope")
+
+
+def test_engine_selected_per_request(fake_engine, monkeypatch):
+    monkeypatch.setattr(asr_service, "dedup", ChunkDeduplicator(window_seconds=0))
+    # Without a tab there is no session to keep a recognizer in: the chunk is finalized at once.
+    result = asr_service.transcribe_chunk(AUDIO, "engine_user", chunk_start_seconds=2.0, mime_type=PCM, engine="fake")
+    assert (result.status, result.engine, result.tier) == ("ok", "fake", None)
+    assert result.segments == [{"text": "hello", "start_seconds": 2.0, "end_seconds": 2.1, "confidence": 0.5}]
+
+
+def test_stream_endpoint_path_keeps_one_recognizer_per_session(fake_engine, monkeypatch):
+    monkeypatch.setattr(asr_service, "dedup", ChunkDeduplicator(window_seconds=0))
+    asr.clear_session_buffer("engine_user", 3)
+    results = [
+        asr_service.transcribe_chunk(
+            AUDIO, "engine_user", chunk_start_seconds=1.0 + seq * 0.1, tab_id=3, mime_type=PCM, seq=seq, engine="fake"
+        )
+        for seq in range(4)
+    ]
+
+    assert [(r.status, r.partial) for r in results[:2]] == [("ok", "so far"), ("ok", "so far")]
+    assert [r.segments for r in results[:2]] == [[], []]
+    # Finalized every STREAMING_FINAL_CHUNKS chunks, timed from the first unfinalized one.
+    assert results[2].segments == [
+        {"text": "hello", "start_seconds": 1.0, "end_seconds": pytest.approx(1.3), "confidence": 0.5}
+    ]
+    assert results[3].partial == "so far"
+    assert fake_engine.created == 1
+    assert fake_engine.finals == [[1600, 1600, 1600]]
+    asr.clear_session_buffer("engine_user", 3)
+
+
+def test_streaming_engine_is_fed_as_chunks_arrive(fake_engine):
+    asr.clear_session_buffer("engine_user", 2)
+    results = [asr.process_audio_chunk("engine_user", 2, seq, AUDIO, PCM, engine="fake") for seq in range(3)]
+
+    assert results[:2] == [None, None]
+    assert [(s.text, s.end_seconds, s.confidence) for s in results[2]] == [("hello", 0.3, 0.5)]
+    # One recognizer for the session, fed per chunk and finalized once per batch.
+    assert fake_engine.created == 1
+    assert fake_engine.finals == [[1600, 1600, 1600]]
+    asr.clear_session_buffer("engine_user", 2)
@@ -0,0 +1,137 @@
+"""
+Tests for earliest-deadline-first ASR scheduling.
+"""
+
+import threading
+import time
+
+import pytest
+
+from app.asr_scheduler import CHUNK_OUTCOMES, ChunkDropped, DeadlineScheduler, chunk_deadline
+
+
+def _start_waiter(scheduler, deadline, order, name):
+    def run():
+        try:
+            with scheduler.slot(deadline):
+                order.append(name)
+        except ChunkDropped:
+            order.append(f"{name}:dropped")
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_queued(scheduler, n):
+    for _ in range(200):
+        if scheduler.queued() == n:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f"expected {n} queued chunks, got {scheduler.queued()}")
+
+
+def test_chunk_deadline():
+    assert chunk_deadline(100.0, 12.0, 10.0) == 102.0
+    assert chunk_deadline(100.0, 12.0, 10.0, slack_seconds=0.5) == 102.5
+    assert chunk_deadline(100.0, 12.0, None) is None
+
+
+def test_earliest_deadline_first_and_untimed_last():
+    scheduler = DeadlineScheduler(slots=1)
+    order = []
+    now = time.monotonic()
+    holder = scheduler.acquire(None)
+
+    threads = [
+        _start_waiter(scheduler, None, order, "untimed"),
+    ]
+    _wait_queued(scheduler, 1)
+    threads.append(_start_waiter(scheduler, now + 60, order, "late_deadline"))
+    _wait_queued(scheduler, 2)
+    threads.append(_start_waiter(scheduler, now + 30, order, "early_deadline"))
+    _wait_queued(scheduler, 3)
+
+    scheduler.release(holder, 0.0)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["early_deadline", "late_deadline", "untimed"]
+
+
+def test_hopeless_chunk_is_dropped_while_waiting():
+    scheduler = DeadlineScheduler(slots=1, policy="drop")
+    dropped_before = CHUNK_OUTCOMES.value(outcome="dropped")
+    order = []
+    holder = scheduler.acquire(None)
+
+    thread = _start_waiter(scheduler, time.monotonic() + 0.05, order, "chunk")
+    thread.join(timeout=5)
+    scheduler.release(holder, 0.0)
+
+    assert order == ["chunk:dropped"]
+    assert CHUNK_OUTCOMES.value(outcome="dropped") == dropped_before + 1
+
+
+def test_deprioritize_policy_runs_hopeless_chunk_after_timely_ones():
+    scheduler = DeadlineScheduler(slots=1, policy="deprioritize")
+    order = []
+    now = time.monotonic()
+    holder = scheduler.acquire(None)
+
+    threads = [_start_waiter(scheduler, now - 1.0, order, "past_deadline")]
+    _wait_queued(scheduler, 1)
+    threads.append(_start_waiter(scheduler, now + 60, order, "timely"))
+    _wait_queued(scheduler, 2)
+
+    scheduler.release(holder, 0.0)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["timely", "past_deadline"]
+
+
+def test_on_time_and_late_outcomes():
+    scheduler = DeadlineScheduler(slots=1)
+    on_time = CHUNK_OUTCOMES.value(outcome="on_time")
+    late = CHUNK_OUTCOMES.value(outcome="late")
+
+    with scheduler.slot(time.monotonic() + 60):
+        pass
+    ticket = scheduler.acquire(time.monotonic() + 0.01)
+    time.sleep(0.02)
+    scheduler.release(ticket, 0.02)
+
+    assert CHUNK_OUTCOMES.value(outcome="on_time") == on_time + 1
+    assert CHUNK_OUTCOMES.value(outcome="late") == late + 1
+
+
+def test_unknown_policy_rejected():
+    with pytest.raises(ValueError):
+        DeadlineScheduler(policy="fifo")
+
+
+def test_slots_are_shared_fairly_across_users():
+    scheduler = DeadlineScheduler(slots=1)
+    order = []
+    holder = scheduler.acquire(None, "busy")
+
+    def waiter(user, name):
+        def run():
+            with scheduler.slot(None, user):
+                order.append(name)
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    threads = []
+    for i in range(3):
+        threads.append(waiter("busy", f"busy{i}"))
+        _wait_queued(scheduler, i + 1)
+    threads.append(waiter("quiet", "quiet"))
+    _wait_queued(scheduler, 4)
+
+    scheduler.release(holder, 0.0)
+    for thread in threads:
+        thread.join(timeout=5)
+    # "busy" already had a slot, so "quiet" is served before its backlog.
+    assert order[0] == "quiet"
+    assert order[1:] == ["busy0", "busy1", "busy2"]
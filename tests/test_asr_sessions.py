@@ -0,0 +1,70 @@
+"""
+Tests for per-session language pinning and decoder context carry-over.
+"""
+
+import base64
+from types import SimpleNamespace
+
+from app import asr_service
+from app.asr_sessions import SessionState, clear_session, transcript_tail
+
+
+def test_language_pinned_after_confident_detection():
+    state = SessionState()
+    first = state.options()
+    assert first.mode == "detect" and first.language is None
+
+    state.update(first, "en", 0.55, "hello")
+    assert state.options().mode == "detect"  # not confident enough
+
+    options = state.options()
+    state.update(options, "en", 0.97, "there")
+    pinned = state.options()
+    assert (pinned.mode, pinned.language) == ("pinned", "en")
+
+
+def test_override_and_auto():
+    state = SessionState()
+    state.update(state.options(), "en", 0.99, "hi")
+
+    override = state.options("es")
+    assert (override.mode, override.language) == ("override", "es")
+    # An override never re-pins the session.
+    state.update(override, "es", 0.99, "hola")
+    assert state.options().language == "en"
+
+    assert state.options("auto").mode == "detect"
+    assert state.options().mode == "detect"
+
+
+def test_transcript_tail_cuts_at_word_boundary():
+    assert transcript_tail("one two  three", 100) == "one two three"
+    assert transcript_tail("alpha beta gamma delta", 12) == "gamma delta"
+    assert transcript_tail("anything", 0) == ""
+
+
+class _FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, path, **kwargs):
+        self.calls.append(kwargs)
+        segment = SimpleNamespace(text=f" chunk {len(self.calls)}", start=0.0, end=1.0)
+        info = SimpleNamespace(language="en", language_probability=0.95, duration=1.0)
+        return iter([segment]), info
+
+
+def test_transcribe_chunk_carries_language_and_context(monkeypatch):
+    fake = _FakeModel()
+    monkeypatch.setattr(asr_service, "get_model", lambda *args: fake)
+    audio = base64.b64encode(b"\x00" * 16).decode()
+    clear_session("session_user", 7)
+
+    first = asr_service.transcribe_chunk(audio, "session_user", tab_id=7, mime_type="audio/pcm;rate=16000")
+    second = asr_service.transcribe_chunk(audio, "session_user", tab_id=7, mime_type="audio/pcm;rate=16000")
+
+    assert first.status == "ok" and second.language == "en"
+    assert fake.calls[0]["language"] is None and fake.calls[0]["initial_prompt"] is None
+    assert fake.calls[1]["language"] == "en"
+    assert fake.calls[1]["initial_prompt"] == "chunk 1"
+    clear_session("session_user", 7)
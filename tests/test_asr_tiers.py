@@ -0,0 +1,71 @@
+"""
+Tests for the load-adaptive ASR tier controller.
+"""
+
+import pytest
+
+from app.asr_tiers import Tier, TierController, create_controller, default_tiers, parse_tiers
+
+
+TIERS = parse_tiers("small:5:int8,base:5:int8,base:1:int8,tiny:1:int8")
+
+
+def _feed(controller, load, n):
+    for _ in range(n):
+        controller.observe(controller.current(), queue_wait=0.0, inference=load * 2.0, audio_seconds=2.0)
+
+
+def test_parse_tiers():
+    assert TIERS[0] == Tier("small", 5, "int8")
+    assert TIERS[2].name == "base:1:int8"
+    with pytest.raises(ValueError):
+        parse_tiers("base:five:int8")
+
+
+def test_steps_down_when_falling_behind_and_stops_at_cheapest():
+    controller = TierController(TIERS, start=1, cooldown=3)
+    _feed(controller, 1.5, 3)
+    assert controller.current() == Tier("base", 1, "int8")
+    _feed(controller, 1.5, 20)
+    assert controller.current() == TIERS[-1]
+
+
+def test_steps_up_with_headroom_and_stops_at_best():
+    controller = TierController(TIERS, start=3, cooldown=3)
+    _feed(controller, 0.1, 2)
+    assert controller.index == 3  # still in cooldown
+    _feed(controller, 0.1, 20)
+    assert controller.index == 0
+
+
+def test_holds_tier_in_the_comfortable_band():
+    controller = TierController(TIERS, start=2, cooldown=1)
+    _feed(controller, 0.5, 10)
+    assert controller.index == 2
+
+
+def test_stale_tier_observations_do_not_steer():
+    controller = TierController(TIERS, start=2, cooldown=1)
+    for _ in range(5):
+        controller.observe(TIERS[0], queue_wait=5.0, inference=5.0, audio_seconds=1.0)
+    assert controller.index == 2
+
+
+def test_non_adaptive_controller_is_pinned():
+    controller = TierController(TIERS, start=2, adaptive=False, cooldown=1)
+    _feed(controller, 3.0, 10)
+    assert controller.index == 2
+
+
+def test_default_ladder_follows_the_configured_model(monkeypatch):
+    assert [t.name for t in default_tiers("small.en", "float16")] == [
+        "small.en:5:float16", "small.en:1:float16", "base.en:1:float16", "tiny.en:1:float16",
+    ]
+    assert [t.name for t in default_tiers("large-v3", "int8")][2:4] == ["medium:1:int8", "small:1:int8"]
+    assert [t.name for t in default_tiers("/models/custom", "int8")] == ["/models/custom:5:int8", "/models/custom:1:int8"]
+
+    monkeypatch.delenv("ISWEEP_ASR_TIERS", raising=False)
+    monkeypatch.delenv("ISWEEP_ASR_TIER_START", raising=False)
+    controller = create_controller("medium", "float16")
+    assert controller.current() == Tier("medium", 1, "float16")
+    assert controller.tiers[0] == Tier("medium", 5, "float16")
@@ -0,0 +1,83 @@
+"""
+Tests for the ASR tuning grid, recommendation and tuned config file.
+"""
+
+import json
+import os
+
+from app import asr_tuning
+from app.asr_tiers import Tier, create_controller
+from app.asr_tuning import TuneResult, TuneSetting
+
+
+def _result(size, beam, p95, throughput, threads=2, processes=1):
+    setting = TuneSetting(size, "int8", threads, beam, processes)
+    return TuneResult(setting, rtf=p95 / 5, throughput=throughput, p95=p95, audio_seconds=60, wall_seconds=60 / throughput)
+
+
+def test_grid_skips_oversubscribed_settings():
+    grid = asr_tuning.build_grid(["tiny"], ["int8"], [1, 4], [1], [1, 2], cpu_count=4)
+    assert [(s.cpu_threads, s.processes) for s in grid] == [(1, 1), (1, 2), (4, 1)]
+
+
+def test_recommends_best_quality_within_latency_budget():
+    results = [
+        _result("small", 5, p95=7.0, throughput=0.9),   # too slow
+        _result("base", 5, p95=3.0, throughput=2.0),
+        _result("base", 5, p95=2.5, throughput=3.0, processes=2),
+        _result("tiny", 1, p95=0.5, throughput=12.0),
+    ]
+    best = asr_tuning.recommend(results, max_p95=5.0)
+    assert best.setting == TuneSetting("base", "int8", 2, 5, 2)
+    env = asr_tuning.config_env(results, best, 5.0)
+    assert env["ISWEEP_ASR_TIERS"] == "base:5:int8,tiny:1:int8"
+    assert env["ISWEEP_WORKERS"] == "2" and env["WHISPER_CPU_THREADS"] == "2"
+
+
+def test_falls_back_to_fastest_when_nothing_fits():
+    results = [_result("small", 5, p95=9.0, throughput=0.5), _result("base", 1, p95=6.0, throughput=0.8)]
+    assert asr_tuning.recommend(results, max_p95=5.0).setting.model_size == "base"
+
+
+def test_tuned_config_round_trip_respects_explicit_env(tmp_path, monkeypatch):
+    results = [_result("base", 1, p95=1.0, throughput=4.0)]
+    path = str(tmp_path / "asr_tuned.json")
+    asr_tuning.write_config(path, results, results[0], 5.0)
+    assert json.loads(open(path).read())["recommended"]["model_size"] == "base"
+
+    for name in ("WHISPER_MODEL_SIZE", "WHISPER_CPU_THREADS", "ISWEEP_ASR_TIERS", "ISWEEP_ASR_TIER_START",
+                 "WHISPER_COMPUTE_TYPE", "ISWEEP_WORKERS"):
+        # setenv first so the variable is restored (or removed again) afterwards.
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
+    monkeypatch.setenv("WHISPER_COMPUTE_TYPE", "float32")
+    applied = asr_tuning.load_tuned_config(path)
+    assert applied["WHISPER_MODEL_SIZE"] == "base"
+    assert "WHISPER_COMPUTE_TYPE" not in applied
+
+
+def test_tier_ladder_and_start_are_applied_together(tmp_path, monkeypatch):
+    path = str(tmp_path / "asr_tuned.json")
+    with open(path, "w") as f:
+        json.dump({"env": {"ISWEEP_ASR_TIERS": "small:5:int8,small:1:int8", "ISWEEP_ASR_TIER_START": "small:5:int8"}}, f)
+
+    monkeypatch.setenv("ISWEEP_ASR_TIER_START", "")
+    monkeypatch.delenv("ISWEEP_ASR_TIER_START")
+    monkeypatch.setenv("ISWEEP_ASR_TIERS", "base:1:int8,tiny:1:int8")
+    assert asr_tuning.load_tuned_config(path) == {}
+    assert "ISWEEP_ASR_TIER_START" not in os.environ
+
+    # A start tier outside the ladder falls back instead of failing startup.
+    monkeypatch.setenv("ISWEEP_ASR_TIER_START", "small:5:int8")
+    assert create_controller("base").current() == Tier("base", 1, "int8")
+
+
+def test_run_skips_failing_settings():
+    grid = [TuneSetting("tiny", "int8", 1, 1, 1), TuneSetting("huge", "int8", 1, 1, 1)]
+
+    def fake_measure(setting, chunks, device):
+        if setting.model_size == "huge":
+            raise RuntimeError("no such model")
+        return _result(setting.model_size, 1, p95=0.2, throughput=10.0)
+
+    assert [r.setting.model_size for r in asr_tuning.run(grid, [], measure_fn=fake_measure)] == ["tiny"]
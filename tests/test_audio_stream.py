@@ -0,0 +1,179 @@
+"""
+Tests for per-session streaming audio decoding (WebM/Opus, raw Opus, PCM16).
+"""
+
+import base64
+import io
+import struct
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+av = pytest.importorskip("av")
+
+from app.audio_stream import SAMPLE_RATE, AudioStream, PCMRingBuffer, WebMDemuxer  # noqa: E402
+
+
+def _tone(seconds=2.0, rate=48000, freq=440.0):
+    t = np.arange(int(seconds * rate)) / rate
+    return (0.3 * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def _encode_opus(container_format):
+    """Encode a 440 Hz tone; returns (container bytes, raw packets)."""
+    buf = io.BytesIO()
+    out = av.open(buf, "w", format=container_format)
+    stream = out.add_stream("libopus", rate=48000)
+    stream.layout = "mono"
+    packets = []
+    signal = _tone()
+    for i in range(0, len(signal), 960):
+        frame = av.AudioFrame.from_ndarray(signal[i:i + 960].reshape(1, -1), format="flt", layout="mono")
+        frame.sample_rate = 48000
+        for packet in stream.encode(frame):
+            packets.append(bytes(packet))
+            out.mux(packet)
+    for packet in stream.encode(None):
+        packets.append(bytes(packet))
+        out.mux(packet)
+    out.close()
+    return buf.getvalue(), packets
+
+
+@pytest.fixture(scope="module")
+def webm():
+    return _encode_opus("webm")
+
+
+def _dominant_hz(samples):
+    spectrum = np.abs(np.fft.rfft(samples))
+    return spectrum.argmax() * SAMPLE_RATE / len(samples)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 333, 4096])
+def test_webm_chunks_decode_like_one_file(webm, chunk_size):
+    data, _ = webm
+    stream = AudioStream("audio/webm;codecs=opus")
+    decoded = sum(stream.feed(data[i:i + chunk_size]) for i in range(0, len(data), chunk_size))
+
+    whole = AudioStream("audio/webm;codecs=opus")
+    assert decoded == whole.feed(data)
+    assert abs(decoded - 2 * SAMPLE_RATE) < SAMPLE_RATE // 10
+    samples, start, _ = stream.peek_new()
+    assert start == 0.0
+    assert abs(_dominant_hz(samples[SAMPLE_RATE // 4:]) - 440) < 5
+
+
+def test_decode_cost_tracks_new_audio(webm):
+    data, _ = webm
+    stream = AudioStream("audio/webm;codecs=opus")
+    half = len(data) // 2
+    first = stream.feed(data[:half])
+    _, _, end = stream.peek_new()
+    stream.consume(end)
+    second = stream.feed(data[half:])
+    samples, start, _ = stream.peek_new()
+    assert len(samples) == second
+    assert start == pytest.approx(first / SAMPLE_RATE)
+
+
+def test_demuxer_resyncs_after_garbage(webm):
+    data, packets = webm
+    cluster = data.find(b"\x1f\x43\xb6\x75", 100)
+    demuxer = WebMDemuxer()
+    got = demuxer.feed(data[:cluster] + b"\x00\x00garbage" + data[cluster:])
+    assert got == [p for p in packets if p][-len(got):]
+    assert len(got) == len([p for p in packets if p])
+
+
+def test_discontinuity_waits_for_next_cluster(webm):
+    data, packets = webm
+    cluster = data.find(b"\x1f\x43\xb6\x75", 100)
+    demuxer = WebMDemuxer()
+    demuxer.feed(data[:cluster + 40])
+    demuxer.discontinuity()
+    # Bytes from the middle of a lost chunk are dropped without a parse error...
+    assert demuxer.feed(data[cluster + 100:cluster + 300]) == []
+    # ...and parsing resumes at the next Cluster.
+    assert demuxer.feed(data[cluster:]) == [p for p in packets if p]
+
+
+def test_raw_opus_length_prefixed(webm):
+    _, packets = webm
+    payload = b"".join(struct.pack(">H", len(p)) + p for p in packets if p)
+    stream = AudioStream("audio/opus;rate=48000;channels=1")
+    decoded = stream.feed(payload[:1001]) + stream.feed(payload[1001:])
+    assert abs(decoded - 2 * SAMPLE_RATE) < SAMPLE_RATE // 10
+
+
+@pytest.mark.parametrize("mime_type,dtype", [("audio/pcm;rate=48000", "<i2"), ("audio/L16;rate=48000", ">i2")])
+def test_pcm16_is_resampled_to_16k(mime_type, dtype):
+    pcm = (_tone() * 32767).astype(dtype).tobytes()
+    stream = AudioStream(mime_type)
+    # An odd split leaves half a sample pending until the next chunk.
+    decoded = stream.feed(pcm[:12345]) + stream.feed(pcm[12345:])
+    assert abs(decoded - 2 * SAMPLE_RATE) <= 2
+    samples, _, _ = stream.peek_new()
+    assert abs(_dominant_hz(samples) - 440) < 5
+
+
+def test_ring_buffer_wraps_and_keeps_latest():
+    ring = PCMRingBuffer(seconds=1.0, sample_rate=10)
+    ring.append(np.arange(7, dtype=np.float32))
+    ring.append(np.arange(7, 14, dtype=np.float32))
+    assert ring.oldest == 4
+    assert ring.read(0).tolist() == list(range(4, 14))
+    assert ring.read(10, 12).tolist() == [10, 11]
+
+
+def test_unsupported_mime_type():
+    with pytest.raises(ValueError):
+        AudioStream("audio/mp4")
+
+
+class _BlockingModel:
+    """Fake Whisper model whose first transcription waits until released."""
+
+    def __init__(self):
+        self.samples = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def transcribe(self, audio, **kwargs):
+        self.samples.append(len(audio))
+        if len(self.samples) == 1:
+            self.started.set()
+            self.release.wait(5)
+        info = SimpleNamespace(language="en", language_probability=0.95, duration=len(audio) / SAMPLE_RATE)
+        return iter([SimpleNamespace(text=" hello", start=0.0, end=0.1)]), info
+
+
+def test_concurrent_chunks_of_a_session_transcribe_disjoint_audio(monkeypatch):
+    from app import asr, asr_service
+
+    model = _BlockingModel()
+    monkeypatch.setattr(asr_service, "get_model", lambda *args: model)
+    asr.clear_session_buffer("concurrent_user", 6)
+    audio = base64.b64encode(b"\x00\x00" * 1600).decode()  # 0.1s of PCM16
+    kwargs = dict(tab_id=6, mime_type="audio/pcm;rate=16000")
+    results = {}
+
+    def post(name, start):
+        results[name] = asr_service.transcribe_chunk(audio, "concurrent_user", start, **kwargs)
+
+    first = threading.Thread(target=post, args=("first", 0.0))
+    first.start()
+    assert model.started.wait(5)
+    second = threading.Thread(target=post, args=("second", 0.1))
+    second.start()
+    second.join(0.2)  # without the session lock it would peek the first chunk's audio too
+    model.release.set()
+    first.join(5)
+    second.join(5)
+
+    assert model.samples == [1600, 1600]
+    assert [s["start_seconds"] for s in results["first"].segments] == [0.0]
+    assert [s["start_seconds"] for s in results["second"].segments] == [pytest.approx(0.1)]
+    asr.clear_session_buffer("concurrent_user", 6)
@@ -0,0 +1,81 @@
+"""
+Tests for offline batch transcription (WebVTT, transcript store, resume).
+"""
+
+import os
+import wave
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("av")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import asr_service, batch_transcribe
+from app.database import Base, MediaCueDB
+
+
+class _FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, samples, **kwargs):
+        self.calls.append((len(samples), kwargs))
+        seconds = len(samples) / 16000
+        info = SimpleNamespace(language="en", language_probability=0.99, duration=seconds)
+        return iter([SimpleNamespace(text=f" window {len(self.calls)}", start=0.0, end=seconds)]), info
+
+
+def _write_wav(path, seconds, rate=22050):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(np.zeros(int(seconds * rate), dtype="<i2").tobytes())
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+
+
+def test_format_vtt():
+    vtt = batch_transcribe.format_vtt([{"text": "hello\n\nthere", "start_seconds": 61.5, "end_seconds": 3723.25}])
+    assert vtt == "WEBVTT\n\n00:01:01.500 --> 01:02:03.250\nhello there\n"
+
+
+def test_transcribes_in_windows_and_resumes(tmp_path, db, monkeypatch):
+    fake = _FakeModel()
+    monkeypatch.setattr(asr_service, "get_model", lambda *args: fake)
+    monkeypatch.setattr(batch_transcribe, "WINDOW_SECONDS", 2.0)
+    media = tmp_path / "media"
+    (media / "show").mkdir(parents=True)
+    _write_wav(media / "show" / "ep1.wav", 5.0)
+    _write_wav(media / "ep2.wav", 1.0)
+    out = tmp_path / "out"
+
+    progress = batch_transcribe.transcribe_directory(str(media), str(out), db)
+    assert (progress.files, progress.skipped, progress.failed) == (2, 0, 0)
+    assert progress.audio_seconds == pytest.approx(6.0, abs=0.01)
+
+    # ep2.wav sorts first; ep1 is decoded as 2s + 2s + 1s windows, and the
+    # pinned language and transcript tail carry across them.
+    assert [n for n, _ in fake.calls[1:]] == [32000, 32000, 16000]
+    assert fake.calls[1][1]["language"] is None
+    assert fake.calls[2][1]["language"] == "en" and fake.calls[2][1]["initial_prompt"] == "window 2"
+    vtt = (out / "show" / "ep1.wav.vtt").read_text()
+    assert vtt.startswith("WEBVTT") and "00:00:04.000 --> 00:00:05.000" in vtt
+    cues = db.query(MediaCueDB).filter(MediaCueDB.media_id == "show/ep1.wav").all()
+    assert len(cues) == 3 and {c.source for c in cues} == {"asr"}
+
+    calls = len(fake.calls)
+    again = batch_transcribe.transcribe_directory(str(media), str(out), db)
+    assert (again.files, again.skipped) == (0, 2)
+    assert len(fake.calls) == calls
@@ -0,0 +1,98 @@
+"""
+Tests for the per-session ASR jitter buffer.
+"""
+
+import base64
+from types import SimpleNamespace
+
+import pytest
+
+from app import asr, asr_service, audio_stream
+from app.asr_dedup import ChunkDeduplicator
+from app.asr_sessions import find_session
+from app.jitter_buffer import Gap, JitterBuffer
+
+
+def test_out_of_order_chunks_are_released_in_seq_order():
+    jitter = JitterBuffer(max_wait_seconds=0.5, max_pending=8)
+    assert jitter.push(0, "a", now=0.0) == [(0, "a")]
+    assert jitter.push(2, "c", now=0.1) == []
+    assert jitter.push(3, "d", now=0.1) == []
+    assert jitter.push(1, "b", now=0.2) == [(1, "b"), (2, "c"), (3, "d")]
+    stats = jitter.stats()
+    assert (stats["reordered"], stats["lost"], stats["max_depth"], stats["next_seq"]) == (1, 0, 3, 4)
+
+
+def test_gap_is_skipped_after_waiting_and_late_chunk_rejected():
+    jitter = JitterBuffer(max_wait_seconds=0.5, max_pending=8)
+    jitter.push(0, "a", now=0.0)
+    assert jitter.push(3, "d", now=0.1) == []
+    assert jitter.poll(now=0.3) == []
+    assert jitter.push(4, "e", now=0.7) == [Gap(1, 2), (3, "d"), (4, "e")]
+    assert jitter.push(1, "b", now=0.8) is None
+    stats = jitter.stats()
+    assert (stats["lost"], stats["gaps"], stats["late"]) == (2, 1, 1)
+
+
+def test_gap_is_skipped_when_too_many_chunks_are_held():
+    jitter = JitterBuffer(max_wait_seconds=60, max_pending=2)
+    jitter.push(0, "a", now=0.0)
+    jitter.push(2, "c", now=0.0)
+    jitter.push(3, "d", now=0.0)
+    assert jitter.push(4, "e", now=0.0) == [Gap(1, 1), (2, "c"), (3, "d"), (4, "e")]
+
+
+def test_restarted_numbering_starts_over():
+    jitter = JitterBuffer(max_wait_seconds=0.5, max_pending=4)
+    for seq in range(100, 103):
+        jitter.push(seq, seq, now=0.0)
+    assert jitter.push(0, "new", now=1.0) == [(0, "new")]
+    assert jitter.stats()["restarts"] == 1
+
+
+class _FakeModel:
+    def __init__(self):
+        self.samples = []
+
+    def transcribe(self, audio, **kwargs):
+        self.samples.append(len(audio))
+        info = SimpleNamespace(language="en", language_probability=0.95, duration=len(audio) / 16000)
+        return iter([SimpleNamespace(text=" hello", start=0.0, end=0.1)]), info
+
+
+def test_stream_path_holds_chunk_until_gap_fills(monkeypatch):
+    if not audio_stream.available():
+        pytest.skip("streaming decode needs numpy and PyAV")
+    model = _FakeModel()
+    monkeypatch.setattr(asr_service, "get_model", lambda *args: model)
+    monkeypatch.setattr(asr_service, "dedup", ChunkDeduplicator(window_seconds=0))
+    asr.clear_session_buffer("jitter_user", 5)
+    audio = base64.b64encode(b"\x00\x00" * 1600).decode()  # 0.1s of PCM16
+    kwargs = dict(tab_id=5, mime_type="audio/pcm;rate=16000")
+
+    assert asr_service.transcribe_chunk(audio, "jitter_user", 0.0, seq=0, **kwargs).status == "ok"
+    held = asr_service.transcribe_chunk(audio, "jitter_user", 0.2, seq=2, **kwargs)
+    assert held.status == "buffered"
+    filled = asr_service.transcribe_chunk(audio, "jitter_user", 0.1, seq=1, **kwargs)
+    assert filled.status == "ok"
+    # Chunks 1 and 2 are transcribed together, timed from chunk 1.
+    assert model.samples == [1600, 3200]
+    assert filled.segments[0]["start_seconds"] == pytest.approx(0.1)
+    assert find_session("jitter_user", 5).stats()["jitter"]["reordered"] == 1
+    asr.clear_session_buffer("jitter_user", 5)
+
+
+def test_shared_session_store_decodes_chunks_standalone(monkeypatch):
+    model = _FakeModel()
+    monkeypatch.setattr(asr_service, "get_model", lambda *args: model)
+    monkeypatch.setattr(asr_service, "dedup", ChunkDeduplicator(window_seconds=0))
+    # Another worker may hold seq 1: never wait for it here.
+    monkeypatch.setattr(asr_service, "STREAM_DECODE", False)
+    asr.clear_session_buffer("jitter_user", 6)
+    audio = base64.b64encode(b"\x00\x00" * 1600).decode()
+    kwargs = dict(tab_id=6, mime_type="audio/pcm;rate=16000")
+
+    assert asr_service.transcribe_chunk(audio, "jitter_user", 0.0, seq=0, **kwargs).status == "ok"
+    assert asr_service.transcribe_chunk(audio, "jitter_user", 0.2, seq=2, **kwargs).status == "ok"
+    assert find_session("jitter_user", 6).jitter is None
+    asr.clear_session_buffer("jitter_user", 6)
@@ -0,0 +1,119 @@
+"""
+Tests for the queued logging setup and the sampled per-chunk logger.
+"""
+
+import json
+import logging
+
+import pytest
+
+from app import logging_config
+from app.logging_config import SampledLogger, configure_logging, stop_logging
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def captured():
+    logger = logging.getLogger("test.sampled")
+    handler = _Capture()
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    yield logger, handler.records
+    logger.removeHandler(handler)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(logging_config.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_sampled_logger_limits_rate_and_reports_suppressed(captured, clock):
+    logger, records = captured
+    sampled = SampledLogger(logger, per_second=2)
+
+    for n in range(10):
+        sampled.info("chunk %d", n, extra={"seq": n})
+    assert [r.getMessage() for r in records] == ["chunk 0", "chunk 1"]
+    assert not hasattr(records[1], "suppressed")
+
+    clock[0] += 0.5  # refills one token
+    sampled.info("chunk %d", 10, extra={"seq": 10})
+    assert records[-1].getMessage() == "chunk 10"
+    assert records[-1].suppressed == 8
+    assert records[-1].seq == 10
+
+    clock[0] += 0.5
+    sampled.info("chunk %d", 11)
+    assert not hasattr(records[-1], "suppressed")
+
+
+def test_sampled_logger_skips_disabled_levels(captured, clock):
+    logger, records = captured
+    sampled = SampledLogger(logger, per_second=1)
+
+    for _ in range(5):
+        sampled.debug("hidden")
+    sampled.info("shown")
+    # Disabled records neither use tokens nor count as suppressed.
+    assert [r.getMessage() for r in records] == ["shown"]
+    assert not hasattr(records[0], "suppressed")
+
+
+@pytest.mark.parametrize("fmt", ["text", "json"])
+def test_records_survive_the_queue_hop(monkeypatch, capsys, fmt):
+    stop_logging()  # the app configured logging at import
+    monkeypatch.setenv("ISWEEP_LOG_FORMAT", fmt)
+    try:
+        configure_logging()
+        listener = logging_config._listener
+        assert listener is not None and listener._thread.is_alive()
+        configure_logging()  # idempotent
+        assert logging_config._listener is listener
+
+        logger = logging.getLogger("app.test_logging")
+        try:
+            raise ValueError("bad chunk")
+        except ValueError:
+            logger.exception("Decode %s failed", "chunk", extra={"tab_id": 7, "phase": "decode step"})
+
+        stop_logging()  # drains the queue before the thread exits
+        assert logging_config._listener is None
+        assert listener._thread is None
+    finally:
+        monkeypatch.delenv("ISWEEP_LOG_FORMAT")
+        configure_logging()
+
+    lines = capsys.readouterr().err.splitlines()
+    if fmt == "json":
+        payload = json.loads(lines[0])
+        assert payload["msg"] == "Decode chunk failed"
+        assert payload["logger"] == "app.test_logging"
+        assert payload["tab_id"] == 7 and payload["phase"] == "decode step"
+        assert "ValueError: bad chunk" in payload["exc"]
+    else:
+        assert 'msg="Decode chunk failed"' in lines[0]
+        assert 'tab_id=7 phase="decode step"' in lines[0]
+        assert lines[-1] == "ValueError: bad chunk"
+
+
+def test_stop_logging_detaches_the_queue_handler():
+    configure_logging()
+    handler = logging_config._queue_handler
+    assert handler in logging.getLogger("app").handlers
+    try:
+        stop_logging()
+        assert handler not in logging.getLogger("app").handlers
+        stop_logging()  # no-op when not running
+    finally:
+        configure_logging()
@@ -0,0 +1,65 @@
+"""
+Tests for memory accounting and the tracemalloc diagnostics endpoints.
+"""
+
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, memory
+from app.metrics import REGISTRY
+
+
+@pytest.fixture
+def reporters(monkeypatch):
+    """Only the reporters a test registers."""
+    monkeypatch.setattr(memory, "_reporters", {})
+    return memory._reporters
+
+
+def test_report_sums_reporters_and_isolates_failures(reporters):
+    memory.register_reporter("buffers", lambda: {"bytes": 1000, "entries": 2})
+    memory.register_reporter("models", lambda: {"bytes": 24, "entries": 1})
+
+    def broken():
+        raise RuntimeError("boom")
+
+    memory.register_reporter("broken", broken)
+    report = memory.report()
+
+    assert report["accounted_bytes"] == 1024
+    assert report["components"]["buffers"] == {"bytes": 1000, "entries": 2}
+    assert report["components"]["broken"] == {"bytes": 0, "error": True}
+    assert 'isweep_memory_bytes{component="buffers"} 1000' in REGISTRY.render()
+
+
+def test_registered_components_report_bytes():
+    # Importing the app registers the reporters of every stateful module.
+    components = memory.report()["components"]
+    assert {"asr_sessions.state", "asr_service.whisper_model", "matching.compiled_matchers"} <= set(components)
+    assert all(component["bytes"] >= 0 for component in components.values())
+
+
+def test_estimate_whisper_model_bytes():
+    assert memory.estimate_whisper_model_bytes("base", "int8") == 74_000_000
+    assert memory.estimate_whisper_model_bytes("small.en", "float16") == 488_000_000
+
+
+def test_tracemalloc_endpoints_need_admin_token_and_can_stop(monkeypatch):
+    client = TestClient(main.app)
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "")
+    assert client.post("/diagnostics/memory/tracemalloc/start").status_code == 403
+    assert not tracemalloc.is_tracing()
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+    headers = {"X-ISweep-Admin-Token": "s3cret"}
+    try:
+        assert client.post("/diagnostics/memory/tracemalloc/start", headers=headers).json() == {"tracing": True}
+        assert tracemalloc.is_tracing()
+        assert client.get("/diagnostics/memory/tracemalloc").status_code == 403
+        assert "top" in client.get("/diagnostics/memory/tracemalloc?limit=5", headers=headers).json()
+    finally:
+        assert client.post("/diagnostics/memory/tracemalloc/stop", headers=headers).json() == {"tracing": False}
+    assert not tracemalloc.is_tracing()
+    assert client.get("/diagnostics/memory/tracemalloc", headers=headers).status_code == 400
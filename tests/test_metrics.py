@@ -0,0 +1,53 @@
+"""
+Tests for the in-process metrics registry and its Prometheus exposition.
+"""
+
+from app.metrics import Registry
+
+
+def test_counter_exposition():
+    registry = Registry()
+    counter = registry.counter("isweep_test_total", "Things counted", ("kind",))
+    counter.inc(kind="a")
+    counter.inc(2, kind="a")
+    counter.inc(kind="b")
+
+    assert registry.counter("isweep_test_total", "Things counted", ("kind",)) is counter
+    assert counter.value(kind="a") == 3.0
+    assert registry.render().splitlines() == [
+        "# HELP isweep_test_total Things counted",
+        "# TYPE isweep_test_total counter",
+        'isweep_test_total{kind="a"} 3.0',
+        'isweep_test_total{kind="b"} 1.0',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("isweep_test_seconds", "Durations", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage="decode")
+
+    assert registry.render().splitlines()[2:] == [
+        'isweep_test_seconds_bucket{stage="decode",le="0.1"} 2.0',
+        'isweep_test_seconds_bucket{stage="decode",le="1.0"} 3.0',
+        'isweep_test_seconds_bucket{stage="decode",le="+Inf"} 4.0',
+        'isweep_test_seconds_sum{stage="decode"} 3.65',
+        'isweep_test_seconds_count{stage="decode"} 4.0',
+    ]
+
+
+def test_gauge_callback_is_read_at_scrape_time():
+    registry = Registry()
+    values = {"buffers": 10}
+    registry.gauge("isweep_test_bytes", "Bytes held", ("component",),
+                   callback=lambda: (((name,), v) for name, v in values.items()))
+    values["buffers"] = 20
+    assert 'isweep_test_bytes{component="buffers"} 20' in registry.render()
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    counter = registry.counter("isweep_test_total", "Things counted", ("path",))
+    counter.inc(path='C:\\tmp\\"a"\nb')
+    assert registry.render().splitlines()[-1] == 'isweep_test_total{path="C:\\\\tmp\\\\\\"a\\"\\nb"} 1.0'
@@ -0,0 +1,107 @@
+"""
+Tests for streaming NDJSON preference export/import.
+"""
+
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import rules
+from app.database import Base, PreferenceDB
+from app.models import Action, Preference
+from app.pref_transfer import PreferenceImporter, export_preferences, iter_lines
+
+
+def _session():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+@pytest.fixture
+def source():
+    db = _session()
+    for i in range(25):
+        rules.save_preference(db, Preference(
+            user_id=f"user{i}", category="language", enabled=True, action=Action.mute,
+            duration_seconds=2, blocked_words=[f"word{i}"], custom_words=["x"],
+        ))
+        rules.save_preference(db, Preference(
+            user_id=f"user{i}", category="violence", enabled=False, action=Action.skip, duration_seconds=10,
+        ))
+    yield db
+    db.close()
+
+
+def test_export_import_round_trip(source):
+    lines = list(export_preferences(source, batch_size=7))
+    assert len(lines) == 50
+    assert json.loads(lines[0])["user_id"] == "user0"
+
+    target = _session()
+    progress = PreferenceImporter(target, batch_size=8).feed_all(lines)
+    assert (progress.rows, progress.users, progress.errors) == (50, 25, 0)
+    assert progress.committed_lines == 50
+    assert rules.get_all_preferences(target, "user3") == rules.get_all_preferences(source, "user3")
+    target.close()
+
+
+def test_import_is_idempotent_and_resumable(source):
+    lines = list(export_preferences(source))
+    target = _session()
+
+    # A first run that stopped after 20 committed lines, then a resumed run.
+    first = PreferenceImporter(target, batch_size=10).feed_all(lines[:20])
+    assert first.committed_lines == 20
+    resumed = PreferenceImporter(target, batch_size=10, skip=first.committed_lines).feed_all(lines)
+    assert resumed.rows == 30 and resumed.skipped == 20
+
+    # Importing everything again changes nothing.
+    PreferenceImporter(target, batch_size=10).feed_all(lines)
+    assert target.query(PreferenceDB).count() == 50
+    target.close()
+
+
+def test_invalid_lines_are_reported_and_skipped(source):
+    target = _session()
+    lines = [b'{"user_id": "u1", "category": "language", "action": "mute"}', b"", b"not json", b'{"category": "x"}']
+    progress = PreferenceImporter(target).feed_all(lines)
+    assert progress.rows == 1 and progress.errors == 2
+    assert [e["line"] for e in progress.error_lines] == [3, 4]
+    target.close()
+
+
+def test_import_invalidates_cached_preferences(source):
+    assert rules.get_all_preferences(source, "user1")["language"].blocked_words == ["word1"]
+    line = json.dumps({"user_id": "user1", "category": "language", "action": "mute", "blocked_words": ["new"]})
+    PreferenceImporter(source).feed_all([line])
+    assert rules.get_all_preferences(source, "user1")["language"].blocked_words == ["new"]
+
+
+def test_iter_lines_splits_across_chunks():
+    assert list(iter_lines([b'{"a":1}\n{"b"', b':2}\n', b'{"c":3}'])) == [b'{"a":1}', b'{"b":2}', b'{"c":3}']
+
+
+@pytest.mark.parametrize("configured,sent,status", [("", None, 403), ("", "", 403), ("s3cret", "wrong", 403), ("s3cret", "s3cret", 200)])
+def test_admin_routes_need_a_configured_token(monkeypatch, configured, sent, status):
+    from fastapi.testclient import TestClient
+    from sqlalchemy.pool import StaticPool
+
+    from app import main
+    from app.database import get_db
+
+    # The request runs in another thread: share one in-memory connection.
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    rules.save_preference(db, Preference(user_id="u", category="language", action=Action.mute, duration_seconds=2))
+    monkeypatch.setattr(main, "ADMIN_TOKEN", configured)
+    monkeypatch.setitem(main.app.dependency_overrides, get_db, lambda: db)
+    headers = {} if sent is None else {"X-ISweep-Admin-Token": sent}
+    response = TestClient(main.app).get("/admin/preferences/export", headers=headers)
+    assert response.status_code == status
+    if status == 200:
+        assert [json.loads(line)["user_id"] for line in response.text.splitlines()] == ["u"]
+    db.close()
@@ -0,0 +1,54 @@
+"""
+Tests for on-demand per-request profiling.
+"""
+
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, profiling
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0.0)
+    return tmp_path
+
+
+def test_header_needs_a_configured_token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "")
+    assert not profiling.should_profile("anything")
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    assert not profiling.should_profile("wrong")
+    assert not profiling.should_profile(None)
+    assert profiling.should_profile("s3cret")
+
+
+def test_middleware_profiles_request_with_token(profile_dir, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    client = TestClient(main.app)
+
+    plain = client.get("/health", headers={"X-ISweep-Profile": "guess"})
+    assert "X-ISweep-Profile-Path" not in plain.headers
+    assert os.listdir(profile_dir) == []
+
+    response = client.get("/health", headers={"X-ISweep-Profile": "s3cret"})
+    assert response.status_code == 200
+    path = response.headers["X-ISweep-Profile-Path"]
+    assert os.path.dirname(path) == str(profile_dir)
+    assert path.endswith("-health.pstats") and os.path.getsize(path) > 0
+
+
+def test_old_profiles_are_pruned(profile_dir, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    monkeypatch.setattr(profiling, "PROFILE_MAX_FILES", 2)
+    for name in ("1000000000001-1-a.pstats", "1000000000002-1-b.collapsed", "1000000000003-1-c.pstats", "notes.txt"):
+        (profile_dir / name).write_text("x")
+
+    TestClient(main.app).get("/health", headers={"X-ISweep-Profile": "s3cret"})
+    remaining = sorted(os.listdir(profile_dir))
+    assert remaining[0] == "1000000000003-1-c.pstats" and remaining[1].endswith("-health.pstats")
+    assert remaining[2:] == ["notes.txt"]
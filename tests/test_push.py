@@ -0,0 +1,79 @@
+"""
+Tests for per-tab SSE decision channels.
+"""
+
+import asyncio
+import time
+
+from app.push import DecisionChannel, event_stream
+
+
+async def _collect(channel, last_event_id, count):
+    async def connected():
+        return False
+
+    chunks = []
+    stream = event_stream(channel, last_event_id, connected, heartbeat_seconds=0.05)
+    async for chunk in stream:
+        chunks.append(chunk)
+        if len(chunks) == count:
+            break
+    await stream.aclose()
+    return chunks
+
+
+def test_resume_replays_only_newer_events():
+    channel = DecisionChannel()
+    ids = [channel.publish("decision", {"n": n}) for n in range(3)]
+
+    chunks = asyncio.run(_collect(channel, last_event_id=ids[0], count=3))
+
+    assert chunks[0].startswith("retry:")
+    assert chunks[1] == f'id: {ids[1]}\nevent: decision\ndata: {{"n":1}}\n\n'
+    assert chunks[2] == f'id: {ids[2]}\nevent: decision\ndata: {{"n":2}}\n\n'
+
+
+def test_live_events_and_heartbeat():
+    channel = DecisionChannel()
+
+    async def scenario():
+        task = asyncio.create_task(_collect(channel, last_event_id=None, count=3))
+        await asyncio.sleep(0.08)  # long enough for one heartbeat
+        event_id = await asyncio.to_thread(channel.publish, "segments", {"seq": 7})
+        return event_id, await asyncio.wait_for(task, timeout=2)
+
+    event_id, chunks = asyncio.run(scenario())
+    assert chunks[1] == ": heartbeat\n\n"
+    assert chunks[2].startswith(f"id: {event_id}\nevent: segments\n")
+    assert channel.subscriber_count == 0
+
+
+def test_fresh_connection_starts_at_head():
+    channel = DecisionChannel()
+    channel.publish("decision", {"n": 0})
+    channel.publish("decision", {"n": 1})
+
+    async def scenario():
+        task = asyncio.create_task(_collect(channel, last_event_id=None, count=2))
+        await asyncio.sleep(0.01)
+        await asyncio.to_thread(channel.publish, "decision", {"n": 2})
+        return await asyncio.wait_for(task, timeout=2)
+
+    chunks = asyncio.run(scenario())
+    # No stale history: the first event is the one published after connecting.
+    assert chunks[1].endswith('data: {"n":2}\n\n')
+
+
+def test_recreated_channel_ids_continue_above_old_ones():
+    old = DecisionChannel()
+    last_seen = old.publish("decision", {"n": 0})
+    time.sleep(0.001)
+    new = DecisionChannel()  # e.g. after idle pruning or a restart
+    new_id = new.publish("decision", {"n": 1})
+    assert new_id > last_seen
+
+    chunks = asyncio.run(_collect(new, last_event_id=last_seen, count=2))
+    assert chunks[1] == f'id: {new_id}\nevent: decision\ndata: {{"n":1}}\n\n'
+
+    # An id the channel never issued (from the future) is treated as a fresh connection.
+    assert asyncio.run(_collect(new, last_event_id=new_id + 10**9, count=1)) == ["retry: 50\n\n"]
@@ -330,3 +330,244 @@ class TestDecisionEngine:
         decision2 = rules.decide(db_session, event2)
         assert decision2.action == Action.mute
         assert decision2.matched_term == "ass"
+
+
+class TestObfuscationTolerantMatching:
+    @pytest.fixture(autouse=True)
+    def _blocked_words(self, db_session):
+        pref = Preference(
+            user_id="user_obf",
+            category="language",
+            enabled=True,
+            action=Action.mute,
+            duration_seconds=5,
+            blocked_words=["fuck", "shit", "ass"],
+        )
+        rules.save_preference(db_session, pref)
+
+    @pytest.mark.parametrize("text", ["what the f*ck", "oh sh1t", "$hit happens", "SHIIIIT", "fück off", "f**k", "f***"])
+    def test_obfuscated_variants_match(self, db_session, text):
+        """Masked, leetspeak, repeated and accented variants are matched."""
+        decision = rules.decide(db_session, Event(user_id="user_obf", text=text))
+        assert decision.action == Action.mute, f"Failed for: {text}"
+
+    @pytest.mark.parametrize("text", ["as soon as", "a class assignment", "shitake", "hello!", "I got 3 cats"])
+    def test_normalization_does_not_create_false_positives(self, db_session, text):
+        """Repeat collapsing and leetspeak mapping keep word boundaries intact."""
+        decision = rules.decide(db_session, Event(user_id="user_obf", text=text))
+        assert decision.action == Action.none, f"False positive for: {text}"
+
+    @pytest.mark.parametrize("word,text", [("god", "that was good"), ("but", "butt"), ("dam", "damm"), ("fat", "faat")])
+    def test_doubled_letters_are_not_repeats(self, db_session, word, text):
+        """A doubled letter is spelling, not emphasis: "god" does not match "good"."""
+        rules.save_preference(db_session, Preference(
+            user_id="user_doubled", category="language", enabled=True, action=Action.mute,
+            duration_seconds=5, blocked_words=[word],
+        ))
+        decision = rules.decide(db_session, Event(user_id="user_doubled", text=text))
+        assert decision.action == Action.none, f"False positive for: {word} in {text}"
+        stretched = rules.decide(db_session, Event(user_id="user_doubled", text=word[0] + word[1] * 4 + word[2:]))
+        assert stretched.action == Action.mute
+
+    def test_normalized_offsets_map_back_to_original(self):
+        """Spans in normalized text map back to the original characters."""
+        from app.matching import normalize_text
+
+        normalized = normalize_text("Ünd sh1iiiit")
+        assert normalized.text == "und shiiit"
+        start = normalized.text.index("shiiit")
+        assert normalized.original_span(start, start + 6) == (4, 12)
+
+
+class TestAllMatchesScan:
+    def test_returns_every_match_with_spans(self, db_session):
+        """All blocked words in a text are reported in order, with character spans."""
+        rules.save_preference(db_session, Preference(
+            user_id="user_spans", category="language", enabled=True, action=Action.mute,
+            duration_seconds=1, blocked_words=["damn"],
+        ))
+        rules.save_preference(db_session, Preference(
+            user_id="user_spans", category="violence", enabled=True, action=Action.skip,
+            duration_seconds=10, blocked_words=["kill"], custom_words=["gun fight"],
+        ))
+
+        text = "Damn, kill the lights before the gun   fight"
+        [matches] = rules.find_all_blocked_word_matches(db_session, "user_spans", [text])
+
+        assert [(m.category, m.word) for m in matches] == [
+            ("language", "damn"), ("violence", "kill"), ("violence", "gun fight"),
+        ]
+        assert [text[m.start:m.end] for m in matches] == ["Damn", "kill", "gun   fight"]
+
+    def test_spans_are_original_offsets_for_normalized_text(self, db_session):
+        """Spans refer to the original text even when normalization changed its length."""
+        rules.save_preference(db_session, Preference(
+            user_id="user_spans2", category="language", enabled=True, action=Action.mute,
+            duration_seconds=1, blocked_words=["shit"],
+        ))
+        text = "Ünd then shiiiiit happened"
+        [matches] = rules.find_all_blocked_word_matches(db_session, "user_spans2", [text])
+        assert [text[m.start:m.end] for m in matches] == ["shiiiiit"]
+
+    def test_char_span_to_interval(self):
+        """Character spans map linearly onto the segment's time range."""
+        from app.matching import char_span_to_interval
+
+        assert char_span_to_interval(5, 10, 20, 10.0, 12.0) == (10.5, 11.0)
+        assert char_span_to_interval(0, 4, 0, 3.0, 4.0) == (3.0, 4.0)
+
+
+class TestPreferenceCacheCoherence:
+    def _blocking_event(self, user_id, text="well damn"):
+        return Event(user_id=user_id, text=text)
+
+    def test_local_save_invalidates_cache(self, db_session):
+        """A save in this worker is visible to the next decision immediately."""
+        assert rules.decide(db_session, self._blocking_event("cache_user")).action == Action.none
+
+        rules.save_preference(db_session, Preference(
+            user_id="cache_user", category="language", enabled=True, action=Action.mute,
+            duration_seconds=2, blocked_words=["damn"],
+        ))
+        assert rules.decide(db_session, self._blocking_event("cache_user")).action == Action.mute
+
+    def test_other_worker_sees_change_after_poll(self):
+        """A write through another worker's cache is picked up from the change feed."""
+        from sqlalchemy.pool import StaticPool
+        from app.pref_cache import PreferenceCache
+
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        writer, reader = Session(), Session()
+        worker_cache = PreferenceCache(poll_interval=3600)
+        load = lambda: rules.get_all_preferences(reader, "feed_user")["language"].blocked_words
+
+        worker_cache.poll(reader, force=True)
+        assert worker_cache.get(reader, "feed_user", load) == []
+
+        rules.save_preference(writer, Preference(
+            user_id="feed_user", category="language", enabled=True, action=Action.mute,
+            duration_seconds=2, blocked_words=["damn"],
+        ))
+        # Not due for a poll yet: still the cached value.
+        assert worker_cache.get(reader, "feed_user", load) == []
+        worker_cache.poll(reader, force=True)
+        assert worker_cache.get(reader, "feed_user", load) == ["damn"]
+        writer.close()
+        reader.close()
+
+
+class TestDecisionMemoization:
+    def _events(self):
+        return [
+            Event(user_id="memo_user", text="well DAMN it"),
+            Event(user_id="memo_user", text="well d@mn it"),
+            Event(user_id="memo_user", text="nothing here"),
+            Event(user_id="memo_user", content_type="violence", confidence=0.9),
+            Event(user_id="memo_user", content_type="violence", confidence=0.75),
+            Event(user_id="memo_user", content_type="violence", confidence=0.5),
+            Event(user_id="memo_user", content_type="violence"),
+        ]
+
+    def test_cached_decisions_match_uncached(self, db_session, monkeypatch):
+        from app.decision_cache import decision_cache_for
+
+        for category, words in (("language", ["damn"]), ("violence", [])):
+            rules.save_preference(db_session, Preference(
+                user_id="memo_user", category=category, enabled=True, action=Action.mute,
+                duration_seconds=3, blocked_words=words,
+            ))
+        memo = decision_cache_for(db_session)
+        first = [rules.decide(db_session, e).model_dump_json() for e in self._events()]
+        second = [rules.decide(db_session, e).model_dump_json() for e in self._events()]
+        assert memo.hits >= 4
+
+        monkeypatch.setattr(memo, "max_entries", 0)
+        uncached = [rules.decide(db_session, e).model_dump_json() for e in self._events()]
+        assert first == second == uncached
+        assert "confidence=0.75" in second[4]
+
+    def test_preference_write_invalidates_memoized_decisions(self, db_session):
+        from app.decision_cache import decision_cache_for
+
+        event = Event(user_id="memo_user2", text="well damn")
+        assert rules.decide(db_session, event).action == Action.none
+        assert len(decision_cache_for(db_session)) == 1
+
+        rules.save_preference(db_session, Preference(
+            user_id="memo_user2", category="language", enabled=True, action=Action.mute,
+            duration_seconds=2, blocked_words=["damn"],
+        ))
+        assert len(decision_cache_for(db_session)) == 0
+        assert rules.decide(db_session, event).action == Action.mute
+
+
+class TestMatcherInterning:
+    def test_same_wordlists_share_one_matcher(self, db_session):
+        for user_id, words in (("twin_a", ["damn", "hell"]), ("twin_b", ["hell", "damn", "damn"])):
+            rules.save_preference(db_session, Preference(
+                user_id=user_id, category="language", enabled=True, action=Action.mute,
+                duration_seconds=2, blocked_words=words,
+            ))
+        a = rules.resolve_preferences(db_session, "twin_a")
+        b = rules.resolve_preferences(db_session, "twin_b")
+        assert a.matcher is b.matcher
+
+    def test_refcounts_and_eviction(self):
+        from app.matching import MatcherRegistry
+
+        registry = MatcherRegistry(max_idle=1)
+        first = registry.acquire([("language", ["damn"])])
+        assert registry.acquire([("language", ["damn", ""])]) is first
+        other = registry.acquire([("violence", ["kill"])])
+        assert registry.stats() == {"unique": 2, "live": 2, "idle": 0, "users": 3}
+
+        registry.release(first)
+        registry.release(other)
+        assert registry.stats()["live"] == 1
+        registry.release(first)
+        # Both unreferenced now; only one idle matcher is kept.
+        assert registry.stats() == {"unique": 1, "live": 0, "idle": 1, "users": 0}
+        assert registry.acquire([("language", ["damn"])]) is first
+
+    def test_category_order_decides_shared_words(self):
+        from app.matching import MatcherRegistry, normalize_text
+
+        registry = MatcherRegistry()
+        first = registry.get([("language", ["damn", "heck"]), ("blasphemy", ["damn"])])
+        second = registry.get([("blasphemy", ["damn"]), ("language", ["heck", "damn"])])
+        assert first is not second
+        assert first.search(normalize_text("damn")).category == "language"
+        assert second.search(normalize_text("damn")).category == "blasphemy"
+        # Word order within a category does not matter.
+        assert registry.get([("language", ["heck", "damn", "damn"]), ("blasphemy", ["damn"])]) is first
+
+    def test_get_and_acquire_survive_eviction_in_between(self):
+        from app.matching import MatcherRegistry
+
+        registry = MatcherRegistry(max_idle=1)
+        idle = registry.get([("language", ["damn"])])
+        registry.get([("violence", ["kill"])])  # evicts the first idle matcher
+        acquired = registry.acquire([("language", ["damn"])])
+        assert acquired is not idle  # recompiled, and now held live
+        registry.get([("drugs", ["weed"])])
+        assert registry.stats() == {"unique": 2, "live": 1, "idle": 1, "users": 1}
+        assert registry.acquire([("language", ["damn"])]) is acquired
+        registry.release(acquired)
+        registry.release(acquired)
+        assert registry.stats() == {"unique": 1, "live": 0, "idle": 1, "users": 0}
+
+    def test_reference_released_with_cache_entry(self):
+        import gc
+        from app.matching import registry
+
+        prefs = {"language": rules.ResolvedPreference("language", True, Action.mute, 2, ("zounds",))}
+        resolved = rules.CachedPreferences("gc_user", 0, prefs)
+        matcher = resolved.matcher
+        assert registry.refcount(matcher) == 1
+        del resolved
+        gc.collect()
+        assert registry.refcount(matcher) == 0
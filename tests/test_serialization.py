@@ -0,0 +1,43 @@
+"""
+Tests for the fast serialization path: the plain-dict payloads must match
+what the Pydantic response models would produce.
+"""
+
+from app.asr_tiers import Tier
+from app.models import Action, ASRStreamResponse, Preference
+from app.serialization import FastJSONResponse, blocked_span_payload, preference_payload, segment_payload
+
+
+def test_preference_payload_matches_model_dump():
+    pref = Preference(
+        user_id="u1",
+        category="language",
+        action=Action.mute,
+        duration_seconds=4,
+        blocked_words=["a", "b"],
+        selected_packs={"strong_profanity": True},
+        custom_words=["c"],
+    )
+    assert preference_payload(pref) == pref.model_dump(mode="json")
+
+
+def test_segment_payload_validates_against_response_model():
+    span = blocked_span_payload("damn", "language", 3, 7, 10.2, 10.6)
+    payload = {
+        "segments": [segment_payload("oh damn", 10.0, 11.0, matches=[span]), segment_payload("ok", 11.0, 12.0)],
+        "tier": Tier("base", 1, "int8").as_dict(),
+        "status": "ok",
+        "language": "en",
+        "engine": "whisper",
+        "partial": None,
+    }
+
+    model = ASRStreamResponse.model_validate(payload)
+    assert model.model_dump(mode="json") == payload
+    assert model.segments[0].is_blocked and model.segments[0].blocked_word == "damn"
+    assert not model.segments[1].is_blocked
+
+
+def test_fast_json_response_renders_json():
+    response = FastJSONResponse({"segments": [], "n": 1.5})
+    assert response.body.replace(b" ", b"") == b'{"segments":[],"n":1.5}'
@@ -0,0 +1,83 @@
+"""
+Tests for the ASR session stores.
+"""
+
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from app.session_store import FileSessionStore, InProcessSessionStore
+
+KEY = ("user1", 7)
+
+
+def _add_chunks(root, seqs):
+    store = FileSessionStore(root, max_chunks=100)
+    for seq in seqs:
+        store.add_chunk(KEY, seq, bytes([seq]))
+
+
+@pytest.mark.parametrize("make_store", [InProcessSessionStore, FileSessionStore], ids=["memory", "file"])
+def test_snapshot_is_ordered_and_discard_is_selective(tmp_path, make_store):
+    store = make_store() if make_store is InProcessSessionStore else make_store(str(tmp_path))
+    for seq in (3, 1, 2):
+        store.add_chunk(KEY, seq, bytes([seq]))
+
+    assert store.snapshot(KEY) == [(1, b"\x01"), (2, b"\x02"), (3, b"\x03")]
+
+    store.add_chunk(KEY, 4, b"\x04")  # arrives while ASR runs on 1-3
+    store.discard(KEY, [1, 2, 3])
+    assert store.snapshot(KEY) == [(4, b"\x04")]
+
+    store.clear(KEY)
+    assert store.snapshot(KEY) == []
+
+
+def test_audio_buffer_orders_and_prunes_by_seq():
+    store = InProcessSessionStore(max_chunks=3)
+    for seq in (2, 0, 3, 1):
+        store.add_chunk(KEY, seq, bytes([seq]))
+    store.add_chunk(KEY, 3, b"resent")
+    assert store.snapshot(KEY) == [(1, b"\x01"), (2, b"\x02"), (3, b"resent")]
+
+
+def test_file_store_prunes_lowest_seq(tmp_path):
+    store = FileSessionStore(str(tmp_path), max_chunks=2)
+    counts = [store.add_chunk(KEY, seq, b"x") for seq in (1, 2, 3)]
+    assert counts == [1, 2, 2]
+    assert [seq for seq, _ in store.snapshot(KEY)] == [2, 3]
+
+
+def test_file_store_is_shared_across_processes(tmp_path):
+    root = str(tmp_path)
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_add_chunks, args=(root, range(start, 40, 4))) for start in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(timeout=30)
+        assert w.exitcode == 0
+
+    chunks = FileSessionStore(root, max_chunks=100).snapshot(KEY)
+    assert [seq for seq, _ in chunks] == list(range(40))
+    assert all(data == bytes([seq]) for seq, data in chunks)
+
+
+def test_file_store_expires_idle_session_dirs(tmp_path):
+    store = FileSessionStore(str(tmp_path), idle_seconds=60)
+    store.add_chunk(KEY, 1, b"\x01")
+    store.add_chunk(("user2", 1), 1, b"\x02")
+    old = time.time() - 120
+    idle_dir = store._session_dir(KEY)
+    os.utime(idle_dir, (old, old))
+
+    assert store.expire() == 1
+    assert not os.path.exists(idle_dir)
+    assert store.snapshot(("user2", 1)) == [(1, b"\x02")]
+
+    # The expired session starts over empty and works as before.
+    assert store.snapshot(KEY) == []
+    assert store.add_chunk(KEY, 2, b"\x03") == 1
+    assert store.memory_report()["entries"] == 2
@@ -0,0 +1,73 @@
+"""
+Tests for per-request stage timings and the Server-Timing header.
+"""
+
+import re
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import main, rules, timing
+from app.database import Base, get_db
+from app.models import Action, Preference
+from app.timing import STAGE_SECONDS, RequestTimer, span
+
+# "name;dur=1.234" entries, comma separated.
+_ENTRY = re.compile(r"^([a-z_]+);dur=(\d+(?:\.\d+)?)$")
+
+
+def _stages(header: str) -> dict[str, float]:
+    stages = {}
+    for entry in header.split(", "):
+        match = _ENTRY.match(entry)
+        assert match, entry
+        stages[match.group(1)] = float(match.group(2))
+    return stages
+
+
+def test_span_accumulates_on_the_active_timer_only():
+    with span("match"):
+        pass  # no request: no-op
+
+    timer = RequestTimer("test_route")
+    token = timing.activate(timer)
+    try:
+        assert timing.current() is timer
+        with span("match"):
+            pass
+        timer.add("match", 0.5)
+        timer.add("prefs", 0.002)
+    finally:
+        timing.deactivate(token)
+    assert timing.current() is None
+
+    assert 0.5 <= timer.stages["match"] < 0.6
+    timer.finish()
+    stages = _stages(timer.server_timing_header())
+    assert list(stages) == ["match", "prefs", "total"]
+    assert stages["prefs"] == 2.0
+    assert 'isweep_request_stage_seconds_count{route="test_route",stage="total"} 1.0' in STAGE_SECONDS.render()
+
+
+def test_event_response_carries_server_timing(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    rules.save_preference(db, Preference(
+        user_id="u", category="language", action=Action.mute, duration_seconds=2, blocked_words=["darn"],
+    ))
+    monkeypatch.setitem(main.app.dependency_overrides, get_db, lambda: db)
+    client = TestClient(main.app)
+
+    response = client.post("/event", json={"user_id": "u", "text": "well darn it"})
+    assert response.status_code == 200
+    assert response.json()["action"] == "mute"
+    stages = _stages(response.headers["Server-Timing"])
+    assert {"parse", "prefs", "match", "total"} <= set(stages)
+    assert stages["total"] >= stages["parse"]
+
+    # Only the hot routes are timed.
+    assert "Server-Timing" not in client.get("/health").headers
+    db.close()
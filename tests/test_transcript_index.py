@@ -0,0 +1,64 @@
+"""
+Tests for the per-media inverted token index.
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import rules, transcript_index
+from app.database import Base
+from app.matching import normalize_text
+from app.models import Action, MediaCue, Preference
+
+CUES = [
+    "Good morning everyone.",
+    "Well DAAAMN that was close.",
+    "Oh my god almighty.",
+    "What the f*ck.",
+    "Nothing to see here.",
+    "God, almighty, again.",
+    "The scatter plot.",
+    "sh1t happens",
+]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    rules.save_preference(session, Preference(
+        user_id="viewer", category="language", enabled=True, action=Action.mute, duration_seconds=1,
+        blocked_words=["damn", "god almighty", "fuck", "shit", "cat"],
+    ))
+    transcript_index.store_transcript(
+        session, "movie-1", [MediaCue(text=t, start_seconds=2.0 * i, end_seconds=2.0 * i + 2) for i, t in enumerate(CUES)]
+    )
+    yield session
+    session.close()
+
+
+def test_index_scan_matches_full_scan(db):
+    segments = transcript_index.scan_media(db, "movie-1", "viewer")
+
+    matcher = rules.resolve_preferences(db, "viewer").matcher
+    expected = [t for t in CUES if matcher.find_all(normalize_text(t))]
+    assert [s["text"] for s in segments] == expected
+    assert [s["blocked_word"] for s in segments] == ["damn", "god almighty", "fuck", "shit"]
+    assert segments[0]["start_seconds"] == 2.0
+    assert segments[0]["matches"][0]["start_seconds"] >= 2.0
+
+
+def test_candidates_come_from_index(db):
+    matcher = rules.resolve_preferences(db, "viewer").matcher
+    candidates = transcript_index.candidate_cues(db, "movie-1", matcher)
+    # "cat" is not a token of "scatter"; "Good morning" has no blocked token.
+    assert 0 not in candidates and 4 not in candidates and 6 not in candidates
+    assert {1, 2, 3, 5, 7} <= candidates
+
+
+def test_store_replaces_transcript(db):
+    transcript_index.store_transcript(db, "movie-1", [{"text": "clean", "start_seconds": 0, "end_seconds": 1}])
+    assert transcript_index.scan_media(db, "movie-1", "viewer") == []
+    assert not transcript_index.has_transcript(db, "movie-2")